@@ -1,33 +1,164 @@
-import geopandas as gpd
+import os
+import hashlib
 import pandas as pd
 import numpy as np
-import rasterio
-from rasterstats import zonal_stats
+import shapely
+from scipy import sparse
+from geometry_store import read_geometries
 
+# cached zone x pixel weight matrices (one per zone set and raster grid)
+ZONE_WEIGHTS_DIR = "Data/NYC_weather/zone_weights"
 
-# read shapefile
-taxi_zones = gpd.read_file('Data/NYC_Taxi_Zones/geo_export_1c7083fc-0597-4b3a-990a-eafab7fcd68a.shp')
-# read tif file with satelitte image temperature deviations from NYC Data Team
-tif_path = 'Data/NYC_weather/f_deviation_smooth.tif'  
-temperature_deviation = rasterio.open(tif_path)
 
-stats = zonal_stats(taxi_zones, tif_path, stats='mean')
-df_stats = pd.DataFrame(stats)
+#### FUNCTIONS
 
-# merge with taxi zones 
 
-taxi_zones_with_deviation = taxi_zones.join(df_stats)
-taxi_zones_with_deviation.sort_values(by='mean', ascending=False).head(10)
-taxi_zones_with_deviation.rename(columns={'mean': 'temperature_deviation_summer'}, inplace=True)
+def zone_pixel_weights(taxi_zones, transform, shape):
+    """
+    Rasterizes the taxi zones once into a sparse zone x pixel matrix: a pixel belongs to a zone if its
+    centre lies inside the zone polygon (the rasterization rule of rasterstats.zonal_stats).
 
-# get socioeconomic data 
+    Only the pixels in the bounding window of each zone are tested.
 
-taxi_socio = pd.read_csv("Data/ACS_data/taxi_zones_ACS_parks_beaches.csv")
+    Parameters:
+    taxi_zones (geopandas.GeoDataFrame): zone polygons in the CRS of the raster
+    transform (Affine or tuple): north-up affine transform of the raster grid (a, b, c, d, e, f)
+    shape (tuple): raster height and width
 
-# merge with deviation column on LocationID and location_i 
-taxi_socio_deviation = taxi_socio.merge(taxi_zones_with_deviation[["location_i" , "temperature_deviation_summer"]], left_on='LocationID', right_on='location_i')
-taxi_socio_deviation.drop(columns=['LocationID'], inplace=True)
+    Returns:
+    scipy.sparse.csc_matrix: zones x (height * width) membership weights (row-major pixel order)
+    """
+    a, _, c, _, e, f = tuple(transform)[:6]
+    height, width = shape
 
-# save as csv in ACS_data folder
+    rows, cols = [], []
+    for i, geom in enumerate(taxi_zones.geometry.array):
+        if geom is None or geom.is_empty:
+            continue
 
-taxi_socio_deviation.to_csv("Data/ACS_data/taxi_zones_ACS_parks_beaches_deviation.csv", index=False)
\ No newline at end of file
+        # 1. Pixel window of the zone bounds (e < 0 for north-up rasters)
+        minx, miny, maxx, maxy = geom.bounds
+        col_0, col_1 = max(int(np.floor((minx - c) / a)), 0), min(int(np.ceil((maxx - c) / a)), width)
+        row_0, row_1 = max(int(np.floor((maxy - f) / e)), 0), min(int(np.ceil((miny - f) / e)), height)
+        if col_0 >= col_1 or row_0 >= row_1:
+            continue
+
+        # 2. Pixel centres inside the polygon
+        window_rows, window_cols = np.mgrid[row_0:row_1, col_0:col_1]
+        inside = shapely.contains_xy(geom, c + (window_cols + 0.5) * a, f + (window_rows + 0.5) * e)
+
+        pixels = window_rows[inside] * width + window_cols[inside]
+        rows.append(np.full(len(pixels), i))
+        cols.append(pixels)
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=int)
+
+    return sparse.csc_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(taxi_zones), height * width))
+
+
+def cached_zone_pixel_weights(taxi_zones, transform, shape, cache_dir = ZONE_WEIGHTS_DIR):
+    """
+    zone_pixel_weights stored by a fingerprint of the zone geometries and the raster grid, so that all
+    rasters on the same grid (other summers, land-surface temperature products) reuse one matrix.
+
+    Returns:
+    scipy.sparse.csc_matrix: zones x pixels membership weights
+    """
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(np.asarray(taxi_zones.geometry.array)):
+        digest.update(wkb or b"")
+    digest.update(np.asarray(tuple(transform)[:6], dtype=float).tobytes() + np.asarray(shape, dtype=np.int64).tobytes())
+
+    path = os.path.join(cache_dir, f"zone_pixels_{digest.hexdigest()[:16]}.npz")
+    if os.path.exists(path):
+        return sparse.load_npz(path).tocsc()
+
+    weights = zone_pixel_weights(taxi_zones, transform, shape)
+    os.makedirs(cache_dir, exist_ok=True)
+    sparse.save_npz(path, weights)
+
+    return weights
+
+
+def zonal_sums(weights, values, nodata = None, first_pixel = 0):
+    """
+    Helper function returning the sum and count of valid pixels per zone for a block of
+    consecutive raster rows (flattened, starting at pixel first_pixel).
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    valid = np.isfinite(values) if nodata is None else np.isfinite(values) & (values != nodata)
+
+    block = weights[:, first_pixel:first_pixel + len(values)]
+
+    return block @ np.where(valid, values, 0.0), block @ valid.astype(float)
+
+
+def zonal_means(weights, raster_path, band = 1, rows_per_window = 1024):
+    """
+    Mean of a raster band per zone as sparse matrix-vector products, reading the raster in windows of rows.
+
+    Parameters:
+    weights (scipy.sparse.csc_matrix): zone x pixel weights of the raster grid (cached_zone_pixel_weights)
+    raster_path (str): raster file on the grid of the weights
+    band (int): band to average
+    rows_per_window (int): raster rows per read
+
+    Returns:
+    numpy.ndarray: mean per zone (NaN for zones without valid pixels)
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    sums, counts = np.zeros(weights.shape[0]), np.zeros(weights.shape[0])
+    with rasterio.open(raster_path) as raster:
+        for row_0 in range(0, raster.height, rows_per_window):
+            window = Window(0, row_0, raster.width, min(rows_per_window, raster.height - row_0))
+            block_sums, block_counts = zonal_sums(weights, raster.read(band, window=window), raster.nodata, row_0 * raster.width)
+            sums += block_sums
+            counts += block_counts
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def raster_zone_means(taxi_zones, raster_path, band = 1, cache_dir = ZONE_WEIGHTS_DIR):
+    """
+    Mean of a raster band per taxi zone with the cached zone x pixel weights of its grid.
+
+    Returns:
+    numpy.ndarray: mean per zone in the order of taxi_zones
+    """
+    import rasterio
+
+    with rasterio.open(raster_path) as raster:
+        transform, shape = raster.transform, (raster.height, raster.width)
+
+    weights = cached_zone_pixel_weights(taxi_zones, transform, shape, cache_dir)
+
+    return zonal_means(weights, raster_path, band)
+
+
+#### RUN
+
+if __name__ == "__main__":
+    # read shapefile
+    taxi_zones = read_geometries('Data/NYC_Taxi_Zones/geo_export_1c7083fc-0597-4b3a-990a-eafab7fcd68a.shp')
+    # read tif file with satelitte image temperature deviations from NYC Data Team
+    tif_path = 'Data/NYC_weather/f_deviation_smooth.tif'
+
+    # merge with taxi zones
+    taxi_zones_with_deviation = taxi_zones.copy()
+    taxi_zones_with_deviation['temperature_deviation_summer'] = raster_zone_means(taxi_zones, tif_path)
+
+    # get socioeconomic data
+
+    taxi_socio = pd.read_csv("Data/ACS_data/taxi_zones_ACS_parks_beaches.csv")
+
+    # merge with deviation column on LocationID and location_i
+    taxi_socio_deviation = taxi_socio.merge(taxi_zones_with_deviation[["location_i" , "temperature_deviation_summer"]], left_on='LocationID', right_on='location_i')
+    taxi_socio_deviation.drop(columns=['LocationID'], inplace=True)
+
+    # save as csv in ACS_data folder
+
+    taxi_socio_deviation.to_csv("Data/ACS_data/taxi_zones_ACS_parks_beaches_deviation.csv", index=False)
\ No newline at end of file
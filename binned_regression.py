@@ -7,11 +7,105 @@ from linearmodels.panel import PanelOLS
 from matplotlib.gridspec import GridSpec
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
+from gridded_temperature import zone_temperature_lookup
+from fe_estimation import (combine_codes, panel_cluster_codes, clustered_binned_regression, binned_design, fit_absorbed_ols,
+                           cluster_codes, cluster_covariance, coefficient_frame, rescaled_subsample_covariance, REFERENCE_BIN)
 
 
 
 
-def binned_regression_data(level, temp_bin_size, subset = False, income_split = None , workday_split = "None" , exclude_minimum_bin = False , daytime = "all" , hotel_control = False , exclude_zeros = False , temp_split = None):
+# Compact schema of the regression panel: explicit dtypes for known columns, merge keys that are dropped
+PANEL_SCHEMA = {
+    "trip_number": "float32",
+    "zero_trips": "int8",
+    "Month_fact": "int8",
+    "Weekday_index": "int8",
+    "holiday": "int8",
+    "weekday": "int8",
+    "month_year": "int32",
+    "borough_day": "int32",
+    "borough_month_year": "int16",
+    "Borough": "category",
+    "temp_bins": "category",
+    # kept in double precision so values on bin edges are binned identically downstream
+    "tmax_obs": "float64",
+}
+REDUNDANT_MERGE_COLUMNS = ["LocationID", "LocationID_x", "LocationID_y", "location_i", "DATE", "Year_Month"]
+
+
+def compact_panel(panel_data):
+    """
+    Enforces the compact schema of the regression panel.
+
+    Drops duplicated merge keys, casts the columns in PANEL_SCHEMA and converts all other
+    columns: float64 to float32, integers to the smallest integer type and strings to categoricals.
+
+    panel_data (DataFrame): panel data with location and year as index
+
+    Returns:
+    DataFrame: panel data with compact dtypes
+    """
+    panel_data = panel_data.drop(columns=[c for c in REDUNDANT_MERGE_COLUMNS if c in panel_data.columns])
+
+    for column in panel_data.columns:
+        values = panel_data[column]
+        dtype = PANEL_SCHEMA.get(column)
+
+        if dtype is not None:
+            # integer columns with missing values fall back to float32, string labels to categoricals
+            if dtype.startswith("int") and not pd.api.types.is_numeric_dtype(values):
+                dtype = "category"
+            elif dtype.startswith("int") and values.isna().any():
+                dtype = "float32"
+            panel_data[column] = values.astype(dtype)
+        elif pd.api.types.is_float_dtype(values):
+            panel_data[column] = values.astype("float32")
+        elif pd.api.types.is_integer_dtype(values):
+            panel_data[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_bool_dtype(values):
+            panel_data[column] = values.astype("category")
+
+    return panel_data
+
+
+def zone_groups(covariates, split):
+    """
+    Assigns taxi zones to the groups of the sample splits.
+
+    covariates (DataFrame): taxi zone covariates (taxi_zones_ACS_parks_beaches_deviation.csv)
+
+    split (str): "income_median" (upper / lower), "income_quartile" (lower_25 / upper_25 / upper_50 / upper_75)
+                 or "temp_quartile" (q1 - q4 of temperature_deviation_summer)
+
+    Returns:
+    Series: group label indexed by LocationID (zones without information are NaN)
+    """
+    groups = pd.Series(np.nan, index=covariates['LocationID'], dtype=object, name=split)
+    medincome = covariates['medincome'].to_numpy()
+
+    if split == "income_median":
+            median_income = covariates['medincome'].median()
+            groups[medincome > median_income] = "upper"
+            groups[medincome <= median_income] = "lower"
+
+    elif split == "income_quartile":
+            income_25, income_50, income_75 = covariates['medincome'].quantile([0.25, 0.5, 0.75])
+            groups[medincome > income_75] = "upper_75"
+            groups[(medincome > income_50) & (medincome <= income_75)] = "upper_50"
+            groups[(medincome > income_25) & (medincome <= income_50)] = "upper_25"
+            groups[medincome <= income_25] = "lower_25"
+
+    elif split == "temp_quartile":
+            quartiles = pd.qcut(covariates['temperature_deviation_summer'], 4, labels=["q1", "q2", "q3", "q4"])
+            groups[:] = quartiles.astype(object).to_numpy()
+
+    else:
+            raise ValueError(f"Unknown split: {split}")
+
+    return groups
+
+
+def binned_regression_data(level, temp_bin_size, subset = False, income_split = None , workday_split = "None" , exclude_minimum_bin = False , daytime = "all" , hotel_control = False , exclude_zeros = False , temp_split = None, zone_temperature = None):
     """
 
     Prepares data for binned regression analysis with several additional options
@@ -28,12 +122,15 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
 
     workday_split(str): "workday" or "weekend" - only for workday split . "None" if no split
 
-    exclude_minimum_bin(bool): True if temperature bins with less than 1% of total days should be excluded
+    exclude_minimum_bin(bool): True if temperature bins with less than 1% of total days (zone-days with zone_temperature) should be excluded
 
     dropunknown(bool): True if rows with PULocationID == 264 or DOLocationID == 265 (unknown taxi zones)
 
     daytime(str): "day" or "" - If "day" only trips between 8am and 8 pm are used in the analysis.
 
+    zone_temperature(str): path of the zone-day temperature array (gridded_temperature.ingest_gridded_temperature).
+                           If given, tmax_obs is the zone-day max instead of the city-wide reading (kept as tmax_obs_city).
+
     """
 
     ## 1. DATA PREPARATION
@@ -72,6 +169,13 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
     taxi_data_cut = pd.merge(taxi_data_cut, covariates, left_on=f'{level}LocationID', right_on='LocationID', how='left')
 
     
+    # 1.2.1 Option: zone-level gridded temperature exposure in place of the city-wide reading
+    if zone_temperature is not None:
+            taxi_data_cut['tmax_obs_city'] = taxi_data_cut['tmax_obs']
+            taxi_data_cut['tmax_obs'] = zone_temperature_lookup(taxi_data_cut['date_pickup'], taxi_data_cut[f'{level}LocationID'], zone_temperature)
+            # zone-days outside the grid coverage are dropped
+            taxi_data_cut = taxi_data_cut[taxi_data_cut['tmax_obs'].notna()]
+
     # 1.3 If option: Only include daytime trips: 8am to 8pm
 
     if daytime == "day":
@@ -101,7 +205,9 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
     # 1.7.1 Option: Exclude bins with less than 1% of total days
 
     if exclude_minimum_bin == True:
-            unique_days = taxi_data_cut[['date_pickup', 'temp_bins']].drop_duplicates()
+            # zone-specific temperature: bins are counted over zone-days instead of days
+            day_keys = ['date_pickup', 'temp_bins'] if zone_temperature is None else ['date_pickup', f'{level}LocationID', 'temp_bins']
+            unique_days = taxi_data_cut[day_keys].drop_duplicates()
 
             sum_days = unique_days['temp_bins'].value_counts().sum()
 
@@ -124,45 +230,12 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
 
     # 1.8 Option: Sample splits
 
-    # 1.8.1 Median Income
-    median_income = covariates['medincome'].median()
-
-    # get all location IDs where medincome is above median and all where medincome is below median
-    medincome_above = covariates[covariates['medincome'] > median_income]
-    medincome_below = covariates[covariates['medincome'] <= median_income]
-
-    # only keep the list of location IDs
-    medincome_above_IDs= medincome_above['LocationID'].tolist()
-    medincome_below_IDs= medincome_below['LocationID'].tolist()
-
-    income_75 = covariates['medincome'].quantile(0.75)
-    income_50 = covariates['medincome'].quantile(0.5)
-    income_25 = covariates['medincome'].quantile(0.25)
-
-    # get all location IDs where medincome is above median and all where medincome is below median
-    above_75 = covariates[covariates['medincome'] > income_75]
-    above_50 = covariates[(covariates['medincome'] > income_50) & (covariates['medincome'] <= income_75)]
-    above_25 = covariates[(covariates['medincome'] > income_25) & (covariates['medincome'] <= income_50)]
-    below_25 = covariates[covariates['medincome'] <= income_25]
-
-    above_75_IDs = above_75['LocationID'].tolist()
-    below_25_IDs = below_25['LocationID'].tolist()
-    above_25_IDs = above_25['LocationID'].tolist()
-    above_50_IDs = above_50['LocationID'].tolist()
-
-    # MEDIAN SPLITS
-    if income_split == "upper":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(medincome_above_IDs)]
-    elif income_split == "lower":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(medincome_below_IDs)]
-    elif income_split == "upper_75":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(above_75_IDs)]
-    elif income_split == "lower_25":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(below_25_IDs)]
-    elif income_split == "upper_25":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(above_25_IDs)]
-    elif income_split == "upper_50":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(above_50_IDs)]
+    # 1.8.1 Median Income and income quartiles
+    income_groups = pd.concat([zone_groups(covariates, "income_median"), zone_groups(covariates, "income_quartile")], axis=1)
+
+    if income_split in ["upper", "lower", "upper_75", "upper_50", "upper_25", "lower_25"]:
+            income_IDs = income_groups.index[(income_groups == income_split).any(axis=1)].tolist()
+            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(income_IDs)]
     
     # 1.8.2 WORKDAY SPLIT 
 
@@ -178,37 +251,12 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
 
 
 
-    # 1.8.3 TEMP SPLIT 
-
-        # do a median ssplit for medincome 
-    temp_median = covariates['temperature_deviation_summer'].median()
-
-    quartiles = pd.qcut(covariates['temperature_deviation_summer'], 4, labels=False)
-
-    # Add quartile information as a new column in the covariates DataFrame
-    covariates['temp_quartile'] = quartiles
-
-    # Split the data based on quartiles
-    temp_q1 = covariates[covariates['temp_quartile'] == 0]  # First quartile
-    temp_q2 = covariates[covariates['temp_quartile'] == 1]  # Second quartile
-    temp_q3 = covariates[covariates['temp_quartile'] == 2]  # Third quartile
-    temp_q4 = covariates[covariates['temp_quartile'] == 3]  # Fourth quartile
-
-    # Only keep the list of location IDs for each quartile
-    temp_q1_IDs = temp_q1['LocationID'].tolist()
-    temp_q2_IDs = temp_q2['LocationID'].tolist()
-    temp_q3_IDs = temp_q3['LocationID'].tolist()
-    temp_q4_IDs = temp_q4['LocationID'].tolist()
+    # 1.8.3 TEMP SPLIT (quartiles of summertime temperature deviation)
+    temp_groups = zone_groups(covariates, "temp_quartile")
 
-    # Filter taxi data based on quartiles
-    if temp_split == "q1":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(temp_q1_IDs)]
-    elif temp_split == "q2":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(temp_q2_IDs)]
-    elif temp_split == "q3":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(temp_q3_IDs)]
-    elif temp_split == "q4":
-            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(temp_q4_IDs)]
+    if temp_split in ["q1", "q2", "q3", "q4"]:
+            temp_IDs = temp_groups.index[temp_groups == temp_split].tolist()
+            taxi_data_cut = taxi_data_cut[taxi_data_cut[f'{level}LocationID'].isin(temp_IDs)]
 
 
     # 1.9 Create a panel data structure for linearmodels.PanelOLS
@@ -216,20 +264,48 @@ def binned_regression_data(level, temp_bin_size, subset = False, income_split =
     panel_data = panel_data[panel_data['temp_bins'] != 'nan']
 
 
-    # 1.10 create borough by month cluster for error clustering
+    # 1.10 create borough by month cluster for error clustering (integer codes)
     
     panel_data["date_pickup"] = pd.to_datetime(panel_data["date_pickup"])
-    panel_data['borough_day'] = panel_data['Borough'] + '_' + panel_data['date_pickup'].astype(str)
+    borough_codes = pd.factorize(panel_data['Borough'], sort=True)[0]
+    day_codes = (panel_data['date_pickup'] - panel_data['date_pickup'].min()).dt.days.to_numpy()
+    panel_data['borough_day'] = combine_codes(borough_codes, day_codes)
 
-    # Extract the month and year from 'date_pickup'
-    panel_data['month_year'] = panel_data['date_pickup'].dt.strftime('%B-%Y')
+    # Month and year from 'date_pickup' as running month number
+    panel_data['month_year'] = panel_data['date_pickup'].dt.year * 12 + panel_data['date_pickup'].dt.month - 1
 
     # Create the 'borough_month_year' variable by combining 'Borough' and 'month_year'
-    panel_data['borough_month_year'] = panel_data['Borough'] + '_' + panel_data['month_year']
+    panel_data['borough_month_year'] = combine_codes(borough_codes, panel_data['month_year'].to_numpy())
+
+    # 1.11 Enforce compact schema (int codes, categoricals, float32) and drop merge keys
+    panel_data = compact_panel(panel_data)
 
     return panel_data
 
-def binned_regression(panel_data, level, workday_split, exclude_zeros = False):
+def binned_regression_inputs(level, subset = False, zone_temperature = None):
+    """
+    Input files read by binned_regression_data (e.g. to fingerprint a specification without building the panel).
+
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+
+    subset (str): "Yellow_Green" ,"all", "FHV" - only for subset analysis
+
+    zone_temperature(str): path of the zone-day temperature array, if used
+
+    Returns:
+    list: paths of the input files
+    """
+    inputs = [f'Data/Pooled_data/{level}/final/final_data_{subset}_{level}.csv',
+              "Data/Shapefiles/taxi+_zone_lookup.csv",
+              "Data/NYC_weather/climate_NYC_with_humidity.csv",
+              "Data/NYC_weather/NYC_monthly_hotel.xlsx",
+              'Data/ACS_data/taxi_zones_ACS_parks_beaches_deviation.csv']
+    if zone_temperature is not None:
+        inputs.append(zone_temperature)
+
+    return inputs
+
+def binned_regression(panel_data, level, workday_split, exclude_zeros = False, cluster = "entity"):
     """
     Estimates 2WFE-binned-panel model.
     
@@ -243,6 +319,8 @@ def binned_regression(panel_data, level, workday_split, exclude_zeros = False):
 
     exclude_zeros(bool): exclude zero-valued observations from estimation (pre-log+1 transformation)
 
+    cluster(str or list): "entity" (zone clustering, default) or one or two cluster variables, e.g. ["entity", "borough_month_year"] for two-way clustering
+
     """
 
     ##  2. REGRESSIONS
@@ -260,73 +338,249 @@ def binned_regression(panel_data, level, workday_split, exclude_zeros = False):
     else:
             model_formula = f'log_total~  1+ C(temp_bins, Treatment(reference = "[17.0, 20.0]")) + pr_obs + Snowdepth + AWND + weekday + holiday + cheby_1 + cheby_2 + cheby_3 + cheby_4 + cheby_5 + EntityEffects + TimeEffects'
 
-    # estimate model with borough by month clustered errors
+    # estimate model with zone clustered errors, other clusterings as integer cluster codes
     
     model = PanelOLS.from_formula(model_formula, data=panel_data)
-    
-    results = model.fit(cov_type='clustered', cluster_entity= "borough_month_year")
+    if cluster == "entity":
+        results = model.fit(cov_type='clustered', cluster_entity=True)
+    else:
+        clusters = pd.DataFrame(panel_cluster_codes(panel_data, cluster), index=panel_data.index)
+        results = model.fit(cov_type='clustered', clusters=clusters)
 
     return results
 
-def binned_regression_plots(results, panel_data , temp_bin_size):
+def zone_specific_temperature(panel_data):
     """
-    Plots the coefficients of the binned regression model along with
-    95-% CI and days in each temperature bin
+    True if tmax_obs varies across zones within a day (zone_temperature in binned_regression_data),
+    i.e. temperature bins are assigned to zone-days instead of days.
+    """
+    days = pd.DataFrame({'date_pickup': np.asarray(panel_data['date_pickup']),
+                         'tmax_obs': np.asarray(panel_data['tmax_obs'], dtype=float)}).drop_duplicates()
 
-    results (PanelResults): results from the binned regression model
-    panel_data (DataFrame): panel data with location and year as index
+    return bool(days['date_pickup'].duplicated().any())
+
+
+def preview_sample(panel_data, zone_fraction = 0.5, day_fraction = 0.2, seed = 0):
+    """
+    Reproducible stratified subsample of zones x days for fast preview fits.
+
+    Zones are sampled within borough and days within temperature bin (at least one of each
+    stratum), and all rows of the sampled zones on the sampled days are kept. Days are stratified
+    by their city-wide temperature bin, so panels with zone-specific temperature (zone_temperature
+    in binned_regression_data) are not supported.
+
+    panel_data (DataFrame): output of binned_regression_data
+    zone_fraction(float): share of zones per borough
+    day_fraction(float): share of days per temperature bin
+    seed(int): seed of the draw
+
+    Returns:
+    DataFrame: subsample of panel_data
+    """
+    if zone_specific_temperature(panel_data):
+            raise ValueError("preview_sample stratifies days by temperature bin, but tmax_obs varies across zones within a day.")
+
+    rng = np.random.default_rng(seed)
+    zones = panel_data.index.get_level_values(0)
+
+    def _stratified(units, strata, fraction):
+        frame = pd.DataFrame({'unit': units, 'stratum': np.asarray(strata).astype(str)}).drop_duplicates('unit').sort_values(['stratum', 'unit'])
+        sampled = []
+        for _, group in frame.groupby('stratum', sort=True):
+            n = int(np.ceil(fraction * len(group)))
+            sampled.append(rng.choice(group['unit'].to_numpy(), size=n, replace=False))
+        return np.concatenate(sampled)
+
+    sampled_zones = _stratified(zones, panel_data['Borough'], zone_fraction)
+    sampled_days = _stratified(panel_data['date_pickup'], panel_data['temp_bins'], day_fraction)
+
+    keep = np.isin(zones, sampled_zones) & np.isin(panel_data['date_pickup'], sampled_days)
+
+    return panel_data[keep]
+
+
+def preview_binned_regression(panel_data, level, workday_split, preview = True, zone_fraction = 0.5, day_fraction = 0.2, seed = 0, cluster = "entity"):
+    """
+    Fast preview of the binned model on a stratified subsample (preview_sample).
+
+    Standard errors are rescaled to approximate full-sample ones following the sampling design
+    (fe_estimation.rescaled_subsample_covariance): the within-cluster cross products scale with the
+    share of clusters in the subsample (about zone_fraction for zone clusters), the
+    heteroskedasticity-robust part with the share of observations (about zone_fraction x day_fraction).
+    The CIs are approximate. preview = False fits the full sample.
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    preview(bool): fit on the subsample (True) or the full panel (False)
+    zone_fraction(float): share of zones per borough
+    day_fraction(float): share of days per temperature bin
+    seed(int): seed of the subsample
+    cluster(str or list): one or two cluster variables
+
+    Returns:
+    tuple: DataFrame of coefficient, (rescaled) standard error, t-statistic and 95% CI as clustered_binned_regression,
+           and the estimation sample (for result_record)
+    """
+    if preview == False:
+            return clustered_binned_regression(panel_data, level, workday_split, cluster = cluster), panel_data
+
+    sample = preview_sample(panel_data, zone_fraction, day_fraction, seed)
+    design = binned_design(sample, level, workday_split)
+    fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+
+    # 1. Shares of rows and clusters of the subsample in the full panel
+    full_clusters = panel_cluster_codes(panel_data, cluster)
+    clusters = panel_cluster_codes(sample, cluster)[design["mask"]]
+    observation_fraction = len(sample) / len(panel_data)
+    cluster_fractions = [cluster_codes(clusters[:, i])[1] / cluster_codes(full_clusters[:, i])[1] for i in range(clusters.shape[1])]
+    if clusters.shape[1] == 2:
+        cluster_fractions.append(cluster_codes(combine_codes(clusters[:, 0], clusters[:, 1]))[1]
+                                 / cluster_codes(combine_codes(full_clusters[:, 0], full_clusters[:, 1]))[1])
+
+    # 2. Rescaled covariance
+    cov = rescaled_subsample_covariance(fit["X"], fit["resid"], fit["xtx_inv"], clusters, observation_fraction, cluster_fractions)
+    results = coefficient_frame(fit["params"], cov, design["names"], len(fit["resid"]))
+
+    unscaled_se = np.sqrt(np.diag(cluster_covariance(fit["X"], fit["resid"], fit["xtx_inv"], clusters)))
+    results.attrs['preview'] = {'zone_fraction': zone_fraction, 'day_fraction': day_fraction, 'seed': seed, 'n_full': len(panel_data),
+                                'standard_errors': 'rescaled to the full sample, approximate',
+                                'observation_fraction': observation_fraction, 'cluster_fractions': cluster_fractions,
+                                'se_factor': pd.Series(results["Std. Error"].to_numpy() / unscaled_se, index=design["names"])}
+
+    return results, sample
+
+
+def temperature_bin_days(panel_data, temp_bin_size, pool_top = True):
+    """
+    Counts the days in each temperature bin (bins with more than one day). With zone-specific
+    temperature (zone_specific_temperature) zone-days are counted instead.
+
+    panel_data (DataFrame): panel data with date_pickup and tmax_obs
     temp_bin_size(int): size of temperature bins in °C
-    
+    pool_top(bool): count days of the (35, 38] bin in the (32, 35] bin as in the estimation
+
+    Returns:
+    Series: number of days (or zone-days) per bin label, ordered by temperature
     """
-    coefficients = results.params
-    conf_int = results.conf_int()
-
-    # Combine coefficients and confidence intervals into a single DataFrame
-    df = pd.DataFrame(pd.concat([coefficients, conf_int], axis=1))
-    df.columns = ['Coefficient', 'Lower CI', 'Upper CI']
-    # add omitted point- 0
-    omitted_index = f'C(temp_bins, Treatment(reference = "[17.0, 20.0]"))[T.[17.0, 20.0]]'
-    df.loc[omitted_index] = [0,0,0]
-    
-    
-    df.reset_index(inplace=True)
+    # Create a new DataFrame with unique days (binning on days instead of panel rows)
+    days = pd.DataFrame({'date_pickup': np.asarray(panel_data['date_pickup']),
+                         'tmax_obs': np.asarray(panel_data['tmax_obs'], dtype=float)})
+    if zone_specific_temperature(panel_data):
+            days.insert(1, 'zone', np.asarray(panel_data.index.get_level_values(0)))
+    days = days.drop_duplicates()
 
-    # only keep rows where index starts with C(temp_bins)
-    df = df[df['index'].str.startswith('C(temp_bins')]
+    sequence_bins = np.arange(-10, 41, temp_bin_size)
+    temp_bins = pd.cut(days['tmax_obs'], bins=sequence_bins, include_lowest=True, ordered = True)
+    categories = temp_bins.cat.categories
+    top_bin = pd.Interval(35.0, 38.0, closed='right')
+    if pool_top == True and top_bin in categories:
+            codes = temp_bins.cat.codes.to_numpy().copy()
+            codes[codes == categories.get_loc(top_bin)] = categories.get_loc(pd.Interval(32.0, 35.0, closed='right'))
+            temp_bins = pd.Categorical.from_codes(codes, categories, ordered = True)
+
+    unique_days = days.drop(columns='tmax_obs').assign(temp_bins = temp_bins).drop_duplicates()
+
+    # Count the occurrences of each bin, in the order of the bins
+    temp_bin_counts = unique_days['temp_bins'].value_counts(sort = False)
+    temp_bin_counts = temp_bin_counts[temp_bin_counts > 1]
+    temp_bin_counts.index = temp_bin_counts.index.astype(str)
 
-    # extract temperature bin string
+    return temp_bin_counts
 
-    df['Temperature'] = df['index'].str.split(r'\[T\.').str[1].str[:-1]
 
-    df.drop(columns=['index'], inplace=True)
+def result_record(results, panel_data, temp_bin_size, cluster = "entity", spec = None, pool_top = True):
+    """
+    Collects everything needed for tables and plots of an estimated binned model.
+
+    results (PanelResults, statsmodels results or DataFrame): output of binned_regression,
+            binned_regression_poisson or clustered_binned_regression
+    panel_data (DataFrame): panel data used in the estimation
+    temp_bin_size(int): size of temperature bins in °C
+    cluster(str or list): cluster variables (columns or index levels) to count clusters for
+    spec (dict): specification of the estimation
+    pool_top(bool): count days above 35°C in the (32, 35] bin (see temperature_bin_days)
+
+    Returns:
+    dict: spec, params, cov, conf_int (95%), n_obs, n_clusters (per cluster variable) and bin_days
+    """
+    if isinstance(results, pd.DataFrame):
+            params, cov, n_obs = results['Coefficient'], results.attrs['cov'], results.attrs['n_obs']
+            conf_int = results[['Lower CI', 'Upper CI']]
+    elif hasattr(results, 'cov_params'):
+            params, cov, n_obs, conf_int = results.params, results.cov_params(), results.nobs, results.conf_int()
+    else:
+            params, cov, n_obs, conf_int = results.params, results.cov, results.nobs, results.conf_int()
+
+    cluster = [cluster] if isinstance(cluster, str) else list(cluster or [])
+    codes = panel_cluster_codes(panel_data, cluster) if cluster else np.empty((len(panel_data), 0))
+    n_clusters = {name: int(len(np.unique(codes[codes[:, i] >= 0, i]))) for i, name in enumerate(cluster)}
+
+    return {
+        "spec": spec or {},
+        "params": pd.Series(np.asarray(params, dtype=float), index=list(params.index)),
+        "cov": pd.DataFrame(np.asarray(cov, dtype=float), index=list(params.index), columns=list(params.index)),
+        "conf_int": pd.DataFrame(np.asarray(conf_int, dtype=float), index=list(params.index), columns=['Lower CI', 'Upper CI']),
+        "n_obs": int(n_obs),
+        "n_clusters": n_clusters,
+        "bin_days": temperature_bin_days(panel_data, temp_bin_size, pool_top),
+    }
+
+
+def coefficient_table(record, percent = True):
+    """
+    Temperature-bin coefficients with 95% confidence intervals, including the omitted bin at 0.
+
+    record (dict): output of result_record (or loaded from result_store)
+    percent(bool): convert the coefficients into percentages (only with log outcome)
+
+    Returns:
+    DataFrame: temp_bins, Coefficient, Lower CI, Upper CI and bin midpoint Temperature, ordered by temperature
+    """
+    df = pd.concat([record["params"].rename('Coefficient'), record["conf_int"]], axis=1)
+
+    # only keep rows where index starts with C(temp_bins) and add omitted point- 0
+    df = df[df.index.str.startswith('C(temp_bins')].copy()
+    df['temp_bins'] = df.index.str.split(r'\[T\.').str[1].str[:-1]
+    df.loc['omitted'] = [0, 0, 0, REFERENCE_BIN]
 
     # Convert Temperature intervals into numerical values
-    df['Temperature'] = df['Temperature'].str.strip('[]').str.split(',').apply(lambda x: (float(x[0]) + float(x[1])) / 2)
+    df['Temperature'] = df['temp_bins'].str.strip('[]').str.split(',').apply(lambda x: (float(x[0]) + float(x[1])) / 2)
     # order the dataframe by temperature
-    df = df.sort_values(by=['Temperature'])
-    # plot max bin as well 
+    df = df.sort_values(by=['Temperature']).reset_index(drop=True)
 
     # convert the coeffients into percentages and adapt CI accordingly - only with log outcome
-    
-    df['Coefficient'] = df['Coefficient'] * 100
-    df['Lower CI'] = df['Lower CI'] * 100
-    df['Upper CI'] = df['Upper CI'] * 100
+    if percent == True:
+            df[['Coefficient', 'Lower CI', 'Upper CI']] = df[['Coefficient', 'Lower CI', 'Upper CI']] * 100
+
+    return df[['temp_bins', 'Temperature', 'Coefficient', 'Lower CI', 'Upper CI']]
+
+
+def plot_binned_coefficients(table, bin_days, ylabel = 'Trip number response in %'):
+    """
+    Plots the coefficients of the binned regression model along with
+    95-% CI and days in each temperature bin
+
+    table (DataFrame): output of coefficient_table
+    bin_days (Series): days per temperature bin (temperature_bin_days)
+    ylabel(str): label of the coefficient axis
 
+    """
     # Extract Temperature and Coefficient values
-    temperature = df['Temperature']
-    coefficient = df['Coefficient']
+    temperature = table['Temperature']
+    coefficient = table['Coefficient']
 
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
 
     # Create the plot
 
     ax1.scatter(temperature, coefficient, color='blue', label='Data')
-    
-    ax1.set_ylabel(f'Trip number response in %')
-    
+
+    ax1.set_ylabel(ylabel)
+
     # Add confidence intervals if needed
-    lower_ci = df['Lower CI']
-    upper_ci = df['Upper CI']
+    lower_ci = table['Lower CI']
+    upper_ci = table['Upper CI']
     ax1.errorbar(temperature, coefficient, yerr=[coefficient - lower_ci, upper_ci - coefficient], fmt='o', color='red' , capsize= 3,  barsabove = True , label='Confidence Interval')
 
     # Fit a polynomial
@@ -341,35 +595,35 @@ def binned_regression_plots(results, panel_data , temp_bin_size):
     ax1.axhline(y=0, color='blue', linestyle='--' , label = 'Zero')
 
     # set consistent y-axis
-    
-    ax1.set_ylim(-10, 10)
-
 
-    # For temp bin plotting
-    sequence_bins = np.arange(-10, 41, temp_bin_size)
-    temp_bins = pd.cut(panel_data['tmax_obs'], bins=sequence_bins, include_lowest=True, ordered = True)
-    temp_bins = temp_bins.apply(lambda x: pd.Interval(32.0, 35.0, closed='right') if x == pd.Interval(35.0, 38.0, closed='right') else x)
-    panel_data['temp_bins'] = temp_bins
-    # Create a new DataFrame with unique days
-    unique_days = panel_data.reset_index()[['date_pickup', 'temp_bins']].drop_duplicates()
-
-    # Count the occurrences of each bin
-    temp_bin_counts = unique_days['temp_bins'].value_counts().sort_index()
-    temp_bin_counts = temp_bin_counts[temp_bin_counts > 1]
+    ax1.set_ylim(-10, 10)
 
-    # Create a color array with 'grey' for all bars and 'red' for the bar with the maximum count
+    # Create a color array with 'grey' for all bars and 'red' for the omitted bin
     color_bin= '(17.0, 20.0]'
-    colors = ['grey' if str(bin) != color_bin else 'red' for bin in temp_bin_counts.index]
-    temp_bin_counts.plot(kind='bar', color=colors)
+    colors = ['grey' if str(bin) != color_bin else 'red' for bin in bin_days.index]
+    bin_days.plot(kind='bar', color=colors, ax=ax2)
     ax2.set_xlabel('Daily maximum temperature (°C)')
     ax2.set_ylabel('Number of Days per temperature bin')
     ax2.tick_params(axis='x', rotation=45)
     # prvent that the picture shows
     plt.close()
 
+    return fig
+
+
+def binned_regression_plots(results, panel_data , temp_bin_size):
+    """
+    Plots the coefficients of the binned regression model along with
+    95-% CI and days in each temperature bin
+
+    results (PanelResults): results from the binned regression model
+    panel_data (DataFrame): panel data with location and year as index
+    temp_bin_size(int): size of temperature bins in °C
     
+    """
+    record = result_record(results, panel_data, temp_bin_size, cluster = None)
 
-    return fig
+    return plot_binned_coefficients(coefficient_table(record), record["bin_days"])
 
 
 def binned_regression_poisson(panel_data, level, workday_split):
@@ -4,54 +4,91 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 import holidays
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib.cbook import boxplot_stats 
 import matplotlib.pyplot as plt
 from linearmodels.panel import PanelOLS
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
+from fe_estimation import combine_codes
+from binned_regression import result_record, coefficient_table, plot_binned_coefficients
+from result_store import spec_key, file_fingerprint, load_results, save_results
+from weather_ingestion import merge_zone_weather, fahrenheit_to_celsius
 
-def fahrenheit_to_celsius(f):
-        return (f - 32) * 5/9
 
-def preprocess_chicago_ridesharing():
+CHICAGO_REGRESSION_DATA = 'Data/Chicago_data/chicago_TNP2019_regression.csv'
+
+# Transportation Network Providers exports (preaggregated to 15 min - community area on the Chicago Data Portal)
+TNP_FILES = ["Data/Chicago_data/Transportation_Network_Providers_-_Trips__2018_-_2022_13_12.csv",
+             "Data/Chicago_data/Transportation_Network_Providers_-_Trips__2023-_.csv"]
+
+# columns read from the exports with their dtypes and names in the trip data
+TNP_COLUMNS = {
+    "Trip Start Timestamp": ("str", "date_pickup"),
+    "Pickup Community Area": ("float64", "PULocationID"),
+    "Trip Miles": ("float64", "trip_distance"),
+    "Fare": ("float64", "total_amount"),
+    "Tip": ("float64", "Tip"),
+    "Trip ID": ("float64", "trip_number"),
+}
+
+# timestamp format of the Data Portal csv exports
+TNP_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+def _aggregate_tnp_file(path, chunksize = 1000000, timestamp_format = TNP_TIMESTAMP_FORMAT):
+    """
+    Helper function streaming one TNP export in chunks and summing trips and trip-weighted
+    distance, amount and tip per day and community area. Each chunk is folded into a running
+    aggregate, so memory is bounded by the chunk size and the number of day-area cells.
+    """
+    aggregate = None
+    for chunk in pd.read_csv(path, usecols=list(TNP_COLUMNS), dtype={column: dtype for column, (dtype, _) in TNP_COLUMNS.items()}, chunksize=chunksize):
+        chunk = chunk.rename(columns={column: name for column, (_, name) in TNP_COLUMNS.items()})
+        # drop observations where PUlocationID is missing
+        chunk = chunk.dropna(subset=['PULocationID'])
+
+        # timestamps parsed once, aggregation by day
+        date_pickup = pd.to_datetime(chunk["date_pickup"], format=timestamp_format).dt.normalize()
+
+        # Calculating weighted values for aggregation- no predefined weighted agg function in pandas
+        weighted = pd.DataFrame({
+            "date_pickup": date_pickup,
+            "PULocationID": chunk["PULocationID"].astype(np.int16),
+            "weighted_mean_distance": chunk["trip_number"] * chunk["trip_distance"],
+            "weighted_mean_amount": chunk["trip_number"] * chunk["total_amount"],
+            "trip_number": chunk["trip_number"],
+            "weighted_tip": chunk["trip_number"] * chunk["Tip"],
+        })
+        partial_sum = weighted.groupby(["date_pickup", "PULocationID"]).sum()
+        aggregate = partial_sum if aggregate is None else aggregate.add(partial_sum, fill_value=0).astype(partial_sum.dtypes)
+
+    return aggregate
+
+
+def preprocess_chicago_ridesharing(paths = TNP_FILES, output = "Data/Chicago_data/Chi_TNP_Trips_grouped_by_day_2018_2023.csv",
+                                   chunksize = 1000000, max_workers = None, timestamp_format = TNP_TIMESTAMP_FORMAT):
     """
     Concats 2018-2022 and 2023 trip records.
     Trip records were preaggregated to quarter hour - community zone level
     on Chicago Data Portal.
+
+    The exports are streamed in chunks (only the needed columns, explicit dtypes) in one process
+    per file; per-chunk sums by day and community area are folded into one running aggregate per file, so memory is bounded by the chunk size.
     
     
     Input: Trip records 2018-2022 and 2023 (preaggregated to 15 min intervals)
+           paths (list): TNP export files
+           output (str): csv file of the daily data
+           chunksize (int): rows per chunk
+           max_workers (int): number of worker processes (default: one per file)
+           timestamp_format (str): format of Trip Start Timestamp
     
     """
-
-    chi_tnp_2018_22 = pd.read_csv("Data/Chicago_data/Transportation_Network_Providers_-_Trips__2018_-_2022_13_12.csv")
-    chi_tnp_2019_23 = pd.read_csv("Data/Chicago_data/Transportation_Network_Providers_-_Trips__2023-_.csv")
-    # Concatenation
-    chi_tnp = pd.concat([chi_tnp_2018_22, chi_tnp_2019_23], ignore_index=True)
-    # Rename columns
-    chi_tnp.rename(columns={'Trip Start Timestamp':'date_pickup' , 'Pickup Community Area' : 'PULocationID' , 'Trip Miles' : 'trip_distance' , 'Fare' : 'total_amount' , 'Trip ID' : 'trip_number'}, inplace=True)
-    # Convert Datetime column - Aggregation by day
-
-    chi_tnp["date_pickup"].astype(str)
-    # extract only the date from the timestamp
-    chi_tnp['date_pickup'] = chi_tnp['date_pickup'].str[:10]
-    chi_tnp['date_pickup'] = pd.to_datetime(chi_tnp['date_pickup']).dt.date
-    # drop observations where PUlocationID is missing
-    chi_tnp = chi_tnp.dropna(subset=['PULocationID'])
-
-    # Calculating weighted values for aggregation- no predefined weighted agg function in pandas
-    chi_tnp["weighted_mean_distance"] = chi_tnp["trip_number"] * chi_tnp["trip_distance"]
-    chi_tnp["weighted_mean_amount"] = chi_tnp["trip_number"] * chi_tnp["total_amount"]
-    chi_tnp["weighted_tip"] = chi_tnp["trip_number"] * chi_tnp["Tip"]
+    with ProcessPoolExecutor(max_workers=max_workers or len(paths)) as executor:
+        partial_sums = list(executor.map(_aggregate_tnp_file, paths, [chunksize] * len(paths), [timestamp_format] * len(paths)))
 
     # Aggregate by day and location ID
-    chi_grouped_by_day = chi_tnp.groupby(["date_pickup", "PULocationID"]).agg({
-        "weighted_mean_distance": ["sum"],
-        "weighted_mean_amount": ["sum"],
-        "trip_number": ["sum"],
-        "weighted_tip": ["sum"]
-    })
-    chi_grouped_by_day.columns = ["weighted_mean_distance", "weighted_mean_amount", "trip_number", "weighted_tip"]
+    chi_grouped_by_day = pd.concat(partial_sums).groupby(["date_pickup", "PULocationID"]).sum()
 
     # Calculating mean values and percentage for the grouped data
     chi_grouped_by_day["trip_distance_mean"] = chi_grouped_by_day["weighted_mean_distance"] / chi_grouped_by_day["trip_number"]
@@ -64,7 +101,9 @@ def preprocess_chicago_ridesharing():
     chi_grouped_by_day.reset_index(inplace=True)
 
     # save the preprocessed data
-    chi_grouped_by_day.to_csv("Data/Chicago_data/Chi_TNP_Trips_grouped_by_day_2018_2023.csv", index=False)
+    chi_grouped_by_day.to_csv(output, index=False)
+
+    return chi_grouped_by_day
 
 
 def preprocess_chicago_weather():
@@ -100,14 +139,14 @@ def preprocess_chicago_weather():
 
     
     # convert temperature to celsius
-    climate_covid['TMAX'] = climate_covid['TMAX'].apply(fahrenheit_to_celsius)
+    climate_covid['TMAX'] = fahrenheit_to_celsius(climate_covid['TMAX'])
     climate_covid.rename(columns={ 'TMAX' : 'tmax_obs'}, inplace=True)
 
     # save weather data
     climate_covid.to_csv("Data/Chicago_data/CHI_weather_2018-2023_covid.csv", index=False)
 
 
-def prepare_chicago():
+def prepare_chicago(zone_weather = None):
     """
     Merges aggregated trip records and weather data for Chicago.
     Adds holiday information, Chebyshev polynomials and outlier filtering. 
@@ -115,6 +154,7 @@ def prepare_chicago():
     
     Input: trips:
            weather: 
+           zone_weather (str): optional community area-day weather table (weather_ingestion.interpolate_daily_weather)
     
     
     """
@@ -138,6 +178,10 @@ def prepare_chicago():
     # merge trips and climate data on date
     trips = pd.merge(trips, weather, how='left', left_on='date_pickup', right_on='DATE')
 
+    # community area-day weather interpolated from several stations instead of O'Hare only
+    if zone_weather is not None:
+        trips = merge_zone_weather(trips, zone_weather, 'PULocationID')
+
     us_holidays = holidays.US()
 
     # Create a new column indicating whether each date is a holiday or not
@@ -209,26 +253,20 @@ def prepare_chicago():
     taxi_data = non_outliers
 
 
-    taxi_data.to_csv("Data/Chicago_data/chicago_TNP2019_regression.csv", index=False)
+    taxi_data.to_csv(CHICAGO_REGRESSION_DATA, index=False)
 
 
-def chicago_binned_regression(outcome,temp_bin_size, exclude_2020 = True):
+def _chicago_estimation(outcome, temp_bin_size, exclude_2020):
         """
-        Binned-Fixed Effects Regression for Chicago - can be split up 
-        into separate functions for estimation and plotting.
-        
-        Input: outcome: "trip_number" or "trip_distance_mean"        
-        """
-
-
-
-
+        Data preparation and estimation of the binned-Fixed Effects Regression for Chicago.
 
+        Returns: results (PanelResults) and the estimation data
+        """
         ## 1. DATA PREPARATION
 
       
         
-        taxi_data_cut = pd.read_csv('Data/Chicago_data/chicago_TNP2019_regression.csv') 
+        taxi_data_cut = pd.read_csv(CHICAGO_REGRESSION_DATA) 
 
         if exclude_2020 == True:
                 taxi_data_cut = taxi_data_cut[taxi_data_cut['Year_fact'] != 3]
@@ -269,7 +307,7 @@ def chicago_binned_regression(outcome,temp_bin_size, exclude_2020 = True):
         # Create a panel data structure
         taxi_data_cut["date_pickup"] = pd.to_datetime(taxi_data_cut["date_pickup"])
 
-        taxi_data_cut['borough_month'] = taxi_data_cut['PULocationID'].astype(str) + '_' + taxi_data_cut['Month_fact'].astype(str)
+        taxi_data_cut['borough_month'] = combine_codes(taxi_data_cut['PULocationID'].to_numpy(), taxi_data_cut['Month_fact'].to_numpy())
 
 
         panel_data = taxi_data_cut.set_index(['PULocationID', 'Year_fact'])
@@ -321,98 +359,42 @@ def chicago_binned_regression(outcome,temp_bin_size, exclude_2020 = True):
                 model = PanelOLS.from_formula(model_formula, data=panel_data)
                 results = model.fit(cov_type='clustered', cluster_entity="PULocationID")
 
-                
-
+        return results, taxi_data_cut
 
-        ## 3. PLOTS
 
-        coefficients = results.params
-        conf_int = results.conf_int()
-
-        # Combine coefficients and confidence intervals into a single DataFrame
-        df = pd.DataFrame(pd.concat([coefficients, conf_int], axis=1))
-        df.columns = ['Coefficient', 'Lower CI', 'Upper CI']
+def chicago_binned_regression(outcome,temp_bin_size, exclude_2020 = True, store = None):
+        """
+        Binned-Fixed Effects Regression for Chicago - estimation results are kept in
+        a result store (result_store.py) if given, and specifications already
+        estimated on the same input file are loaded from it.
         
-        # add omitted point- 0
-        omitted_index = 'C(temp_bins, Treatment(reference = "[17.0, 20.0]"))[T.[17.0, 20.0]]'
-        df.loc[omitted_index] = [0,0,0]
-
-        df.reset_index(inplace=True)
-
-        # only keep rows where index starts with C(temp_bins)
-        df = df[df['index'].str.startswith('C(temp_bins')]
-
-        # extract temperature bin string
-
-        df['Temperature'] = df['index'].str.split(r'\[T\.').str[1].str[:-1]
-
-        df.drop(columns=['index'], inplace=True)
+        Input: outcome: "trip_number" or "trip_distance_mean"        
+               store: path of the SQLite result store, e.g. "Data/regression_results.sqlite". None: always estimate
+        """
+        spec = {"model": "chicago_binned_regression", "outcome": outcome, "temp_bin_size": temp_bin_size, "exclude_2020": exclude_2020}
+        record = None
 
-        # Convert Temperature intervals into numerical values
-        df['Temperature'] = df['Temperature'].str.strip('[]').str.split(',').apply(lambda x: (float(x[0]) + float(x[1])) / 2)
-        # order the dataframe by temperature
-        df = df.sort_values(by=['Temperature'])
+        if store is not None:
+                key = spec_key(spec, file_fingerprint(CHICAGO_REGRESSION_DATA))
+                record = load_results(key, store)
 
-        # convert the coeffients into percentages and adapt CI accordingly - only with log outcome
-        if outcome == "trip_number":
-                df['Coefficient'] = df['Coefficient'] * 100
-                df['Lower CI'] = df['Lower CI'] * 100
-                df['Upper CI'] = df['Upper CI'] * 100
+        if record is None:
+                results, taxi_data_cut = _chicago_estimation(outcome, temp_bin_size, exclude_2020)
+                record = result_record(results, taxi_data_cut, temp_bin_size, cluster = "PULocationID", spec = spec, pool_top = False)
+                if store is not None:
+                        save_results(key, record, store)
 
-        # Extract Temperature and Coefficient values
-        temperature = df['Temperature']
-        coefficient = df['Coefficient']
 
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
+        ## 3. PLOTS
 
-        # Create the plot
+        # convert the coeffients into percentages - only with log outcome
+        table = coefficient_table(record, percent = outcome == "trip_number")
+        print(f"N = {record['n_obs']}, clusters: {record['n_clusters']}")
+        print(table)
 
-        ax1.scatter(temperature, coefficient, color='blue', label='Data')
         if outcome == "trip_number":    
-                ax1.set_ylabel(f' Trip number response in %')
+                ylabel = 'Trip number response in %'
         else:
-                ax1.set_ylabel(f'{outcome} response in $')
-        
-        # ax1.set_title(f' Log-transformed {outcome} response by {temp_bin_size}°C bin- {city}- 2019-2023 - Community Zone and Year fixed effects')
-
-        # Add confidence intervals if needed
-        lower_ci = df['Lower CI']
-        upper_ci = df['Upper CI']
-        ax1.errorbar(temperature, coefficient, yerr=[coefficient - lower_ci, upper_ci - coefficient], fmt='o', color='red' , capsize= 3,  barsabove = True , label='Confidence Interval')
-
-        # Fit a polynomial
-        degree = 2
-        coefficients_poly = np.polyfit(temperature, coefficient, degree)
-        y_poly = np.polyval(coefficients_poly, temperature)
+                ylabel = f'{outcome} response in $'
 
-        # Plot the polynomial curve
-        ax1.plot(temperature, y_poly, label=f'Polynomial Fit (Degree {degree})', color='green')
-
-        # add a dotted line at 0 percent
-        ax1.axhline(y=0, color='blue', linestyle='--')
-        ax1.set_ylim(-10, 10)
-        # Add a legend
-        # ax1.legend()
-
-
-        sequence_bins = np.arange(-10, 41, temp_bin_size)
-        temp_bins = pd.cut(taxi_data_cut['tmax_obs'], bins=sequence_bins, include_lowest=True, ordered = True)
-        taxi_data_cut['temp_bins'] = temp_bins
-        # Create a new DataFrame with unique days
-        unique_days = taxi_data_cut[['date_pickup', 'temp_bins']].drop_duplicates()
-        temp_bin_counts = unique_days['temp_bins'].value_counts().sort_index()
-        temp_bin_counts = temp_bin_counts[temp_bin_counts > 1]
-        # Find the index of the maximum count
-        # max_days_bin = temp_bin_counts.idxmax()
-
-        # Create a color array with 'grey' for all bars and 'red' for the omitted bin
-        color_bin= '(17.0, 20.0]'
-        colors = ['grey' if str(bin) != color_bin else 'red' for bin in temp_bin_counts.index]
-
-        # Ensure the plot respects the categorical order
-        temp_bin_counts.plot(kind='bar', color=colors)
-        # ax2.set_title(f' Days in each {temp_bin_size}°C bin- {city} 2019')
-        ax2.set_xlabel('Temperature Bins')
-        ax2.set_ylabel('Number of Days')
-        ax2.tick_params(axis='x', rotation=45)
-        print(results)
\ No newline at end of file
+        return plot_binned_coefficients(table, record["bin_days"], ylabel = ylabel)
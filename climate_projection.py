@@ -0,0 +1,150 @@
+## Projection of trip-volume changes under warming scenarios
+
+import numpy as np
+import pandas as pd
+from fe_estimation import REFERENCE_BIN
+
+
+def bin_effects(params, cov, reference = REFERENCE_BIN):
+    """
+    Temperature-bin coefficients of the binned model on all bins (omitted bin = 0).
+
+    params (Series): estimated coefficients (e.g. record["params"] of the result store)
+    cov (DataFrame): their covariance matrix
+    reference (str): omitted temperature bin
+
+    Returns:
+    dict: bin labels, lower and upper bin edges, coefficients, covariance of the estimated bins
+          and position of the reference bin, ordered by temperature
+    """
+    names = [name for name in params.index if str(name).startswith("C(temp_bins")]
+    labels = [name.split("[T.")[1][:-1] for name in names] + [reference]
+    lowers = np.array([float(label.strip("[]").split(",")[0]) for label in labels])
+    uppers = np.array([float(label.strip("[]").split(",")[1]) for label in labels])
+
+    order = np.argsort(uppers)
+    coefficients = np.append(params[names].to_numpy(dtype=float), 0.0)
+
+    return {
+        "labels": [labels[i] for i in order],
+        "lowers": lowers[order],
+        "uppers": uppers[order],
+        "coefficients": coefficients[order],
+        "cov": cov.loc[names, names].to_numpy(dtype=float),
+        # position of the estimated bins (and the reference bin) in temperature order
+        "estimated": np.argsort(order)[:-1],
+        "reference": int(np.argsort(order)[-1]),
+    }
+
+
+def temperature_bin_index(temperature, lowers, uppers, pooled_top = None):
+    """
+    Bin of each temperature for consecutive right-closed bins with the given edges. Temperatures
+    in (uppers[-1], pooled_top] fall into the highest bin (as days of 35-38°C in
+    binned_regression_data); temperatures outside the bins get -1.
+    """
+    temperature = np.asarray(temperature, dtype=float)
+    top = uppers[-1] if pooled_top is None else pooled_top
+
+    index = np.searchsorted(uppers, temperature, side="left")
+    index[(temperature > uppers[-1]) & (temperature <= top)] = len(uppers) - 1
+    index[~((temperature >= lowers[0]) & (temperature <= top))] = -1
+
+    return index
+
+
+def project_scenarios(params, cov, panel_data, shifts = (1.0, 2.0, 3.0), members = None, exposure = "trip_number",
+                      n_draws = 1000, alpha = 0.05, seed = None, pooled_top = 38.0):
+    """
+    Projects the change in trip volume when the temperature of every zone-day moves to another bin.
+
+    A zone-day with baseline bin o and scenario bin n changes by exposure * (exp(b_n - b_o) - 1).
+    Exposure is summed per (baseline, scenario) bin pair with one bincount per scenario, so each
+    scenario is a bins x bins weight matrix; coefficient uncertainty enters through draws from
+    the estimated covariance, and all scenarios x draws are one matrix product.
+
+    Zone-days whose baseline or scenario temperature lies outside the estimated bins have no
+    estimated effect and are left out of the projected change; their share of the baseline
+    trips is reported per scenario.
+
+    params (Series): estimated coefficients of the binned model
+    cov (DataFrame): covariance matrix of the coefficients
+    panel_data (DataFrame): baseline zone-days with date_pickup, tmax_obs and the exposure column
+    shifts (tuple): uniform warming scenarios in °C added to the baseline tmax_obs
+    members (ndarray): optional ensemble of synthetic daily series (members x days, in °C),
+                       aligned with the sorted unique dates of panel_data (incl. days with missing values)
+    exposure (str): column with the baseline trip volume per zone-day
+    n_draws (int): coefficient draws
+    alpha (float): level of the projection intervals
+    seed (int): seed for reproducible draws
+    pooled_top (float): temperatures up to which days above the highest bin are pooled into it
+
+    Returns:
+    DataFrame: per scenario the projected change in trips and in % of baseline trips with point
+               estimate, draw mean and interval and the % of baseline trips out of the bin range
+               (and an "ensemble" row pooling all members); the draws (scenarios x n_draws, in %)
+               are in attrs["draws"]
+    """
+    effects = bin_effects(params, cov)
+    n_bins = len(effects["labels"])
+
+    # 1. Zone-days collapsed to unique (day, baseline temperature) cells with summed exposure
+    dates = pd.to_datetime(np.asarray(panel_data["date_pickup"]))
+    cells = pd.DataFrame({
+        "date": dates,
+        "tmax": np.asarray(panel_data["tmax_obs"], dtype=float),
+        "exposure": np.asarray(panel_data[exposure], dtype=float),
+    }).dropna().groupby(["date", "tmax"], sort=True)["exposure"].sum().reset_index()
+
+    # days of the members: all dates of the panel, before dropping missing values
+    day_index = pd.Index(np.unique(dates)).get_indexer(cells["date"])
+    baseline_bins = temperature_bin_index(cells["tmax"].to_numpy(), effects["lowers"], effects["uppers"], pooled_top)
+    weights = cells["exposure"].to_numpy()
+    total_exposure = weights.sum()
+
+    # 2. Scenario temperatures per cell and exposure per (baseline, scenario) bin pair
+    scenarios = {f"+{shift:g}°C" if shift >= 0 else f"{shift:g}°C": cells["tmax"].to_numpy() + shift for shift in shifts}
+    if members is not None:
+        members = np.asarray(members, dtype=float)
+        for m in range(members.shape[0]):
+            scenarios[f"member_{m}"] = members[m, day_index]
+
+    pair_exposure, out_of_range = [], []
+    for temperature in scenarios.values():
+        scenario_bins = temperature_bin_index(temperature, effects["lowers"], effects["uppers"], pooled_top)
+        in_range = (baseline_bins >= 0) & (scenario_bins >= 0)
+        pair_exposure.append(np.bincount(np.where(in_range, baseline_bins * n_bins + scenario_bins, 0),
+                                         weights=np.where(in_range, weights, 0.0), minlength=n_bins * n_bins))
+        out_of_range.append(weights[~in_range].sum() / total_exposure * 100)
+    pair_exposure = np.vstack(pair_exposure)
+
+    # 3. Coefficient draws and relative change exp(b_n - b_o) - 1 for every bin pair
+    rng = np.random.default_rng(seed)
+    draws = np.zeros((n_draws, n_bins))
+    draws[:, effects["estimated"]] = rng.multivariate_normal(effects["coefficients"][effects["estimated"]], effects["cov"], size=n_draws, method="eigh")
+    coefficients = np.vstack([effects["coefficients"], draws])
+    pair_change = np.expm1(coefficients[:, None, :] - coefficients[:, :, None]).reshape(len(coefficients), -1)
+
+    change = pair_exposure @ pair_change.T
+    point, drawn = change[:, 0], change[:, 1:] / total_exposure * 100
+
+    result = pd.DataFrame({
+        "Change (trips)": point,
+        "Change (%)": point / total_exposure * 100,
+        "Mean (%)": drawn.mean(axis=1),
+        "Lower (%)": np.quantile(drawn, alpha / 2, axis=1),
+        "Upper (%)": np.quantile(drawn, 1 - alpha / 2, axis=1),
+        "Out of range (%)": out_of_range,
+    }, index=pd.Index(list(scenarios), name="scenario"))
+
+    if members is not None:
+        is_member = result.index.str.startswith("member_")
+        pooled = drawn[is_member].ravel()
+        result.loc["ensemble"] = [point[is_member].mean(), point[is_member].mean() / total_exposure * 100,
+                                  pooled.mean(), np.quantile(pooled, alpha / 2), np.quantile(pooled, 1 - alpha / 2),
+                                  result.loc[is_member, "Out of range (%)"].mean()]
+
+    result.attrs["draws"] = pd.DataFrame(drawn, index=list(scenarios))
+    result.attrs["baseline_trips"] = total_exposure
+
+    return result
@@ -0,0 +1,949 @@
+## Fast fixed-effects estimation and inference for the binned panel model
+
+import numpy as np
+import pandas as pd
+from scipy import linalg, sparse, stats
+
+
+# omitted temperature bin of the binned model
+REFERENCE_BIN = "[17.0, 20.0]"
+
+# two-sided 95% critical value of the normal distribution
+CRITICAL_VALUE = stats.norm.ppf(0.975)
+
+
+def binned_controls(workday_split):
+    """
+    Returns the control variables of the binned model as used in binned_regression.
+
+    workday_split(str): "weekday" or "weekend" - weekday indicator is dropped for split samples
+    """
+    controls = ["pr_obs", "Snowdepth", "AWND", "weekday", "holiday", "cheby_1", "cheby_2", "cheby_3", "cheby_4", "cheby_5"]
+
+    if workday_split == "weekday" or workday_split == "weekend":
+        controls.remove("weekday")
+
+    return controls
+
+
+def bin_coefficient_name(temp_bin, reference = REFERENCE_BIN):
+    """
+    Returns the coefficient name linearmodels assigns to a temperature bin dummy.
+    """
+    return f"C(temp_bins, Treatment(reference='{reference}'))[T.{temp_bin}]"
+
+
+def temperature_bin_codes(tmax_obs, bin_size, top = 35.0):
+    """
+    Integer temperature-bin codes as in binned_regression_data.
+
+    Bins of bin_size °C start at -10°C; days above `top` are pooled into the bin containing
+    `top` (for 3°C bins: 35-38°C into 32-35°C). Days outside the bin range get code -1.
+
+    tmax_obs (array): daily maximum temperature in °C
+    bin_size (int): size of temperature bins in °C
+    top (float): temperature above which days are pooled into one bin
+
+    Returns:
+    codes (ndarray): bin code per observation
+    labels (list): bin labels as used for the temp_bins column, e.g. "[17.0, 20.0]"
+    midpoints (ndarray): bin midpoints in °C
+    """
+    edges = np.arange(-10, 41, bin_size).astype(float)
+    binned = pd.cut(np.asarray(tmax_obs, dtype=float), bins=edges, include_lowest=True)
+    codes = np.asarray(binned.codes, dtype=np.int64)
+
+    top_bin = int(np.searchsorted(edges, top, side="left")) - 1
+    codes[codes > top_bin] = top_bin
+
+    labels = [str(interval).replace("(", "[") for interval in binned.categories[:top_bin + 1]]
+    midpoints = (edges[:top_bin + 1] + edges[1:top_bin + 2]) / 2
+
+    return codes, labels, midpoints
+
+
+def cluster_codes(values):
+    """
+    Converts a cluster variable (any dtype) into integer codes 0..G-1.
+    """
+    codes, uniques = pd.factorize(np.asarray(values), sort=True)
+    return codes, len(uniques)
+
+
+def combine_codes(*code_arrays):
+    """
+    Integer codes of the intersection of several integer-coded groups (e.g. borough x day).
+
+    Codes are combined arithmetically (mixed radix) instead of concatenating strings row by row.
+    Rows with a missing (negative) code in any input get code -1.
+    """
+    code_arrays = [np.asarray(codes, dtype=np.int64) for codes in code_arrays]
+    combined = np.zeros(len(code_arrays[0]), dtype=np.int64)
+    missing = np.zeros(len(code_arrays[0]), dtype=bool)
+    for codes in code_arrays:
+        combined = combined * (int(codes.max()) + 1) + codes
+        missing |= codes < 0
+
+    combined[missing] = -1
+    codes, uniques = pd.factorize(combined, sort=True)
+    # keep missing rows at -1 and compact the remaining codes
+    if missing.any():
+        codes = codes - 1
+        codes[missing] = -1
+    return codes
+
+
+def panel_cluster_codes(panel_data, cluster):
+    """
+    Integer cluster codes (N x 1 or N x 2) from columns or index levels of the panel.
+
+    "entity" stands for the zone index level (the cluster_entity clustering of binned_regression).
+
+    panel_data (DataFrame): panel data with location and year as index
+    cluster (str or list): one or two cluster variables, e.g. "entity" or ["entity", "borough_month_year"]
+    """
+    cluster = [cluster] if isinstance(cluster, str) else list(cluster)
+    if len(cluster) > 2:
+        raise ValueError("Only one- or two-way clustering is supported.")
+
+    columns = []
+    for name in cluster:
+        if name == "entity":
+            values = panel_data.index.get_level_values(0)
+        elif name in panel_data.columns:
+            values = panel_data[name]
+        else:
+            values = panel_data.index.get_level_values(name)
+        columns.append(cluster_codes(values)[0])
+
+    return np.column_stack(columns)
+
+
+def cluster_scores(scores, codes, n_clusters = None):
+    """
+    Aggregates observation-level scores (N x k) to cluster sums (G x k) with a sparse indicator product.
+    """
+    return _indicator_matrix(codes, n_clusters).T @ scores
+
+
+def _indicator_matrix(codes, n_groups = None):
+    """
+    Sparse (N x G) indicator matrix of integer group codes.
+    """
+    codes = np.asarray(codes)
+    if n_groups is None:
+        n_groups = int(codes.max()) + 1
+    rows = np.arange(len(codes))
+    return sparse.csr_matrix((np.ones(len(codes)), (rows, codes)), shape=(len(codes), n_groups))
+
+
+def grouped_crossproducts(A, B, codes, n_groups = None):
+    """
+    Per-group cross-products A_g'B_g for all groups at once.
+
+    Each of the ka x kb entries is a single weighted bincount over the rows, so no
+    per-group subsetting or N x ka x kb intermediate is needed.
+
+    A (ndarray): N x ka array
+    B (ndarray): N x kb array
+    codes (ndarray): N integer group codes (0..G-1)
+
+    Returns:
+    ndarray: G x ka x kb array of cross-products
+    """
+    codes = np.asarray(codes)
+    if n_groups is None:
+        n_groups = int(codes.max()) + 1
+    symmetric = A is B
+
+    out = np.empty((n_groups, A.shape[1], B.shape[1]))
+    for i in range(A.shape[1]):
+        for j in range(i if symmetric else 0, B.shape[1]):
+            out[:, i, j] = np.bincount(codes, weights=A[:, i] * B[:, j], minlength=n_groups)
+            if symmetric:
+                out[:, j, i] = out[:, i, j]
+
+    return out
+
+
+def absorb_fixed_effects(values, fe_codes):
+    """
+    Residualizes columns on a set of fixed effects.
+
+    The fixed effects enter as sparse dummy blocks; their normal equations are small
+    (number of levels squared) and are solved exactly, so no iterative demeaning is needed.
+
+    values (ndarray): N x k (or N) array to residualize (dense or scipy.sparse)
+    fe_codes (list): list of integer code arrays (0..L-1), one per fixed effect
+
+    Returns:
+    ndarray: residualized values with the shape of the input
+    """
+    dummies = sparse.hstack([_indicator_matrix(codes) for codes in fe_codes], format="csr")
+    if sparse.issparse(values):
+        dtv = (dummies.T @ values).toarray()
+        values = values.toarray()
+    else:
+        values = np.asarray(values, dtype=float)
+        dtv = dummies.T @ values
+
+    dtd = (dummies.T @ dummies).toarray()
+    # pseudo-inverse: the dummy blocks of several fixed effects share the constant
+    fe_coefficients = np.linalg.pinv(dtd, hermitian=True) @ dtv
+
+    return values - dummies @ fe_coefficients
+
+
+def binned_design(panel_data, level, workday_split, outcome = "log_total", reference = REFERENCE_BIN):
+    """
+    Builds outcome, regressors and fixed-effect codes of the 2WFE-binned-panel model.
+
+    Rows with missing values are dropped as in PanelOLS. Bin dummies are ordered and named
+    like the coefficients of binned_regression.
+
+    panel_data (DataFrame): output of binned_regression_data (location and year as index)
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    outcome (str): dependent variable
+    reference (str): omitted temperature bin
+
+    Returns:
+    dict: y, X, names, bin_names, bin codes (-1 = reference) and levels, fe_codes and the retained rows (mask)
+    """
+    controls = binned_controls(workday_split)
+    temp_bins = panel_data["temp_bins"].astype(str).to_numpy()
+
+    data = panel_data[[outcome] + controls].apply(pd.to_numeric, errors="coerce")
+    mask = data.notna().all(axis=1).to_numpy() & panel_data["temp_bins"].notna().to_numpy() & (temp_bins != "nan")
+
+    temp_bins = temp_bins[mask]
+    bin_levels = sorted(b for b in np.unique(temp_bins) if b != reference)
+    bin_codes = pd.Index(bin_levels).get_indexer(temp_bins)
+
+    # bin dummies for all non-reference bins (code -1 = reference bin)
+    bin_dummies = np.zeros((len(temp_bins), len(bin_levels)))
+    in_bins = bin_codes >= 0
+    bin_dummies[np.flatnonzero(in_bins), bin_codes[in_bins]] = 1.0
+
+    X = np.column_stack([bin_dummies, data[controls].to_numpy(dtype=float)[mask]])
+    y = data[outcome].to_numpy(dtype=float)[mask]
+
+    entity = panel_data.index.get_level_values(f"{level}LocationID")[mask]
+    time = panel_data.index.get_level_values("Year_fact")[mask]
+    fe_codes = [cluster_codes(entity)[0], cluster_codes(time)[0]]
+
+    bin_names = [bin_coefficient_name(b, reference) for b in bin_levels]
+
+    return {"y": y, "X": X, "names": bin_names + controls, "bin_names": bin_names,
+            "bin_levels": bin_levels, "bin_codes": bin_codes, "fe_codes": fe_codes, "mask": mask}
+
+
+def fit_absorbed_ols(y, X, fe_codes):
+    """
+    OLS after absorbing fixed effects (Frisch-Waugh-Lovell).
+
+    Returns:
+    dict: params, inverse cross-product (xtx_inv), absorbed regressors (X) and residuals (resid)
+    """
+    X_absorbed = absorb_fixed_effects(X, fe_codes)
+    y_absorbed = absorb_fixed_effects(y, fe_codes)
+
+    xtx_inv = np.linalg.inv(X_absorbed.T @ X_absorbed)
+    params = xtx_inv @ (X_absorbed.T @ y_absorbed)
+    resid = y_absorbed - X_absorbed @ params
+
+    return {"params": params, "xtx_inv": xtx_inv, "X": X_absorbed, "resid": resid}
+
+
+def cluster_covariance(X, resid, xtx_inv, clusters, group_debias = False):
+    """
+    One-way or two-way clustered sandwich covariance from integer cluster codes.
+
+    Scores are aggregated per cluster with a sparse indicator product. Two-way clustering
+    (Cameron, Gelbach and Miller) adds both one-way meats and subtracts the meat of the
+    intersection groups. Without group_debias the estimate equals the clustered covariance
+    of linearmodels. The two-way estimate need not be positive semi-definite; as suggested by
+    Cameron, Gelbach and Miller (2011) its negative eigenvalues are then set to zero.
+
+    X (ndarray): N x k (fixed-effect absorbed) regressors
+    resid (ndarray): N residuals
+    xtx_inv (ndarray): inverse of X'X
+    clusters (ndarray): N or N x 2 integer cluster codes
+    group_debias (bool): apply the small-number-of-clusters adjustment g/(g-1) (n-1)/n
+
+    Returns:
+    ndarray: k x k covariance matrix
+    """
+    clusters = np.asarray(clusters)
+    if clusters.ndim == 1:
+        clusters = clusters[:, None]
+    if clusters.shape[1] > 2:
+        raise ValueError("Only one- or two-way clustering is supported.")
+
+    scores = X * resid[:, None]
+    n_obs = len(resid)
+
+    def _meat(codes):
+        codes, n_clusters = cluster_codes(codes)
+        cluster_sums = cluster_scores(scores, codes, n_clusters)
+        meat = cluster_sums.T @ cluster_sums
+        if group_debias:
+            meat *= (n_clusters / (n_clusters - 1)) * ((n_obs - 1) / n_obs)
+        return meat
+
+    if clusters.shape[1] == 1:
+        meat = _meat(clusters[:, 0])
+    else:
+        meat = _meat(clusters[:, 0]) + _meat(clusters[:, 1]) - _meat(combine_codes(clusters[:, 0], clusters[:, 1]))
+        return psd_covariance(xtx_inv @ meat @ xtx_inv)
+
+    return xtx_inv @ meat @ xtx_inv
+
+
+def psd_covariance(cov):
+    """
+    Covariance matrix with negative eigenvalues set to zero (unchanged if positive semi-definite).
+    """
+    cov = (cov + cov.T) / 2
+    eigenvalues, eigenvectors = np.linalg.eigh(cov)
+    if eigenvalues.min() >= 0:
+        return cov
+
+    return (eigenvectors * np.maximum(eigenvalues, 0)) @ eigenvectors.T
+
+
+def clustered_binned_regression(panel_data, level, workday_split, cluster = "entity", group_debias = False):
+    """
+    Estimates the 2WFE-binned-panel model with one- or two-way clustered errors.
+
+    Fast alternative to binned_regression working on integer cluster codes. Errors are clustered
+    by zone by default; e.g. cluster = ["entity", "borough_month_year"] opts into zone x
+    borough-month clustering.
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    cluster (str or list): one or two cluster variables (columns or index levels)
+    group_debias (bool): small-number-of-clusters adjustment
+
+    Returns:
+    DataFrame: coefficient, standard error, t-statistic and 95% CI for all regressors
+    """
+    design = binned_design(panel_data, level, workday_split)
+    fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+
+    clusters = panel_cluster_codes(panel_data, cluster)[design["mask"]]
+    cov = cluster_covariance(fit["X"], fit["resid"], fit["xtx_inv"], clusters, group_debias=group_debias)
+
+    return coefficient_frame(fit["params"], cov, design["names"], len(fit["resid"]))
+
+
+def coefficient_frame(params, cov, names, n_obs):
+    """
+    Coefficient, standard error, t-statistic and 95% CI from estimates and their covariance
+    (covariance and N in attrs, as read by binned_regression.result_record).
+    """
+    se = np.sqrt(np.diag(cov))
+    result = pd.DataFrame({
+        "Coefficient": params,
+        "Std. Error": se,
+        "T-stat": params / se,
+        "Lower CI": params - CRITICAL_VALUE * se,
+        "Upper CI": params + CRITICAL_VALUE * se,
+    }, index=names)
+    result.attrs["cov"] = pd.DataFrame(cov, index=names, columns=names)
+    result.attrs["n_obs"] = n_obs
+
+    return result
+
+
+def rescaled_subsample_covariance(X, resid, xtx_inv, clusters, observation_fraction, cluster_fractions):
+    """
+    Approximate full-sample clustered covariance from a fit on a subsample of clusters and of
+    observations within clusters.
+
+    The clustered covariance is split into the heteroskedasticity-robust part (each observation
+    with itself) and the within-cluster cross products. With the bread growing by 1 / observation_fraction,
+    the first part scales with observation_fraction and the cross products of a cluster variable with
+    its cluster_fraction (share of its clusters in the subsample), e.g. zone_fraction for zone
+    clustering and zone_fraction x day_fraction for the heteroskedasticity-robust part of a zone x day
+    subsample. Two-way clustering rescales the intersection groups as well (as many as observations,
+    cluster_fraction = observation_fraction, if not given).
+
+    X (ndarray): N x k (fixed-effect absorbed) regressors of the subsample
+    resid (ndarray): N residuals
+    xtx_inv (ndarray): inverse of X'X
+    clusters (ndarray): N or N x 2 integer cluster codes
+    observation_fraction (float): subsample observations / full-sample observations
+    cluster_fractions (list): subsample clusters / full-sample clusters per cluster variable (and the
+                              intersection groups as third entry for two-way clustering)
+
+    Returns:
+    ndarray: k x k covariance matrix
+    """
+    clusters = np.asarray(clusters)
+    if clusters.ndim == 1:
+        clusters = clusters[:, None]
+
+    heteroskedastic = cluster_covariance(X, resid, xtx_inv, np.arange(len(resid)))
+    cov = observation_fraction * heteroskedastic
+    for i in range(clusters.shape[1]):
+        cov += cluster_fractions[i] * (cluster_covariance(X, resid, xtx_inv, clusters[:, i]) - heteroskedastic)
+
+    if clusters.shape[1] == 2:
+        intersection = combine_codes(clusters[:, 0], clusters[:, 1])
+        fraction = cluster_fractions[2] if len(cluster_fractions) > 2 else observation_fraction
+        cov -= fraction * (cluster_covariance(X, resid, xtx_inv, intersection) - heteroskedastic)
+
+    return psd_covariance(cov)
+
+
+def _bootstrap_weights(rng, size, weights):
+    """
+    Draws Rademacher or Webb (six-point) wild bootstrap weights.
+    """
+    if weights == "rademacher":
+        return rng.choice(np.array([-1.0, 1.0]), size=size)
+    elif weights == "webb":
+        webb_points = np.array([-np.sqrt(1.5), -1.0, -np.sqrt(0.5), np.sqrt(0.5), 1.0, np.sqrt(1.5)])
+        return rng.choice(webb_points, size=size)
+    raise ValueError(f"Unknown bootstrap weights: {weights}")
+
+
+def wild_cluster_bootstrap(panel_data, level, workday_split, cluster = "entity", n_boot = 9999,
+                           weights = "rademacher", alpha = 0.05, seed = None, batch_size = 1000, impose_null = True):
+    """
+    Wild cluster bootstrap (bootstrap-t) for the temperature-bin coefficients.
+
+    By default the null of a zero coefficient is imposed bin by bin (restricted residuals,
+    WCR), which is more reliable with few clusters; impose_null = False resamples the
+    unrestricted residuals (WCU). Cluster-level score contributions are computed once; every
+    batch of replications is a matrix product of the bootstrap weights (draws x clusters)
+    with these scores, which also yields the bootstrap cluster-robust standard errors
+    without refitting.
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    cluster (str): cluster variable, e.g. "entity" (zone, default) or "borough_month_year"
+    n_boot (int): number of bootstrap replications
+    weights (str): "rademacher" or "webb" (preferable with fewer than ~12 clusters)
+    alpha (float): level of the bootstrap-t confidence intervals
+    seed (int): seed for reproducible draws
+    impose_null (bool): resample residuals of the fit with the coefficient of the bin set to zero
+
+    Returns:
+    DataFrame: coefficient, clustered SE, t-statistic, bootstrap p-value and CI per temperature bin
+               (bootstrap t-statistics in attrs["t_boot"])
+    """
+    design = binned_design(panel_data, level, workday_split)
+    fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+
+    codes, n_clusters = cluster_codes(panel_cluster_codes(panel_data, cluster)[design["mask"], 0])
+    cluster_sum = _indicator_matrix(codes, n_clusters).T.tocsr()
+
+    X, resid, xtx_inv = fit["X"], fit["resid"], fit["xtx_inv"]
+    n_bins = len(design["bin_names"])
+
+    # 1. Observed clustered SE and t-statistic (unrestricted fit)
+    scores_beta = (cluster_sum @ (X * resid[:, None])) @ xtx_inv
+    se = np.sqrt((scores_beta[:, :n_bins] ** 2).sum(axis=0))
+    t_stat = fit["params"][:n_bins] / se
+
+    # 2. Bootstrap scores per bin: w[g] = a_j' S_g (contribution of cluster g to coefficient j) and
+    #    q[g, h] = a_j' X_g'X_g A S_h (effect of cluster h's weight on cluster g's bootstrap score),
+    #    with S_g = X_g'u_g of the restricted (beta_j = 0) or unrestricted residuals u
+    fitted_bins = X @ xtx_inv[:, :n_bins]
+    w, q = [], []
+    for j in range(n_bins):
+        # restricted residuals: u + X A e_j beta_j / A_jj
+        u = resid + fitted_bins[:, j] * (fit["params"][j] / xtx_inv[j, j]) if impose_null else resid
+        scores_j = (cluster_sum @ (X * u[:, None])) @ xtx_inv
+        w.append(scores_j[:, j])
+        q.append((cluster_sum @ (X * fitted_bins[:, [j]])) @ scores_j.T)
+    w = np.column_stack(w)
+
+    # 3. Bootstrap t-statistics in batches of draws
+    rng = np.random.default_rng(seed)
+    t_boot = np.empty((n_boot, n_bins))
+    for start in range(0, n_boot, batch_size):
+        stop = min(start + batch_size, n_boot)
+        v = _bootstrap_weights(rng, (stop - start, n_clusters), weights)
+        delta = v @ w
+        for j in range(n_bins):
+            boot_scores = v * w[:, j] - v @ q[j].T
+            t_boot[start:stop, j] = delta[:, j] / np.sqrt((boot_scores ** 2).sum(axis=1))
+
+    abs_t_boot = np.abs(t_boot)
+    # draws that reproduce the observed statistic up to rounding (all weights equal under the null) count as ties
+    p_values = (abs_t_boot >= np.abs(t_stat) * (1 - 1e-9)).mean(axis=0)
+    critical = np.quantile(abs_t_boot, 1 - alpha, axis=0)
+
+    params = fit["params"][:n_bins]
+    result = pd.DataFrame({
+        "Coefficient": params,
+        "Std. Error": se,
+        "T-stat": t_stat,
+        "Bootstrap p-value": p_values,
+        "Lower CI": params - critical * se,
+        "Upper CI": params + critical * se,
+    }, index=design["bin_names"])
+    result.attrs["n_clusters"] = n_clusters
+    result.attrs["n_boot"] = n_boot
+    result.attrs["t_boot"] = t_boot
+
+    return result
+
+
+def pooled_interaction_regression(panel_data, level, workday_split, groups, cluster = "entity"):
+    """
+    Estimates group-specific temperature-bin effects in one fit of the full panel.
+
+    Replaces the separate fits per income_split / temp_split subset: the bin dummies are
+    interacted with zone-group codes (built as a sparse matrix), while controls and the zone
+    and year fixed effects are shared by all groups. Differences across groups are tested
+    with Wald tests on the clustered covariance.
+
+    The control coefficients and year effects are pooled across groups, so the group effects
+    are not equal to the estimates of separate fits per group. Group x bin cells without
+    observations are dropped from the design; their effects are NaN and they are listed in
+    effects.attrs["dropped_cells"].
+
+    panel_data (DataFrame): output of binned_regression_data without sample split
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    groups (Series): group label by LocationID, e.g. zone_groups(covariates, "temp_quartile")
+    cluster (str or list): one or two cluster variables
+
+    Returns:
+    effects (DataFrame): coefficient, SE and CI per (group, temperature bin), and the difference
+                         to the first group with its p-value
+    tests (DataFrame): Wald test of equal effects across groups per bin and jointly over all bins
+    """
+    design = binned_design(panel_data, level, workday_split)
+    n_bins = len(design["bin_levels"])
+
+    # zone groups of the retained rows (zones without group are dropped)
+    zones = panel_data.index.get_level_values(f"{level}LocationID")[design["mask"]]
+    group_labels = pd.Series(zones).map(groups).to_numpy()
+    keep = pd.notna(group_labels)
+    group_levels = sorted(pd.unique(group_labels[keep]))
+    group_codes = pd.Index(group_levels).get_indexer(group_labels[keep])
+    n_groups = len(group_levels)
+
+    bin_codes = design["bin_codes"][keep]
+    in_bins = np.flatnonzero(bin_codes >= 0)
+    n_effects = n_groups * n_bins
+
+    # sparse group x bin interaction dummies: cell = group * n_bins + bin, empty cells get no column
+    cells = group_codes[in_bins] * n_bins + bin_codes[in_bins]
+    present = np.flatnonzero(np.bincount(cells, minlength=n_effects) > 0)
+    column = np.full(n_effects, -1)
+    column[present] = np.arange(len(present))
+    interactions = sparse.csr_matrix(
+        (np.ones(len(in_bins)), (in_bins, column[cells])),
+        shape=(len(bin_codes), len(present)))
+
+    fe_codes = [cluster_codes(codes[keep])[0] for codes in design["fe_codes"]]
+    controls = design["X"][keep, n_bins:]
+    X = np.column_stack([absorb_fixed_effects(interactions, fe_codes), absorb_fixed_effects(controls, fe_codes)])
+    y = absorb_fixed_effects(design["y"][keep], fe_codes)
+
+    xtx_inv = np.linalg.inv(X.T @ X)
+    params = xtx_inv @ (X.T @ y)
+    resid = y - X @ params
+
+    clusters = panel_cluster_codes(panel_data, cluster)[design["mask"]][keep]
+    cov = cluster_covariance(X, resid, xtx_inv, clusters)
+
+    # 1. Group-specific bin effects (NaN for empty cells) and differences to the first group
+    beta, cov_beta = np.full(n_effects, np.nan), np.full((n_effects, n_effects), np.nan)
+    beta[present] = params[:len(present)]
+    cov_beta[np.ix_(present, present)] = cov[:len(present), :len(present)]
+    se = np.sqrt(np.diag(cov_beta))
+    critical = CRITICAL_VALUE
+
+    base = np.tile(np.arange(n_bins), n_groups)
+    difference = beta - beta[base]
+    var_difference = np.diag(cov_beta) + np.diag(cov_beta)[base] - 2 * cov_beta[np.arange(n_effects), base]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        difference_p = np.where(np.arange(n_effects) >= n_bins,
+                                2 * stats.norm.sf(np.abs(difference) / np.sqrt(var_difference)), np.nan)
+
+    effects = pd.DataFrame({
+        "Coefficient": beta,
+        "Std. Error": se,
+        "Lower CI": beta - critical * se,
+        "Upper CI": beta + critical * se,
+        f"Difference to {group_levels[0]}": difference,
+        "Difference p-value": difference_p,
+    }, index=pd.MultiIndex.from_product([group_levels, design["bin_levels"]], names=["group", "temp_bins"]))
+    effects.attrs["dropped_cells"] = list(effects.index[np.setdiff1d(np.arange(n_effects), present)])
+
+    # 2. Wald tests of equal effects across groups: R beta = 0 with rows beta_gb - beta_0b
+    def _wald(bins):
+        rows = [(column[g * n_bins + b], column[b]) for g in range(1, n_groups) for b in bins]
+        rows = [(col, base_col) for col, base_col in rows if col >= 0 and base_col >= 0]
+        if not rows:
+            return np.nan, 0, np.nan
+        R = np.zeros((len(rows), len(present)))
+        for r, (col, base_col) in enumerate(rows):
+            R[r, col], R[r, base_col] = 1.0, -1.0
+        Rb = R @ params[:len(present)]
+        stat = float(Rb @ np.linalg.pinv(R @ cov[:len(present), :len(present)] @ R.T) @ Rb)
+        return stat, len(rows), stats.chi2.sf(stat, len(rows))
+
+    tests = pd.DataFrame([_wald([b]) for b in range(n_bins)] + [_wald(range(n_bins))],
+                         columns=["Wald statistic", "df", "p-value"],
+                         index=pd.Index(design["bin_levels"] + ["joint"], name="temp_bins"))
+
+    return effects, tests
+
+
+def bin_size_sweep(panel_data, level, workday_split, bin_sizes = (2, 3, 4, 5), cluster = "entity", reference_temp = 18.5):
+    """
+    Re-estimates the binned model for several temperature bin widths at almost no extra cost.
+
+    Outcome and controls are residualized on the fixed effects once and the control block is
+    factorized once (Frisch-Waugh-Lovell). For each bin width only the bin-indicator block is
+    rebuilt from tmax_obs, absorbed and projected off the controls. All widths use the same
+    sample: observations inside the bin range of every width.
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    bin_sizes (tuple): bin widths in °C
+    cluster (str or list): one or two cluster variables
+    reference_temp (float): the bin containing this temperature is omitted (17-20°C for 3°C bins)
+
+    Returns:
+    DataFrame: one row per bin width and bin with midpoint temperature, coefficient, clustered
+               SE, 95% CI and number of days in the bin (omitted bin has coefficient 0)
+    """
+    controls = binned_controls(workday_split)
+    data = panel_data[["log_total", "tmax_obs"] + controls].apply(pd.to_numeric, errors="coerce")
+    tmax = data["tmax_obs"].to_numpy()
+
+    bins = {size: temperature_bin_codes(tmax, size) for size in bin_sizes}
+    mask = data.notna().all(axis=1).to_numpy().copy()
+    for codes, _, _ in bins.values():
+        mask &= codes >= 0
+
+    entity = panel_data.index.get_level_values(f"{level}LocationID")[mask]
+    time = panel_data.index.get_level_values("Year_fact")[mask]
+    fe_codes = [cluster_codes(entity)[0], cluster_codes(time)[0]]
+    clusters = panel_cluster_codes(panel_data, cluster)[mask]
+    dates = pd.to_datetime(panel_data["date_pickup"]).to_numpy()[mask]
+
+    # 1. Fixed effects and controls are absorbed once
+    C = absorb_fixed_effects(data[controls].to_numpy(dtype=float)[mask], fe_codes)
+    y = absorb_fixed_effects(data["log_total"].to_numpy(dtype=float)[mask], fe_codes)
+    C_factor = linalg.cho_factor(C.T @ C)
+    y_c = y - C @ linalg.cho_solve(C_factor, C.T @ y)
+
+    results = []
+    for size, (codes, labels, midpoints) in bins.items():
+        codes = codes[mask]
+        reference = int(np.searchsorted(midpoints - size / 2, reference_temp, side="left")) - 1
+        present = np.unique(codes)
+        estimated = [b for b in present if b != reference]
+
+        # 2. Swap in the bin block: absorb fixed effects, project off the controls
+        column = pd.Index(estimated).get_indexer(codes)
+        rows = np.flatnonzero(column >= 0)
+        D = sparse.csr_matrix((np.ones(len(rows)), (rows, column[rows])), shape=(len(codes), len(estimated)))
+        D = absorb_fixed_effects(D, fe_codes)
+        D_c = D - C @ linalg.cho_solve(C_factor, C.T @ D)
+
+        xtx_inv = np.linalg.inv(D_c.T @ D_c)
+        params = xtx_inv @ (D_c.T @ y_c)
+        resid = y_c - D_c @ params
+        se = np.sqrt(np.diag(cluster_covariance(D_c, resid, xtx_inv, clusters)))
+
+        days = pd.DataFrame({"date": dates, "bin": codes}).drop_duplicates()["bin"].value_counts()
+
+        width_results = pd.DataFrame({
+            "bin_size": size,
+            "temp_bins": [labels[b] for b in estimated] + [labels[reference]],
+            "Temperature": np.append(midpoints[estimated], midpoints[reference]),
+            "Coefficient": np.append(params, 0.0),
+            "Std. Error": np.append(se, 0.0),
+            "Days": days.reindex(estimated + [reference]).to_numpy(),
+        })
+        results.append(width_results)
+
+    results = pd.concat(results, ignore_index=True)
+    results["Lower CI"] = results["Coefficient"] - CRITICAL_VALUE * results["Std. Error"]
+    results["Upper CI"] = results["Coefficient"] + CRITICAL_VALUE * results["Std. Error"]
+
+    return results.sort_values(["bin_size", "Temperature"]).reset_index(drop=True)
+
+
+def permutation_inference(panel_data, level, workday_split, n_draws = 1000, alpha = 0.05, seed = None):
+    """
+    Randomization inference for the temperature-bin coefficients: daily temperatures (and
+    hence temperature bins) are permuted across days within year-month and the binned model
+    is re-estimated for every draw.
+
+    Only the bin-indicator block changes between draws. Outcome and controls are absorbed and
+    the control block is factorized once; per draw, all cross-products of the bin block with
+    the fixed effects, controls and outcome are bincounts over the rows, so a draw costs a
+    few passes over the data and a solve of size (number of bins).
+
+    panel_data (DataFrame): output of binned_regression_data (one temperature per day)
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    n_draws (int): number of permutations
+    alpha (float): level of the placebo interval
+    seed (int): seed for reproducible draws
+
+    Returns:
+    DataFrame: coefficient, placebo mean, SD and interval, and permutation p-value per temperature bin;
+               the placebo draws (n_draws x bins) are in attrs["draws"]
+    """
+    design = binned_design(panel_data, level, workday_split)
+    n_bins = len(design["bin_names"])
+    fe_codes = design["fe_codes"]
+
+    # 1. Day-level bins and year-month strata
+    dates = pd.to_datetime(panel_data["date_pickup"]).to_numpy()[design["mask"]]
+    day_codes, n_days = cluster_codes(dates)
+    day_bins = np.full(n_days, -2)
+    day_bins[day_codes] = design["bin_codes"]
+    if not np.array_equal(day_bins[day_codes], design["bin_codes"]):
+        raise ValueError("Permutation inference requires one temperature bin per day.")
+
+    day_dates = pd.DatetimeIndex(np.unique(dates))
+    strata = day_dates.year.to_numpy() * 12 + day_dates.month.to_numpy()
+    stratum_order = np.lexsort((np.arange(n_days), strata))
+
+    # 2. Absorbed controls and outcome, factorized once
+    C = absorb_fixed_effects(design["X"][:, n_bins:], fe_codes)
+    y = absorb_fixed_effects(design["y"], fe_codes)
+    C_factor = linalg.cho_factor(C.T @ C)
+    y_c = y - C @ linalg.cho_solve(C_factor, C.T @ y)
+
+    # fixed-effect normal equations: dummy counts per level, pseudo-inverse of F'F
+    fe_dummies = sparse.hstack([_indicator_matrix(codes) for codes in fe_codes], format="csr")
+    fe_pinv = np.linalg.pinv((fe_dummies.T @ fe_dummies).toarray(), hermitian=True)
+    n_levels = [int(codes.max()) + 1 for codes in fe_codes]
+
+    def _fit(bin_codes):
+        in_bins = bin_codes >= 0
+        codes = bin_codes[in_bins]
+
+        # F'D: (level, bin) counts per fixed effect; D'C and D'y_c: sums by bin
+        FtD = np.vstack([np.bincount(fe[in_bins] * n_bins + codes, minlength=L * n_bins).reshape(L, n_bins)
+                         for fe, L in zip(fe_codes, n_levels)])
+        DtC = np.column_stack([np.bincount(codes, weights=C[in_bins, j], minlength=n_bins) for j in range(C.shape[1])])
+        Dty = np.bincount(codes, weights=y_c[in_bins], minlength=n_bins)
+
+        DtMD = np.diag(np.bincount(codes, minlength=n_bins).astype(float)) - FtD.T @ fe_pinv @ FtD
+        DcDc = DtMD - DtC @ linalg.cho_solve(C_factor, DtC.T)
+
+        return np.linalg.solve(DcDc, Dty)
+
+    params = _fit(design["bin_codes"])
+
+    # 3. Placebo draws: permute the day bins within year-month
+    rng = np.random.default_rng(seed)
+    draws = np.empty((n_draws, n_bins))
+    permuted_bins = np.empty(n_days, dtype=day_bins.dtype)
+    for b in range(n_draws):
+        shuffled = np.lexsort((rng.random(n_days), strata))
+        permuted_bins[stratum_order] = day_bins[shuffled]
+        draws[b] = _fit(permuted_bins[day_codes])
+
+    p_values = (1 + (np.abs(draws) >= np.abs(params)).sum(axis=0)) / (1 + n_draws)
+
+    result = pd.DataFrame({
+        "Coefficient": params,
+        "Placebo Mean": draws.mean(axis=0),
+        "Placebo SD": draws.std(axis=0, ddof=1),
+        "Placebo Lower": np.quantile(draws, alpha / 2, axis=0),
+        "Placebo Upper": np.quantile(draws, 1 - alpha / 2, axis=0),
+        "Permutation p-value": p_values,
+    }, index=design["bin_names"])
+    result.attrs["draws"] = pd.DataFrame(draws, columns=design["bin_names"])
+    result.attrs["n_draws"] = n_draws
+
+    return result
+
+
+def jackknife_zones(panel_data, level, workday_split):
+    """
+    Leave-one-zone-out jackknife of the binned model with influence statistics per zone.
+
+    Zone fixed effects are removed by within-zone demeaning, which is local to each zone, and
+    year effects enter as dummies. The full-sample cross-products are then the sum of the
+    per-zone cross-products, so dropping a zone amounts to downdating the totals by that
+    zone's contribution; all leave-one-out systems are solved as one stack instead of
+    re-fitting the model once per zone.
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+
+    Returns:
+    tuple: (DataFrame with coefficient, jackknife SE and bias per temperature bin,
+            DataFrame indexed by zone with number of observations, DFBETA per bin (coefficient
+            without the zone minus full-sample coefficient), maximal |DFBETAS| and a Cook-type distance)
+    """
+    design = binned_design(panel_data, level, workday_split)
+    n_bins = len(design["bin_names"])
+    zone_codes, time_codes = design["fe_codes"]
+    n_zones = int(zone_codes.max()) + 1
+    zones = np.unique(panel_data.index.get_level_values(f"{level}LocationID")[design["mask"]])
+
+    # 1. Regressors with year dummies (first year omitted), demeaned within zone
+    year_dummies = _indicator_matrix(time_codes).toarray()[:, 1:]
+    W = np.column_stack([design["X"], year_dummies, design["y"]])
+    n_obs = np.bincount(zone_codes, minlength=n_zones)
+    zone_means = np.column_stack([np.bincount(zone_codes, weights=W[:, j], minlength=n_zones) for j in range(W.shape[1])]) / n_obs[:, None]
+    W = W - zone_means[zone_codes]
+
+    # 2. Per-zone cross-products and leave-one-out downdates of the totals
+    cross = grouped_crossproducts(W, W, zone_codes, n_zones)
+    total = cross.sum(axis=0)
+    k = W.shape[1] - 1
+    params = np.linalg.solve(total[:k, :k], total[:k, k])
+
+    loo = total[None] - cross
+    loo_params = np.einsum("gij,gj->gi", np.linalg.pinv(loo[:, :k, :k], hermitian=True), loo[:, :k, k])
+
+    # 3. Jackknife covariance and influence of each zone on the temperature-bin coefficients
+    dfbeta = loo_params[:, :n_bins] - params[:n_bins]
+    centered = loo_params[:, :n_bins] - loo_params[:, :n_bins].mean(axis=0)
+    jackknife_cov = (n_zones - 1) / n_zones * centered.T @ centered
+    jackknife_se = np.sqrt(np.diag(jackknife_cov))
+
+    cook = np.einsum("gi,ij,gj->g", dfbeta, np.linalg.pinv(jackknife_cov, hermitian=True), dfbeta) / n_bins
+
+    summary = pd.DataFrame({
+        "Coefficient": params[:n_bins],
+        "Jackknife SE": jackknife_se,
+        "Jackknife Bias": (n_zones - 1) * (loo_params[:, :n_bins].mean(axis=0) - params[:n_bins]),
+    }, index=design["bin_names"])
+
+    influence = pd.DataFrame(dfbeta, columns=design["bin_names"], index=pd.Index(zones, name=f"{level}LocationID"))
+    influence.insert(0, "n_obs", n_obs)
+    influence["max |DFBETAS|"] = np.abs(dfbeta / jackknife_se).max(axis=1)
+    influence["Cook's distance"] = cook
+
+    return summary, influence
+
+
+def _day_zone_grid(day_index, zone_codes, values, n_days, n_zones, fill):
+    """
+    Dense (day x zone) array of a panel variable. Zone-days without an observation keep fill.
+    """
+    grid = np.full((n_days, n_zones), fill, dtype=np.result_type(values, np.asarray(fill)))
+    grid[day_index, zone_codes] = values
+
+    return grid
+
+
+def distributed_lag_regression(panel_data, level, workday_split, n_lags = 3, heat_threshold = None, cluster = "entity"):
+    """
+    Distributed-lag version of the binned model: temperature bins of the same day and of the
+    n_lags previous days, optionally with the length of the current heat wave.
+
+    Lagged bin indicators are read from a dense (calendar day x zone) array of bin codes
+    shifted by the lag, so no groupby-shift or merge on the long panel is needed. Rows whose
+    lagged zone-days are not observed are dropped. Estimated with zone and year fixed effects
+    and clustered errors (clustered_binned_regression).
+
+    Lags are built from the full calendar: panel_data must be the unsplit panel (workday_split
+    = "None" in binned_regression_data), the weekday or weekend rows are selected afterwards,
+    so e.g. a Monday keeps the weekend days as its lags.
+
+    panel_data (DataFrame): output of binned_regression_data without workday split
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - rows estimated on. "None" if no split
+    n_lags (int): number of lagged days
+    heat_threshold (float): tmax_obs (°C) of a hot day; adds heat_wave_days, the number of
+                            consecutive hot days up to and including the day (0 on other days;
+                            an unobserved zone-day ends the spell)
+    cluster (str or list): one or two cluster variables
+
+    Returns:
+    tuple: (DataFrame with coefficient, SE, t-statistic and 95% CI of all regressors,
+            DataFrame with the cumulative effect over all lags per temperature bin)
+    """
+    design = binned_design(panel_data, level, "None")
+    bin_codes, n_bins = design["bin_codes"], len(design["bin_names"])
+    zone_codes, n_zones = design["fe_codes"][0], int(design["fe_codes"][0].max()) + 1
+
+    # rows of the split, selected after building the lags on the full calendar
+    sample = np.ones(len(bin_codes), dtype=bool)
+    if workday_split == "weekday" or workday_split == "weekend":
+        weekday = panel_data["weekday"].to_numpy()[design["mask"]]
+        if len(np.unique(weekday)) < 2:
+            raise ValueError("distributed_lag_regression needs the full-calendar panel (workday_split = 'None' "
+                             "in binned_regression_data); the weekday or weekend rows are selected after building the lags.")
+        sample = weekday == (1 if workday_split == "weekday" else 0)
+
+    dates = pd.to_datetime(panel_data["date_pickup"]).to_numpy()[design["mask"]]
+    day_index = ((dates - dates.min()) // np.timedelta64(1, "D")).astype(np.int64)
+    n_days = int(day_index.max()) + 1
+
+    # 1. Lagged bin codes from the shifted (day x zone) array (-2: day not observed)
+    grid = _day_zone_grid(day_index, zone_codes, bin_codes, n_days, n_zones, -2)
+    lag_codes = [np.where(day_index >= lag, grid[np.maximum(day_index - lag, 0), zone_codes], -2) for lag in range(n_lags + 1)]
+    valid = np.all([codes != -2 for codes in lag_codes], axis=0) & sample
+
+    blocks, names = [], []
+    for lag, codes in enumerate(lag_codes):
+        codes = codes[valid]
+        dummies = np.zeros((len(codes), n_bins))
+        rows = np.flatnonzero(codes >= 0)
+        dummies[rows, codes[rows]] = 1.0
+        blocks.append(dummies)
+        names += design["bin_names"] if lag == 0 else [f"L{lag}.{name}" for name in design["bin_names"]]
+
+    # 2. Heat-wave length: consecutive hot days along the day axis
+    if heat_threshold is not None:
+        tmax = pd.to_numeric(panel_data["tmax_obs"], errors="coerce").to_numpy(dtype=float)[design["mask"]]
+        hot = _day_zone_grid(day_index, zone_codes, tmax, n_days, n_zones, np.nan) >= heat_threshold
+        day_numbers = np.arange(n_days)[:, None]
+        last_cool_day = np.maximum.accumulate(np.where(hot, -1, day_numbers), axis=0)
+        spell = np.where(hot, day_numbers - last_cool_day, 0)
+        blocks.append(spell[day_index, zone_codes][valid, None].astype(float))
+        names.append("heat_wave_days")
+
+    controls = binned_controls(workday_split)
+    blocks.append(design["X"][valid][:, [design["names"].index(name) for name in controls]])
+    X = np.column_stack(blocks)
+    fe_codes = [cluster_codes(codes[valid])[0] for codes in design["fe_codes"]]
+
+    fit = fit_absorbed_ols(design["y"][valid], X, fe_codes)
+    clusters = panel_cluster_codes(panel_data, cluster)[design["mask"]][valid]
+    cov = cluster_covariance(fit["X"], fit["resid"], fit["xtx_inv"], clusters)
+
+    se = np.sqrt(np.diag(cov))
+    names += controls
+    result = pd.DataFrame({
+        "Coefficient": fit["params"],
+        "Std. Error": se,
+        "T-stat": fit["params"] / se,
+        "Lower CI": fit["params"] - CRITICAL_VALUE * se,
+        "Upper CI": fit["params"] + CRITICAL_VALUE * se,
+    }, index=names)
+    result.attrs["cov"] = pd.DataFrame(cov, index=names, columns=names)
+    result.attrs["n_obs"] = len(fit["resid"])
+
+    # 3. Cumulative effect of a day in a bin over all lags
+    weights = np.zeros((n_bins, len(names)))
+    for lag in range(n_lags + 1):
+        weights[np.arange(n_bins), lag * n_bins + np.arange(n_bins)] = 1.0
+    cumulative_params = weights @ fit["params"]
+    cumulative_se = np.sqrt(np.einsum("ij,jk,ik->i", weights, cov, weights))
+
+    cumulative = pd.DataFrame({
+        "Cumulative Coefficient": cumulative_params,
+        "Std. Error": cumulative_se,
+        "Lower CI": cumulative_params - CRITICAL_VALUE * cumulative_se,
+        "Upper CI": cumulative_params + CRITICAL_VALUE * cumulative_se,
+    }, index=design["bin_names"])
+
+    return result, cumulative
@@ -0,0 +1,76 @@
+## Headless batch rendering of binned coefficient plots
+
+import os
+import matplotlib
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from binned_regression import coefficient_table, plot_binned_coefficients
+from result_store import DEFAULT_STORE, load_results
+
+
+def _use_agg():
+    """
+    Worker initializer: render without a display.
+    """
+    matplotlib.use("Agg", force=True)
+    plt.switch_backend("Agg")
+
+
+def _render(job, dpi):
+    """
+    Worker: draws one figure from its tidy table and writes it to job["path"].
+    """
+    fig = plot_binned_coefficients(job["table"], job["bin_days"], ylabel=job.get("ylabel", "Trip number response in %"))
+    if job.get("title"):
+        fig.axes[0].set_title(job["title"])
+
+    if os.path.dirname(job["path"]):
+        os.makedirs(os.path.dirname(job["path"]), exist_ok=True)
+    fig.savefig(job["path"], dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+
+    return job["path"]
+
+
+def render_coefficient_figures(jobs, max_workers = None, dpi = 150):
+    """
+    Renders many coefficient figures in parallel worker processes on the Agg backend.
+
+    jobs (list): dicts with table (coefficient_table), bin_days (days per bin), path (.png or .pdf)
+                 and optional ylabel and title
+    max_workers (int): number of worker processes
+    dpi (int): resolution of raster output
+
+    Returns:
+    list: paths of the written figures, in the order of jobs
+    """
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_use_agg) as executor:
+        paths = list(executor.map(_render, jobs, [dpi] * len(jobs)))
+
+    return paths
+
+
+def figure_jobs_from_store(keys, directory, store = DEFAULT_STORE, file_format = "png", percent = True):
+    """
+    Builds render jobs from results in the result store, one figure per key.
+
+    keys (list or dict): result keys, or key -> file name (without extension)
+    directory (str): output directory
+    store (str): SQLite file of the result store
+    file_format (str): "png" or "pdf"
+    percent (bool): coefficients in percent (log outcome)
+
+    Returns:
+    list: jobs for render_coefficient_figures
+    """
+    names = keys if isinstance(keys, dict) else {key: key[:12] for key in keys}
+
+    jobs = []
+    for key, name in names.items():
+        record = load_results(key, store)
+        if record is None:
+            raise KeyError(f"No result with key {key} in {store}")
+        jobs.append({"table": coefficient_table(record, percent=percent), "bin_days": record["bin_days"],
+                     "path": os.path.join(directory, f"{name}.{file_format}")})
+
+    return jobs
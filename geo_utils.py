@@ -0,0 +1,29 @@
+## Great-circle helpers shared by the spatial modules (KD-tree searches on unit-sphere coordinates)
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def unit_sphere(lon, lat):
+    """
+    3D coordinates on the unit sphere of points in degrees: chord distances between them are
+    monotone in the great-circle distance, so KD-tree searches on them find the nearest points.
+    """
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chords):
+    """
+    Great-circle distance in km of unit-sphere chord lengths.
+    """
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1.0))
+
+
+def km_to_chord(distance_km):
+    """
+    Unit-sphere chord length of a great-circle distance in km (e.g. a KD-tree search radius).
+    """
+    return 2 * np.sin(distance_km / (2 * EARTH_RADIUS_KM))
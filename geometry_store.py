@@ -0,0 +1,145 @@
+## Binary geometry store: WKB with precomputed bounds and centroids instead of repeated WKT parsing
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+
+GEOMETRY_DIR = "Data/geometry_store"
+
+
+def _source_stamp(source):
+    """
+    Helper function identifying the version of a source file by path, size and modification time.
+    """
+    return [os.path.abspath(source), os.path.getsize(source), os.path.getmtime(source)]
+
+
+def store_path(source, geometry_column = "geometry", directory = GEOMETRY_DIR):
+    """
+    Directory of the stored geometries of a source file (one per source and geometry column).
+    """
+    digest = hashlib.sha256(f"{os.path.abspath(source)}|{geometry_column}".encode()).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(source))[0]
+
+    return os.path.join(directory, f"{name}_{digest}")
+
+
+def _parse_source(source, geometry_column, crs):
+    """
+    Helper function reading a source the slow way: WKT column of a CSV or a vector file (shapefile, ...).
+    """
+    if source.lower().endswith(".csv"):
+        frame = pd.read_csv(source)
+        frame[geometry_column] = gpd.GeoSeries.from_wkt(frame[geometry_column]).array
+        return gpd.GeoDataFrame(frame, geometry=geometry_column, crs=crs)
+
+    gdf = gpd.read_file(source)
+    return gdf.rename_geometry(geometry_column) if gdf.geometry.name != geometry_column else gdf
+
+
+def write_geometry_store(gdf, path, source_stamp = None):
+    """
+    Writes a GeoDataFrame as WKB (one byte buffer with offsets), bounds, centroids and the attribute columns.
+
+    gdf (geopandas.GeoDataFrame): geometries with attributes
+    path (str): directory of the store
+    source_stamp (list): version of the source file the geometries were read from
+
+    Returns:
+    str: path of the store
+    """
+    os.makedirs(path, exist_ok=True)
+    geoms = np.asarray(gdf.geometry.array)
+
+    # 1. WKB of all geometries in one buffer (missing geometries have length -1)
+    wkb = shapely.to_wkb(geoms)
+    lengths = np.array([-1 if b is None else len(b) for b in wkb], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.maximum(lengths, 0))])
+    buffer = np.frombuffer(b"".join(b for b in wkb if b is not None), dtype=np.uint8)
+
+    # 2. Bounds and centroids in the CRS of the geometries
+    bounds = shapely.bounds(geoms)
+    centroid_points = shapely.centroid(geoms)
+    centroids = np.column_stack([shapely.get_x(centroid_points), shapely.get_y(centroid_points)])
+
+    np.savez(os.path.join(path, "geometry.npz"), buffer=buffer, offsets=offsets, lengths=lengths, bounds=bounds, centroids=centroids)
+    pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).to_pickle(os.path.join(path, "attributes.pkl"))
+
+    meta = {"geometry_column": gdf.geometry.name, "columns": [str(c) for c in gdf.columns],
+            "crs": gdf.crs.to_wkt() if gdf.crs is not None else None, "source": source_stamp}
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    return path
+
+
+def _load_meta(path):
+    meta_file = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        return json.load(f)
+
+
+def _ensure_store(source, geometry_column, crs, directory, refresh):
+    """
+    Helper function returning the store of a source, (re)building it when missing or when the source changed.
+    """
+    path = store_path(source, geometry_column, directory)
+    meta = _load_meta(path)
+    if refresh or meta is None or meta["source"] != _source_stamp(source):
+        write_geometry_store(_parse_source(source, geometry_column, crs), path, _source_stamp(source))
+
+    return path
+
+
+def read_geometries(source, geometry_column = "geometry", crs = "EPSG:4326", directory = GEOMETRY_DIR, refresh = False):
+    """
+    Reads a geometry source through the binary store: the first call parses the WKT (or shapefile)
+    and writes the store, later calls decode WKB only. The store is rebuilt when the source file changes.
+
+    source (str): CSV with a WKT column or a vector file readable by geopandas
+    geometry_column (str): name of the WKT column (and of the geometry column of the result)
+    crs (str): CRS of the WKT coordinates of a CSV source
+    directory (str): directory of the geometry stores
+    refresh (bool): rebuild the store
+
+    Returns:
+    geopandas.GeoDataFrame: the source with parsed geometries, columns in the source order
+    """
+    path = _ensure_store(source, geometry_column, crs, directory, refresh)
+    meta = _load_meta(path)
+
+    with np.load(os.path.join(path, "geometry.npz")) as stored:
+        buffer, offsets, lengths = stored["buffer"], stored["offsets"], stored["lengths"]
+
+    wkb = np.array([None if length < 0 else buffer[start:start + length].tobytes() for start, length in zip(offsets[:-1], lengths)], dtype=object)
+    attributes = pd.read_pickle(os.path.join(path, "attributes.pkl"))
+    attributes[meta["geometry_column"]] = shapely.from_wkb(wkb)
+
+    return gpd.GeoDataFrame(attributes[meta["columns"]], geometry=meta["geometry_column"], crs=meta["crs"])
+
+
+def read_geometry_table(source, geometry_column = "geometry", crs = "EPSG:4326", directory = GEOMETRY_DIR, refresh = False):
+    """
+    Attributes of a geometry source with the precomputed bounds and centroids, without decoding any geometry
+    (e.g. zone labels and positions for maps).
+
+    Returns:
+    DataFrame: attribute columns with minx, miny, maxx, maxy, centroid_x and centroid_y
+    """
+    path = _ensure_store(source, geometry_column, crs, directory, refresh)
+
+    with np.load(os.path.join(path, "geometry.npz")) as stored:
+        bounds, centroids = stored["bounds"], stored["centroids"]
+
+    table = pd.read_pickle(os.path.join(path, "attributes.pkl"))
+    table[["minx", "miny", "maxx", "maxy"]] = bounds
+    table[["centroid_x", "centroid_y"]] = centroids
+
+    return table
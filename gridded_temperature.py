@@ -0,0 +1,189 @@
+## Zone-day temperature exposure from daily gridded temperature files
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+
+ZONE_DAY_TEMPERATURE = "Data/NYC_weather/zone_day_temperature.npz"
+
+
+def zone_area_weights(taxi_zones, transform, shape):
+    """
+    Area weights of the grid cells in each taxi zone: share of the zone area falling into each cell.
+
+    Grid cells are intersected only with the zones whose bounding window they fall into; weights of
+    a zone sum to one over the part of the zone covered by the grid.
+
+    Parameters:
+    taxi_zones (geopandas.GeoDataFrame): zone polygons in the CRS of the grid
+    transform (Affine or tuple): affine transform of the grid (a, b, c, d, e, f) without rotation
+    shape (tuple): grid height and width
+
+    Returns:
+    scipy.sparse.csr_matrix: zones x (height * width) area weights (row-major cell order)
+    """
+    a, _, c, _, e, f = tuple(transform)[:6]
+    height, width = shape
+
+    rows, cols, values = [], [], []
+    for i, geom in enumerate(taxi_zones.geometry.array):
+        if geom is None or geom.is_empty:
+            continue
+
+        # 1. Cell window of the zone bounds (works for north-up and south-up grids)
+        minx, miny, maxx, maxy = geom.bounds
+        col_edges, row_edges = (np.array([minx, maxx]) - c) / a, (np.array([miny, maxy]) - f) / e
+        col_0, col_1 = max(int(np.floor(col_edges.min())), 0), min(int(np.ceil(col_edges.max())), width)
+        row_0, row_1 = max(int(np.floor(row_edges.min())), 0), min(int(np.ceil(row_edges.max())), height)
+        if col_0 >= col_1 or row_0 >= row_1:
+            continue
+
+        # 2. Intersection areas of the zone with the cells of its window
+        window_rows, window_cols = (grid.ravel() for grid in np.mgrid[row_0:row_1, col_0:col_1])
+        x_0, y_0 = c + window_cols * a, f + window_rows * e
+        cells = shapely.box(np.minimum(x_0, x_0 + a), np.minimum(y_0, y_0 + e), np.maximum(x_0, x_0 + a), np.maximum(y_0, y_0 + e))
+        areas = shapely.area(shapely.intersection(geom, cells))
+
+        inside = areas > 0
+        rows.append(np.full(inside.sum(), i))
+        cols.append(window_rows[inside] * width + window_cols[inside])
+        values.append(areas[inside] / areas[inside].sum())
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=int)
+    values = np.concatenate(values) if values else np.empty(0)
+
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(taxi_zones), height * width))
+
+
+def netcdf_chunks(path, variable, chunk_days = 31, time = "time", lon = "lon", lat = "lat"):
+    """
+    Streams a daily NetCDF grid in chunks of days.
+
+    Yields:
+    tuple: (dates, array of shape days x height x width) - the first item is (transform, shape) of the grid
+    """
+    import xarray as xr
+
+    with xr.open_dataset(path) as dataset:
+        x, y = dataset[lon].to_numpy(), dataset[lat].to_numpy()
+        # cell-centre coordinates of a regular grid -> transform of the cell edges
+        a, e = x[1] - x[0], y[1] - y[0]
+        yield (a, 0.0, x[0] - a / 2, 0.0, e, y[0] - e / 2), (len(y), len(x))
+
+        data = dataset[variable].transpose(time, lat, lon)
+        dates = pd.to_datetime(dataset[time].to_numpy())
+        for start in range(0, len(dates), chunk_days):
+            yield dates[start:start + chunk_days], data.isel({time: slice(start, start + chunk_days)}).to_numpy()
+
+
+def geotiff_chunks(path, dates, chunk_days = 31):
+    """
+    Streams a GeoTIFF stack with one band per day in chunks of days.
+
+    dates (array): date of each band
+
+    Yields:
+    tuple: (dates, array of shape days x height x width) - the first item is (transform, shape) of the grid
+    """
+    import rasterio
+
+    dates = pd.to_datetime(dates)
+    with rasterio.open(path) as raster:
+        yield raster.transform, (raster.height, raster.width)
+
+        for start in range(0, raster.count, chunk_days):
+            bands = list(range(start + 1, min(start + chunk_days, raster.count) + 1))
+            values = raster.read(bands).astype(float)
+            if raster.nodata is not None:
+                values[values == raster.nodata] = np.nan
+            yield dates[start:start + len(bands)], values
+
+
+def zone_day_exposure(chunks, weights, offset = 0.0):
+    """
+    Aggregates chunks of daily grids to zone-day mean (area weighted) and max temperature.
+
+    Missing cells (NaN) are left out of the weighted mean; the max is taken over all cells
+    intersecting the zone.
+
+    chunks (iterable): (dates, array days x height x width) per chunk
+    weights (scipy.sparse.csr_matrix): zone x cell area weights of the grid (zone_area_weights)
+    offset (float): added to the values, e.g. -273.15 for Kelvin
+
+    Returns:
+    dict: dates, zone-day mean and max arrays (day x zone, float32)
+    """
+    weights = sparse.csr_matrix(weights)
+    n_zones = weights.shape[0]
+    nonempty = np.flatnonzero(np.diff(weights.indptr) > 0)
+
+    dates, means, maxima = [], [], []
+    for chunk_dates, values in chunks:
+        values = np.asarray(values, dtype=float).reshape(len(chunk_dates), -1) + offset
+        valid = np.isfinite(values)
+
+        # 1. Area-weighted mean over valid cells
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (weights @ np.where(valid, values, 0.0).T).T / (weights @ valid.T.astype(float)).T
+
+        # 2. Max over the cells of each zone (cells grouped by zone in CSR order)
+        maximum = np.full((len(chunk_dates), n_zones), np.nan)
+        if len(nonempty):
+            with np.errstate(invalid="ignore"):
+                maximum[:, nonempty] = np.fmax.reduceat(values[:, weights.indices], weights.indptr[nonempty], axis=1)
+
+        dates.append(np.asarray(chunk_dates, dtype="datetime64[D]"))
+        means.append(mean.astype(np.float32))
+        maxima.append(maximum.astype(np.float32))
+
+    return {"dates": np.concatenate(dates), "mean": np.vstack(means), "max": np.vstack(maxima)}
+
+
+def ingest_gridded_temperature(chunks, taxi_zones, output = ZONE_DAY_TEMPERATURE, offset = 0.0):
+    """
+    Ingest stage: streams a daily gridded temperature file chunk by chunk and writes the compact
+    (day, zone) mean and max exposure arrays.
+
+    chunks (iterator): netcdf_chunks or geotiff_chunks of the file
+    taxi_zones (geopandas.GeoDataFrame): zones with location_i, in the CRS of the grid
+    output (str): .npz file of the zone-day arrays
+    offset (float): added to the values, e.g. -273.15 for Kelvin
+
+    Returns:
+    str: path of the written file
+    """
+    transform, shape = next(chunks)
+    weights = zone_area_weights(taxi_zones, transform, shape)
+    exposure = zone_day_exposure(chunks, weights, offset)
+
+    np.savez_compressed(output, zones=taxi_zones['location_i'].to_numpy(dtype=np.int64), **exposure)
+
+    return output
+
+
+def zone_temperature_lookup(date_pickup, location_ids, path = ZONE_DAY_TEMPERATURE, statistic = "max"):
+    """
+    Zone-day temperature of each panel row from the (day, zone) array.
+
+    date_pickup (array): dates of the rows
+    location_ids (array): taxi zone of the rows
+    path (str): .npz file written by ingest_gridded_temperature
+    statistic (str): "max" or "mean" exposure
+
+    Returns:
+    numpy.ndarray: temperature per row (NaN for days or zones not covered)
+    """
+    with np.load(path) as stored:
+        dates, zones, values = stored["dates"], stored["zones"], stored[statistic]
+
+    day = pd.Index(dates).get_indexer(pd.to_datetime(np.asarray(date_pickup)).normalize())
+    zone = pd.Index(zones).get_indexer(np.asarray(location_ids))
+
+    covered = (day >= 0) & (zone >= 0)
+    temperature = np.full(len(day), np.nan)
+    temperature[covered] = values[day[covered], zone[covered]]
+
+    return temperature
@@ -0,0 +1,97 @@
+## Neighborhood-level temperature response
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from fe_estimation import grouped_crossproducts, cluster_codes
+
+
+def _zone_design(data, level, workday_split, outcome, month_fe):
+    """
+    Builds the design of run_zone_level_regression for all zones at once, sorted by zone.
+
+    Year (and month) dummies leave out the first level of the full panel; zones without
+    that level are handled by the pseudo-inverse in batched_zone_regression.
+    """
+    data = data.sort_values(f"{level}LocationID", kind="stable")
+    data = data.assign(workday = np.where((data["Weekday_index"] == 6) | (data["Weekday_index"] == 7), 0, 1))
+
+    if workday_split == "workday":
+        data = data[data["workday"] == 1]
+    elif workday_split == "weekend":
+        data = data[data["workday"] == 0]
+
+    regressors = ["tmax_obs", "pr_obs", "Snowdepth", "workday", "holiday", "cheby_1", "cheby_2", "cheby_3", "cheby_4", "cheby_5"]
+    data = data.dropna(subset=[outcome] + regressors)
+
+    dummies = [pd.get_dummies(data["Year_fact"], prefix="Year", drop_first=True, dtype=float)]
+    if month_fe == True:
+        dummies.append(pd.get_dummies(data["Month_fact"], prefix="Month", drop_first=True, dtype=float))
+
+    X = np.column_stack([np.ones(len(data)), data[regressors].to_numpy(dtype=float)] + [d.to_numpy() for d in dummies])
+    y = data[outcome].to_numpy(dtype=float)
+
+    return X, y, data[f"{level}LocationID"].to_numpy()
+
+
+def batched_zone_regression(data, level, workday_split, outcome = "log_total", month_fe = False, alpha = 0.05, chunk_size = 20000):
+    """
+    Estimates the zone-level temperature response of run_zone_level_regression for every
+    zone in one vectorized pass, with HC3 standard errors.
+
+    The panel is sorted by zone once; per-zone cross-products X_z'X_z and X_z'y_z are
+    accumulated with grouped bincounts and all zone systems are solved as one stacked
+    (pseudo-)inverse. Leverages and HC3 meats are computed in row chunks.
+
+    data (DataFrame): pooled regression data (final_data_{subset}_{level}.csv)
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "workday" or "weekend" - only for workday split . "None" if no split
+    outcome (str): dependent variable, e.g. "log_total"
+    month_fe (bool): add month fixed effects
+    alpha (float): level of the confidence intervals
+
+    Returns:
+    DataFrame: indexed by LocationID with Coefficient_tmax_obs, CI_lower, CI_upper,
+               p_value_tmax_obs and num_observations
+    """
+    X, y, zones = _zone_design(data, level, workday_split, outcome, month_fe)
+    codes, n_zones = cluster_codes(zones)
+    zone_ids = np.unique(zones)
+
+    # 1. Per-zone normal equations, solved as a stack
+    xtx = grouped_crossproducts(X, X, codes, n_zones)
+    xty = grouped_crossproducts(X, y[:, None], codes, n_zones)[:, :, 0]
+    xtx_pinv = np.linalg.pinv(xtx, hermitian=True)
+    params = np.einsum("gij,gj->gi", xtx_pinv, xty)
+
+    # 2. Residuals and leverages (row chunks avoid an N x k x k intermediate)
+    resid = np.empty(len(y))
+    leverage = np.empty(len(y))
+    for start in range(0, len(y), chunk_size):
+        rows = slice(start, start + chunk_size)
+        X_chunk, zone_chunk = X[rows], codes[rows]
+        resid[rows] = y[rows] - np.einsum("ij,ij->i", X_chunk, params[zone_chunk])
+        leverage[rows] = np.einsum("ij,ijk,ik->i", X_chunk, xtx_pinv[zone_chunk], X_chunk)
+
+    # 3. HC3 sandwich per zone
+    X_weighted = X * (resid / (1 - leverage))[:, None]
+    meat = grouped_crossproducts(X_weighted, X_weighted, codes, n_zones)
+    cov = xtx_pinv @ meat @ xtx_pinv
+
+    n_obs = np.bincount(codes, minlength=n_zones)
+    rank = np.linalg.matrix_rank(xtx, hermitian=True)
+    identified = n_obs > rank
+
+    coefficient = np.where(identified, params[:, 1], np.nan)
+    se = np.sqrt(np.where(identified, cov[:, 1, 1], np.nan))
+    critical = stats.norm.ppf(1 - alpha / 2)
+
+    results = pd.DataFrame({
+        "Coefficient_tmax_obs": coefficient,
+        "CI_lower": coefficient - critical * se,
+        "CI_upper": coefficient + critical * se,
+        "p_value_tmax_obs": 2 * stats.norm.sf(np.abs(coefficient / se)),
+        "num_observations": n_obs,
+    }, index=pd.Index(zone_ids, name="LocationID"))
+
+    return results
@@ -0,0 +1,199 @@
+## Memory-mapped columnar panel store for parallel estimation workers
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from fe_estimation import binned_controls, clustered_binned_regression
+
+
+SCHEMA_FILE = "schema.json"
+
+
+def write_panel_store(panel_data, path = None):
+    """
+    Writes the panel once as one memory-mapped .npy file per column (index levels included).
+
+    Categoricals and strings are stored as integer codes with their labels in the schema,
+    dates as datetime64[ns]. By default the store is placed in /dev/shm, so the columns live
+    in shared memory and all workers map the same pages.
+
+    panel_data (DataFrame): output of binned_regression_data
+    path (str): directory of the store, a new temporary directory if None
+
+    Returns:
+    str: path of the store
+    """
+    if path is None:
+        path = tempfile.mkdtemp(prefix="panel_store_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    os.makedirs(path, exist_ok=True)
+
+    frame = panel_data.reset_index()
+    schema = {"index": list(panel_data.index.names), "n_rows": len(frame), "columns": {}}
+
+    for i, column in enumerate(frame.columns):
+        values = frame[column]
+        labels = None
+
+        # 1.1 Categorical columns -> codes, strings -> factorized codes (missing = -1)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            array = values.cat.codes.to_numpy()
+            labels = [str(c) for c in values.cat.categories]
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            array = values.to_numpy(dtype="datetime64[ns]")
+        elif pd.api.types.is_bool_dtype(values) and not values.isna().any():
+            array = values.to_numpy(dtype=np.int8)
+        elif pd.api.types.is_numeric_dtype(values):
+            # nullable extension types are stored as float with NaN
+            array = values.to_numpy(dtype=float, na_value=np.nan) if pd.api.types.is_extension_array_dtype(values) else values.to_numpy()
+        else:
+            codes, uniques = pd.factorize(values)
+            array = codes.astype(np.int32)
+            labels = [str(c) for c in uniques]
+
+        file_name = f"column_{i}.npy"
+        np.save(os.path.join(path, file_name), np.ascontiguousarray(array))
+        schema["columns"][str(column)] = {"file": file_name, "labels": labels}
+
+    with open(os.path.join(path, SCHEMA_FILE), "w") as f:
+        json.dump(schema, f)
+
+    return path
+
+
+def attach_panel(path):
+    """
+    Attaches to a panel store without copying.
+
+    Returns:
+    dict: schema and read-only memory-mapped column arrays (columns)
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+
+    columns = {name: np.load(os.path.join(path, column["file"]), mmap_mode="r") for name, column in schema["columns"].items()}
+
+    return {"schema": schema, "columns": columns}
+
+
+def remove_panel_store(path):
+    """
+    Deletes a panel store (workers holding maps keep their pages until they exit).
+    """
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def split_mask(store, workday_split = "None", filters = None):
+    """
+    Row mask of a sample split, evaluated directly on the mapped columns.
+
+    store (dict): output of attach_panel
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    filters (dict): column -> list of retained values (labels for categorical columns)
+
+    Returns:
+    ndarray: boolean row mask
+    """
+    columns, schema = store["columns"], store["schema"]["columns"]
+    mask = np.ones(store["schema"]["n_rows"], dtype=bool)
+
+    if workday_split == "weekday":
+        mask &= columns["weekday"] == 1
+    elif workday_split == "weekend":
+        mask &= columns["weekday"] == 0
+
+    for column, values in (filters or {}).items():
+        labels = schema[column]["labels"]
+        if labels is not None:
+            values = [labels.index(str(v)) for v in values if str(v) in labels]
+        mask &= np.isin(columns[column], values)
+
+    return mask
+
+
+def _row_selection(mask):
+    """
+    Helper function returning a slice for a mask of one contiguous block of rows, the row positions otherwise.
+    """
+    positions = np.flatnonzero(mask)
+    if len(positions) == 0:
+        return slice(0, 0)
+    if positions[-1] - positions[0] + 1 == len(positions):
+        return slice(positions[0], positions[-1] + 1)
+
+    return positions
+
+
+def panel_view(store, names, mask = None):
+    """
+    DataFrame of selected columns (and the index levels) for the rows in mask.
+
+    Only the requested rows and columns are materialized; categorical columns are rebuilt
+    from their codes. A mask selecting one contiguous block of rows is read as a slice of
+    the mapped columns instead of a gather of row positions.
+
+    store (dict): output of attach_panel
+    names (list): columns to load
+    mask (ndarray): boolean row mask, all rows if None
+
+    Returns:
+    DataFrame: panel with the index of binned_regression_data
+    """
+    columns, schema = store["columns"], store["schema"]
+    index = [name for name in schema["index"] if name is not None]
+    rows = slice(None) if mask is None else _row_selection(mask)
+
+    data = {}
+    for name in dict.fromkeys(index + list(names)):
+        values = columns[name][rows]
+        labels = schema["columns"][name]["labels"]
+        data[name] = pd.Categorical.from_codes(values, labels) if labels is not None else values
+
+    return pd.DataFrame(data).set_index(index)
+
+
+def _fit_spec(path, spec):
+    """
+    Worker: attaches to the store and estimates one specification.
+    """
+    store = attach_panel(path)
+    workday_split = spec.get("workday_split", "None")
+    cluster = spec.get("cluster", "entity")
+
+    mask = split_mask(store, workday_split, spec.get("filters"))
+    cluster_columns = [cluster] if isinstance(cluster, str) else list(cluster)
+    names = ["log_total", "temp_bins"] + binned_controls(workday_split) + [c for c in cluster_columns if c in store["columns"]]
+
+    return clustered_binned_regression(panel_view(store, names, mask), spec["level"], workday_split, cluster=cluster)
+
+
+def parallel_binned_regressions(panel_data, specs, max_workers = None):
+    """
+    Estimates several binned-panel specifications in parallel worker processes.
+
+    The panel is written once to a memory-mapped store; each worker attaches to it by path
+    and builds its split mask and design from the mapped columns, so the workers share a
+    single copy of the panel instead of unpickling one each.
+
+    panel_data (DataFrame or str): output of binned_regression_data or the path of an existing store
+    specs (list): dicts with level, workday_split, cluster and optional filters (column -> values),
+                  e.g. {"level": "PU", "workday_split": "weekday", "filters": {"Borough": ["Manhattan"]}}
+    max_workers (int): number of worker processes
+
+    Returns:
+    list: DataFrames of clustered_binned_regression, in the order of specs
+    """
+    owns_store = not isinstance(panel_data, str)
+    path = write_panel_store(panel_data) if owns_store else panel_data
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_fit_spec, [path] * len(specs), specs))
+    finally:
+        if owns_store:
+            remove_panel_store(path)
+
+    return results
@@ -4,10 +4,7 @@ import holidays
 from datetime import datetime
 from matplotlib.cbook import boxplot_stats 
 import time
-
-
-def fahrenheit_to_celsius(f):
-        return (f - 32) * 5/9
+from weather_ingestion import merge_zone_weather, fahrenheit_to_celsius
 
 
 def impute_zeros(taxi_data, level: str):
@@ -40,7 +37,7 @@ def impute_zeros(taxi_data, level: str):
      
 
 
-def prepare_data_for_regression(input_data,climate_data, level: str, subset: str):
+def prepare_data_for_regression(input_data,climate_data, level: str, subset: str, zone_weather = None):
     """
     Merges cab data with climate variables, 
     adds month and year factors as columns, adds time trends (chebyshevs)
@@ -51,6 +48,8 @@ def prepare_data_for_regression(input_data,climate_data, level: str, subset: str
         climate_data (str): path to climate csv
         level (str): PU, DO , or OD
         subset (str): all, FHV , YG(Yellow-Green)
+        zone_weather (str): optional zone-day weather table (weather_ingestion.interpolate_daily_weather)
+                            replacing the Central Park values
 
     Returns:
         regression_df: Dataframe with merged taxi and tourism data
@@ -63,7 +62,7 @@ def prepare_data_for_regression(input_data,climate_data, level: str, subset: str
     climate = pd.read_csv(climate_data)
 
     # 'AWND' : 'windspeed_obs' to be included once NOAA site is up again
-    climate['TMAX'] = climate['TMAX'].apply(fahrenheit_to_celsius)
+    climate['TMAX'] = fahrenheit_to_celsius(climate['TMAX'])
 
     climate.rename(columns={'DATE': 'date_pickup' , 'TMAX' : 'tmax_obs' , 'PRCP' : 'pr_obs' , 'SNWD': 'Snowdepth' }, inplace=True)
 
@@ -74,6 +73,10 @@ def prepare_data_for_regression(input_data,climate_data, level: str, subset: str
 
 
     taxi_data = pd.merge(taxi_data, climate, on=['date_pickup'], how='left')
+
+    # zone-day weather interpolated from several stations (pickup zone for OD)
+    if zone_weather is not None:
+        taxi_data = merge_zone_weather(taxi_data, zone_weather, 'PULocationID' if level == 'OD' else f'{level}LocationID')
     
     # drop duplicates ( for some locations there are double entries)
     if level == 'OD':
@@ -0,0 +1,159 @@
+## Persistent store of regression results keyed by specification and input fingerprints
+
+import os
+import json
+import sqlite3
+import hashlib
+import datetime as dt
+import numpy as np
+import pandas as pd
+from binned_regression import binned_regression, binned_regression_data, binned_regression_inputs, result_record
+
+
+DEFAULT_STORE = "Data/regression_results.sqlite"
+
+
+def file_fingerprint(paths):
+    """
+    Fingerprint of input files from path, size and modification time (no content read).
+    """
+    paths = [paths] if isinstance(paths, str) else paths
+    stamps = [(os.path.abspath(p), os.path.getsize(p), os.path.getmtime(p)) for p in paths]
+
+    return hashlib.sha256(json.dumps(stamps).encode()).hexdigest()
+
+
+def panel_fingerprint(panel_data):
+    """
+    Fingerprint of the panel content (values, index, column names and dtypes).
+    """
+    digest = hashlib.sha256(pd.util.hash_pandas_object(panel_data, index=True).to_numpy().tobytes())
+    digest.update(json.dumps([(str(c), str(t)) for c, t in panel_data.dtypes.items()]).encode())
+
+    return digest.hexdigest()
+
+
+def spec_key(spec, fingerprint):
+    """
+    Hash of a specification (dict) together with the fingerprint of its inputs.
+    """
+    return hashlib.sha256(json.dumps({"spec": spec, "inputs": fingerprint}, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _connect(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                              key TEXT PRIMARY KEY, spec TEXT, created TEXT, n_obs INTEGER,
+                              n_clusters TEXT, names TEXT, params TEXT, cov TEXT, conf_int TEXT, bin_days TEXT)""")
+
+    return connection
+
+
+def save_results(key, record, path = DEFAULT_STORE):
+    """
+    Saves a result record (binned_regression.result_record) under key, replacing an existing entry.
+    """
+    row = (key, json.dumps(record["spec"], sort_keys=True, default=str), dt.datetime.now().isoformat(timespec="seconds"),
+           record["n_obs"], json.dumps(record["n_clusters"]), json.dumps(list(record["params"].index)),
+           json.dumps(record["params"].tolist()), json.dumps(record["cov"].to_numpy().tolist()),
+           json.dumps(record["conf_int"].to_numpy().tolist()),
+           json.dumps({"bins": list(record["bin_days"].index), "days": [int(d) for d in record["bin_days"]]}))
+
+    with _connect(path) as connection:
+        connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+    connection.close()
+
+
+def load_results(key, path = DEFAULT_STORE):
+    """
+    Loads a result record.
+
+    Returns:
+    dict: spec, params, cov, conf_int, n_obs, n_clusters and bin_days - None if key is not in the store
+    """
+    if not os.path.exists(path):
+        return None
+
+    connection = _connect(path)
+    row = connection.execute("SELECT spec, n_obs, n_clusters, names, params, cov, conf_int, bin_days FROM results WHERE key = ?", (key,)).fetchone()
+    connection.close()
+    if row is None:
+        return None
+
+    spec, n_obs, n_clusters, names, params, cov, conf_int, bin_days = row
+    names, bin_days = json.loads(names), json.loads(bin_days)
+
+    return {
+        "spec": json.loads(spec),
+        "params": pd.Series(json.loads(params), index=names, dtype=float),
+        "cov": pd.DataFrame(np.array(json.loads(cov), dtype=float).reshape(len(names), len(names)), index=names, columns=names),
+        "conf_int": pd.DataFrame(np.array(json.loads(conf_int), dtype=float).reshape(len(names), 2), index=names, columns=["Lower CI", "Upper CI"]),
+        "n_obs": n_obs,
+        "n_clusters": json.loads(n_clusters),
+        "bin_days": pd.Series(bin_days["days"], index=bin_days["bins"], name="count"),
+    }
+
+
+def list_results(path = DEFAULT_STORE):
+    """
+    Overview of the stored specifications.
+
+    Returns:
+    DataFrame: key, spec, created, n_obs and n_clusters per stored result
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["key", "spec", "created", "n_obs", "n_clusters"])
+
+    connection = _connect(path)
+    overview = pd.read_sql_query("SELECT key, spec, created, n_obs, n_clusters FROM results ORDER BY created", connection)
+    connection.close()
+
+    return overview
+
+
+def cached_binned_regression(level, workday_split, temp_bin_size, data_spec = None, exclude_zeros = False,
+                             cluster = "entity", panel_data = None, path = DEFAULT_STORE):
+    """
+    binned_regression with a persistent result store: specifications already estimated
+    on the same inputs are loaded instead of re-estimated.
+
+    The key is the specification together with the fingerprint of the input files of
+    binned_regression_data, so a cache hit neither reads the data nor builds the panel;
+    the panel is only built on a miss.
+
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    temp_bin_size(int): size of temperature bins in °C
+    data_spec (dict): further binned_regression_data arguments (subset, income_split, temp_split,
+                      exclude_minimum_bin, daytime, hotel_control, zone_temperature)
+    exclude_zeros(bool): exclude zero-valued observations from estimation
+    cluster(str or list): one or two cluster variables
+    panel_data (DataFrame): already built panel (e.g. a modified one) - keyed on its content instead of the input files
+    path (str): SQLite file of the store
+
+    Returns:
+    dict: result record (see binned_regression.result_record)
+    """
+    data_spec = dict(data_spec or {})
+    spec = dict(data_spec, model="binned_regression", level=level, workday_split=str(workday_split),
+                temp_bin_size=temp_bin_size, exclude_zeros=exclude_zeros, cluster=cluster)
+
+    # 1. Key: panel content if given, input files of binned_regression_data otherwise
+    if panel_data is not None:
+        fingerprint = panel_fingerprint(panel_data)
+    else:
+        fingerprint = file_fingerprint(binned_regression_inputs(level, data_spec.get("subset", False), data_spec.get("zone_temperature")))
+    key = spec_key(spec, fingerprint)
+
+    record = load_results(key, path)
+    if record is None:
+        # 2. Cache miss: build the panel and estimate
+        if panel_data is None:
+            panel_data = binned_regression_data(level, temp_bin_size, workday_split=workday_split, exclude_zeros=exclude_zeros, **data_spec)
+        results = binned_regression(panel_data, level, workday_split, exclude_zeros=exclude_zeros, cluster=cluster)
+        record = result_record(results, panel_data, temp_bin_size, cluster=cluster, spec=spec)
+        save_results(key, record, path)
+
+    return record
@@ -0,0 +1,154 @@
+## Conley spatial-HAC standard errors for the binned panel model
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+from geometry_store import read_geometries
+from geo_utils import unit_sphere, chord_to_km, km_to_chord
+from fe_estimation import binned_design, fit_absorbed_ols, cluster_codes, CRITICAL_VALUE
+
+
+# sparse kernels by (zones, cutoff, kernel, centroids) - reused across specifications on the same zones
+_KERNEL_CACHE = {}
+
+
+def zone_centroids(taxi_zones_csv = "Data/Shapefiles/taxi_zones_geometry.csv"):
+    """
+    Centroids of the taxi zones (computed in the NY state plane, returned as longitude/latitude).
+
+    taxi_zones_csv (str): File path to the CSV containing taxi zone geometries (WKT, EPSG:4326).
+
+    Returns:
+    DataFrame: lon and lat indexed by LocationID
+    """
+    taxi_zones_gdf = read_geometries(taxi_zones_csv)[['location_i', 'geometry']]
+
+    # zones split into several polygons are merged before taking the centroid
+    zones = taxi_zones_gdf.dissolve(by='location_i')
+    centroids = zones.to_crs(epsg=2263).centroid.to_crs(epsg=4326)
+
+    return pd.DataFrame({'lon': centroids.x, 'lat': centroids.y}, index=pd.Index(zones.index.astype(int), name='LocationID'))
+
+
+def spatial_kernel(centroids, zones, cutoff_km, kernel = "bartlett"):
+    """
+    Sparse zone x zone kernel of great-circle distances below a cutoff.
+
+    Neighbour pairs are found once with a KD-tree on unit-sphere coordinates (chord distance
+    bound) and cached by zone list, cutoff and kernel. Zones without a centroid only get weight
+    on themselves.
+
+    centroids (DataFrame): lon and lat indexed by LocationID (zone_centroids)
+    zones (array): zone ids in the order of the zone codes
+    cutoff_km (float): distance cutoff in km
+    kernel (str): "bartlett" (weight 1 - d / cutoff) or "uniform"
+
+    Returns:
+    scipy.sparse.csr_matrix: Z x Z kernel weights with ones on the diagonal
+    """
+    zones = tuple(np.asarray(zones).tolist())
+    key = (zones, float(cutoff_km), kernel, pd.util.hash_pandas_object(centroids).sum())
+    if key in _KERNEL_CACHE:
+        return _KERNEL_CACHE[key]
+
+    located = centroids.reindex(zones)
+    have = np.flatnonzero(located['lat'].notna().to_numpy())
+    points = unit_sphere(located['lon'].to_numpy()[have], located['lat'].to_numpy()[have])
+
+    # 1. Pairs within the chord length of the cutoff
+    chord = km_to_chord(cutoff_km)
+    tree = cKDTree(points)
+    pairs = tree.query_pairs(chord, output_type='ndarray')
+    chords = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    distance = chord_to_km(chords)
+
+    # 2. Kernel weights, symmetric, with the diagonal
+    if kernel == "bartlett":
+        weights = 1 - distance / cutoff_km
+    elif kernel == "uniform":
+        weights = np.ones(len(distance))
+    else:
+        raise ValueError("kernel must be 'bartlett' or 'uniform'")
+
+    rows = np.concatenate([have[pairs[:, 0]], have[pairs[:, 1]], np.arange(len(zones))])
+    cols = np.concatenate([have[pairs[:, 1]], have[pairs[:, 0]], np.arange(len(zones))])
+    values = np.concatenate([weights, weights, np.ones(len(zones))])
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(zones), len(zones)))
+
+    _KERNEL_CACHE[key] = matrix
+    return matrix
+
+
+def conley_covariance(X, resid, xtx_inv, zone_codes, day_codes, kernel_matrix):
+    """
+    Conley spatial-HAC covariance: scores of zones on the same day are correlated with
+    kernel weights that decline with distance.
+
+    Scores are summed per (zone, day) into a Z x T x k array; the meat is the sum over days of
+    S_t' K S_t, computed with one sparse product for all days.
+
+    X (ndarray): N x k (fixed-effect absorbed) regressors
+    resid (ndarray): N residuals
+    xtx_inv (ndarray): inverse of X'X
+    zone_codes (ndarray): N zone codes (rows of kernel_matrix)
+    day_codes (ndarray): N day codes
+    kernel_matrix (sparse matrix): Z x Z spatial kernel
+
+    Returns:
+    ndarray: k x k covariance matrix
+    """
+    scores = X * resid[:, None]
+    n_zones, k = kernel_matrix.shape[0], X.shape[1]
+    n_days = int(day_codes.max()) + 1
+
+    cell = zone_codes * n_days + day_codes
+    S = np.column_stack([np.bincount(cell, weights=scores[:, j], minlength=n_zones * n_days) for j in range(k)])
+    S = S.reshape(n_zones, n_days * k)
+
+    KS = kernel_matrix @ S
+    meat = np.einsum('zta,ztb->ab', S.reshape(n_zones, n_days, k), KS.reshape(n_zones, n_days, k))
+
+    return xtx_inv @ meat @ xtx_inv
+
+
+def conley_binned_regression(panel_data, level, workday_split, cutoff_km = 5.0, centroids = None, kernel = "bartlett"):
+    """
+    Estimates the 2WFE-binned-panel model with Conley spatial-HAC standard errors
+    (spatial correlation between zones on the same day).
+
+    panel_data (DataFrame): output of binned_regression_data
+    level (str): "PU" or "DO" - Pickup or Dropoff Location level
+    workday_split(str): "weekday" or "weekend" - only for workday split . "None" if no split
+    cutoff_km (float): distance cutoff of the kernel in km
+    centroids (DataFrame): zone centroids (zone_centroids()), read from the taxi zone geometries if None
+    kernel (str): "bartlett" or "uniform"
+
+    Returns:
+    DataFrame: coefficient, standard error, t-statistic and 95% CI for all regressors
+    """
+    if centroids is None:
+        centroids = zone_centroids()
+
+    design = binned_design(panel_data, level, workday_split)
+    fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+
+    zones = np.unique(panel_data.index.get_level_values(f"{level}LocationID")[design["mask"]])
+    day_codes = cluster_codes(pd.to_datetime(panel_data["date_pickup"]).to_numpy()[design["mask"]])[0]
+    kernel_matrix = spatial_kernel(centroids, zones, cutoff_km, kernel)
+
+    cov = conley_covariance(fit["X"], fit["resid"], fit["xtx_inv"], design["fe_codes"][0], day_codes, kernel_matrix)
+
+    se = np.sqrt(np.diag(cov))
+    result = pd.DataFrame({
+        "Coefficient": fit["params"],
+        "Std. Error": se,
+        "T-stat": fit["params"] / se,
+        "Lower CI": fit["params"] - CRITICAL_VALUE * se,
+        "Upper CI": fit["params"] + CRITICAL_VALUE * se,
+    }, index=design["names"])
+    result.attrs["cov"] = pd.DataFrame(cov, index=design["names"], columns=design["names"])
+    result.attrs["n_obs"] = len(fit["resid"])
+    result.attrs["n_neighbour_pairs"] = int((kernel_matrix.nnz - kernel_matrix.shape[0]) / 2)
+
+    return result
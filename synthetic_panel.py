@@ -0,0 +1,52 @@
+## Synthetic regression panel for the unit tests (columns of binned_regression_data output)
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_panel(n_zones = 12, n_days = 400, seed = 0, tmax_range = (-5, 34), missing_share = 0.0):
+    """
+    Small panel with the columns of binned_regression_data output and known bin effects
+    (+5% above 29°C, -3% below 2°C).
+
+    n_zones (int): number of taxi zones (ids from 2, even ids in Queens, odd ids in the Bronx)
+    n_days (int): number of consecutive days from 2016-01-01
+    seed (int): seed of the draws
+    tmax_range (tuple): range of the daily maximum temperature in °C; values below -10°C or above
+                        38°C get no temperature bin (temp_bins "nan") as in binned_regression_data
+    missing_share (float): share of zone-days dropped at random (unbalanced panel)
+
+    Returns:
+    DataFrame: panel with PULocationID and Year_fact as index
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2016-01-01", periods=n_days, freq="D")
+    zones = np.arange(2, 2 + n_zones)
+
+    days = pd.DataFrame({
+        "date_pickup": dates,
+        "tmax_obs": rng.uniform(*tmax_range, n_days),
+        "pr_obs": rng.exponential(1, n_days),
+        "Snowdepth": rng.exponential(0.2, n_days),
+        "AWND": rng.uniform(0, 10, n_days),
+        "weekday": (dates.dayofweek < 5).astype(int),
+        "holiday": rng.binomial(1, 0.03, n_days),
+    })
+    days["Year_fact"] = pd.factorize(days["date_pickup"].dt.year)[0] + 1
+    for i in range(1, 6):
+        days[f"cheby_{i}"] = np.cos(i * np.arccos(np.linspace(-1, 1, n_days)))
+
+    panel = days.merge(pd.DataFrame({"PULocationID": zones, "Borough": np.where(zones % 2 == 0, "Queens", "Bronx")}), how="cross")
+
+    temp_bins = pd.cut(panel["tmax_obs"], bins=np.arange(-10, 41, 3), include_lowest=True)
+    panel["temp_bins"] = temp_bins.astype(str).str.replace(r"\(", "[", regex=True).fillna("nan")
+    bin_effect = np.where(panel["tmax_obs"] > 29, 0.05, 0.0) - np.where(panel["tmax_obs"] < 2, 0.03, 0.0)
+    panel["log_total"] = (3 + 0.1 * panel["PULocationID"] + 0.02 * panel["Year_fact"] + bin_effect
+                          - 0.01 * panel["pr_obs"] + rng.normal(0, 0.05, len(panel)))
+    panel["trip_number"] = np.exp(panel["log_total"]).round()
+    panel["borough_month_year"] = panel["Borough"] + "_" + panel["date_pickup"].dt.strftime("%B-%Y")
+
+    if missing_share > 0:
+        panel = panel[rng.uniform(size=len(panel)) >= missing_share]
+
+    return panel.set_index(["PULocationID", "Year_fact"])
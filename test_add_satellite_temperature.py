@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import box, Polygon
+
+from add_satellite_temperature import zone_pixel_weights, zonal_sums
+
+
+class TestZonePixelWeights(unittest.TestCase):
+
+    def setUp(self):
+        # 6 x 8 grid of 1 x 1 pixels with the upper left corner at (10, 20)
+        self.transform = (1.0, 0.0, 10.0, 0.0, -1.0, 20.0)
+        self.shape = (6, 8)
+        self.zones = gpd.GeoDataFrame({'location_i': [1, 2, 3]}, geometry=[
+            box(10, 18, 12, 20),                                   # top-left 2 x 2 pixels
+            Polygon([(13, 14), (18, 14), (18, 19.2), (13, 14)]),  # triangle
+            box(40, 40, 41, 41),                                   # outside the grid
+        ])
+        self.raster = np.random.default_rng(0).normal(size=self.shape)
+
+    def test_matches_pixel_centres(self):
+        weights = zone_pixel_weights(self.zones, self.transform, self.shape)
+        rows, cols = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        x, y = 10 + cols + 0.5, 20 - rows - 0.5
+
+        for i, geom in enumerate(self.zones.geometry):
+            inside = shapely.contains_xy(geom, x, y).ravel()
+            np.testing.assert_array_equal(weights[i].toarray().ravel(), inside.astype(float))
+
+        sums, counts = zonal_sums(weights, self.raster)
+        self.assertAlmostEqual(sums[0] / counts[0], self.raster[:2, :2].mean())
+        self.assertEqual(counts[2], 0)
+
+    def test_windowed_sums_with_nodata(self):
+        weights = zone_pixel_weights(self.zones, self.transform, self.shape)
+        raster = self.raster.copy()
+        raster[0, 0] = -9999
+
+        full = zonal_sums(weights, raster, nodata=-9999)
+        windows = [zonal_sums(weights, raster[r:r + 4], nodata=-9999, first_pixel=r * self.shape[1]) for r in range(0, self.shape[0], 4)]
+
+        np.testing.assert_allclose(sum(w[0] for w in windows), full[0])
+        np.testing.assert_allclose(sum(w[1] for w in windows), full[1])
+        self.assertAlmostEqual(full[0][0] / full[1][0], raster[:2, :2].ravel()[1:].mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from chicago_ridesharing_functions import preprocess_chicago_ridesharing
+
+
+class TestChicagoIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.paths = []
+        for f, start in enumerate(["2022-12-20", "2022-12-31"]):
+            n = 500
+            timestamps = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 4 * 24 * 5, n) * 15, unit="min")
+            export = pd.DataFrame({
+                "Trip ID": rng.integers(1, 40, n),
+                "Trip Start Timestamp": timestamps.strftime("%m/%d/%Y %I:%M:%S %p"),
+                "Trip End Timestamp": timestamps.strftime("%m/%d/%Y %I:%M:%S %p"),
+                "Trip Miles": rng.uniform(0.5, 20, n).round(1),
+                "Pickup Community Area": np.where(rng.uniform(size=n) < 0.05, np.nan, rng.integers(1, 78, n)),
+                "Fare": rng.uniform(5, 60, n).round(2),
+                "Tip": np.where(rng.uniform(size=n) < 0.1, np.nan, rng.integers(0, 10, n)),
+            })
+            self.paths.append(os.path.join(self.directory, f"tnp_{f}.csv"))
+            export.to_csv(self.paths[-1], index=False)
+
+    def test_streaming_matches_full_read(self):
+        output = os.path.join(self.directory, "grouped.csv")
+        grouped = preprocess_chicago_ridesharing(self.paths, output, chunksize=97, max_workers=2)
+
+        # reference: full read, concatenation and date slicing
+        chi_tnp = pd.concat([pd.read_csv(p) for p in self.paths], ignore_index=True)
+        chi_tnp.rename(columns={'Trip Start Timestamp': 'date_pickup', 'Pickup Community Area': 'PULocationID', 'Trip Miles': 'trip_distance', 'Fare': 'total_amount', 'Trip ID': 'trip_number'}, inplace=True)
+        chi_tnp['date_pickup'] = pd.to_datetime(chi_tnp['date_pickup'].str[:10]).dt.date
+        chi_tnp = chi_tnp.dropna(subset=['PULocationID'])
+        chi_tnp["weighted_mean_distance"] = chi_tnp["trip_number"] * chi_tnp["trip_distance"]
+        chi_tnp["weighted_mean_amount"] = chi_tnp["trip_number"] * chi_tnp["total_amount"]
+        chi_tnp["weighted_tip"] = chi_tnp["trip_number"] * chi_tnp["Tip"]
+        reference = chi_tnp.groupby(["date_pickup", "PULocationID"])[["weighted_mean_distance", "weighted_mean_amount", "trip_number", "weighted_tip"]].sum()
+
+        self.assertEqual(len(grouped), len(reference))
+        np.testing.assert_allclose(grouped["trip_number"], reference["trip_number"])
+        np.testing.assert_allclose(grouped["trip_distance_mean"], reference["weighted_mean_distance"] / reference["trip_number"])
+        np.testing.assert_allclose(grouped["tip_mean"], reference["weighted_tip"] / reference["trip_number"])
+        np.testing.assert_array_equal(grouped["PULocationID"], reference.index.get_level_values(1).astype(int))
+
+        written = pd.read_csv(output)
+        self.assertEqual(written["date_pickup"].iloc[0], str(reference.index[0][0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
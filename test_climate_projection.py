@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import unittest
+
+from fe_estimation import clustered_binned_regression
+from climate_projection import bin_effects, temperature_bin_index, project_scenarios
+from synthetic_panel import synthetic_panel
+
+
+class TestClimateProjection(unittest.TestCase):
+
+    def setUp(self):
+        # days below -10°C are not in any estimated bin, days up to 35°C fill the top bin
+        self.panel = synthetic_panel(seed=2, tmax_range=(-13, 35))
+        results = clustered_binned_regression(self.panel, "PU", "None")
+        self.params, self.cov = results["Coefficient"], results.attrs["cov"]
+
+    def test_bin_lookup(self):
+        effects = bin_effects(self.params, self.cov)
+        self.assertEqual(effects["labels"][effects["reference"]], "[17.0, 20.0]")
+        self.assertEqual(effects["coefficients"][effects["reference"]], 0)
+        bins = temperature_bin_index(np.array([-20.0, 17.0, 17.5, 40.0, 36.0, np.nan]), effects["lowers"], effects["uppers"], pooled_top=38.0)
+        self.assertEqual([effects["labels"][b] for b in bins[1:3]], ["[14.0, 17.0]", "[17.0, 20.0]"])
+        # out of range temperatures are not mapped onto the neighbouring bins, 35-38°C is pooled into the top bin
+        self.assertEqual(list(bins[[0, 3, 5]]), [-1, -1, -1])
+        self.assertEqual(bins[4], len(effects["labels"]) - 1)
+        self.assertEqual(temperature_bin_index(np.array([36.0]), effects["lowers"], effects["uppers"])[0], -1)
+
+    def test_project_scenarios(self):
+        members = np.random.default_rng(0).normal(20, 8, (50, self.panel["date_pickup"].nunique()))
+        result = project_scenarios(self.params, self.cov, self.panel, shifts=(0, 2), members=members, n_draws=500, seed=1)
+
+        # zone-day by zone-day projection with the point estimates
+        effects = bin_effects(self.params, self.cov)
+        tmax = self.panel["tmax_obs"].to_numpy()
+        baseline, warmer = (temperature_bin_index(t, effects["lowers"], effects["uppers"], 38.0) for t in (tmax, tmax + 2))
+        in_range = (baseline >= 0) & (warmer >= 0)
+        expected = (self.panel["trip_number"] * np.expm1(effects["coefficients"][warmer] - effects["coefficients"][baseline]))[in_range].sum()
+
+        self.assertAlmostEqual(result.loc["+2°C", "Change (trips)"], expected, places=6)
+        baseline_out = (self.panel["tmax_obs"] < -10).to_numpy()
+        self.assertGreater(baseline_out.sum(), 0)
+        self.assertAlmostEqual(result.loc["+0°C", "Out of range (%)"], self.panel["trip_number"][baseline_out].sum() / self.panel["trip_number"].sum() * 100)
+        self.assertAlmostEqual(result.loc["+2°C", "Out of range (%)"], self.panel["trip_number"][~in_range].sum() / self.panel["trip_number"].sum() * 100)
+        self.assertEqual(result.loc["+0°C", "Change (trips)"], 0)
+        self.assertTrue(result.loc["+2°C", "Lower (%)"] < result.loc["+2°C", "Change (%)"] < result.loc["+2°C", "Upper (%)"])
+        self.assertEqual(result.attrs["draws"].shape, (52, 500))
+        self.assertIn("ensemble", result.index)
+
+    def test_members_aligned_with_all_dates(self):
+        # the first day has no temperature: members stay aligned with all dates of the panel
+        panel = self.panel.copy()
+        dates = np.unique(panel["date_pickup"])
+        panel.loc[panel["date_pickup"] == dates[0], "tmax_obs"] = np.nan
+        members = np.random.default_rng(0).uniform(0, 30, (2, len(dates)))
+        result = project_scenarios(self.params, self.cov, panel, shifts=(), members=members, n_draws=10, seed=1)
+
+        effects = bin_effects(self.params, self.cov)
+        kept = panel[panel["tmax_obs"].notna()]
+        baseline = temperature_bin_index(kept["tmax_obs"].to_numpy(), effects["lowers"], effects["uppers"], 38.0)
+        scenario = temperature_bin_index(members[1, pd.Index(dates).get_indexer(kept["date_pickup"])], effects["lowers"], effects["uppers"], 38.0)
+        in_range = (baseline >= 0) & (scenario >= 0)
+        expected = (kept["trip_number"] * np.expm1(effects["coefficients"][scenario] - effects["coefficients"][baseline]))[in_range].sum()
+        self.assertAlmostEqual(result.loc["member_1", "Change (trips)"], expected, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
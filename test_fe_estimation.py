@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+import unittest
+import statsmodels.api as sm
+from linearmodels.panel import PanelOLS
+
+from fe_estimation import (binned_design, fit_absorbed_ols, wild_cluster_bootstrap, clustered_binned_regression, combine_codes,
+                           cluster_codes, panel_cluster_codes, cluster_covariance,
+                           pooled_interaction_regression, bin_size_sweep, temperature_bin_codes, permutation_inference,
+                           jackknife_zones, distributed_lag_regression)
+from binned_regression import compact_panel, preview_sample, preview_binned_regression, result_record, temperature_bin_days
+from synthetic_panel import synthetic_panel
+
+
+class TestFixedEffectsEstimation(unittest.TestCase):
+
+    def setUp(self):
+        self.panel = synthetic_panel()
+
+    def test_absorbed_ols_matches_panelols(self):
+        design = binned_design(self.panel, "PU", "None")
+        fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+
+        formula = 'log_total~  1+ C(temp_bins, Treatment(reference = "[17.0, 20.0]")) + pr_obs + Snowdepth + AWND + weekday + holiday + cheby_1 + cheby_2 + cheby_3 + cheby_4 + cheby_5 + EntityEffects + TimeEffects'
+        expected = PanelOLS.from_formula(formula, data=self.panel).fit().params
+
+        for name, value in zip(design["names"], fit["params"]):
+            self.assertAlmostEqual(value, expected[name], places=8)
+
+    def test_clustered_covariance(self):
+        design = binned_design(self.panel, "PU", "None")
+        fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+        scores = fit["X"] * fit["resid"][:, None]
+        zone_codes = self.panel.index.get_level_values("PULocationID").to_numpy()
+        month_codes = pd.factorize(self.panel["borough_month_year"])[0]
+
+        def _meat(codes):
+            sums = [scores[codes == g].sum(axis=0) for g in np.unique(codes)]
+            return sum(np.outer(s, s) for s in sums)
+
+        intersection = pd.factorize(pd.Series(zone_codes).astype(str) + "_" + pd.Series(month_codes).astype(str))[0]
+        expected = {
+            "entity": _meat(zone_codes),
+            "borough_month_year": _meat(month_codes),
+        }
+
+        for cluster, meat in expected.items():
+            result = clustered_binned_regression(self.panel, "PU", "None", cluster=cluster)
+            expected_cov = fit["xtx_inv"] @ meat @ fit["xtx_inv"]
+            np.testing.assert_allclose(result.attrs["cov"].to_numpy(), expected_cov, rtol=1e-8, atol=1e-14)
+
+        # two-way: CGM covariance with negative eigenvalues set to zero
+        two_way = fit["xtx_inv"] @ (_meat(zone_codes) + _meat(month_codes) - _meat(intersection)) @ fit["xtx_inv"]
+        eigenvalues, eigenvectors = np.linalg.eigh((two_way + two_way.T) / 2)
+        self.assertLess(eigenvalues.min(), 0)
+        result = clustered_binned_regression(self.panel, "PU", "None", cluster=["entity", "borough_month_year"])
+        np.testing.assert_allclose(result.attrs["cov"].to_numpy(), (eigenvectors * np.maximum(eigenvalues, 0)) @ eigenvectors.T, rtol=1e-8, atol=1e-14)
+        self.assertTrue(np.isfinite(result["Std. Error"]).all())
+        self.assertGreaterEqual(np.linalg.eigvalsh(result.attrs["cov"].to_numpy()).min(), -1e-12)
+
+    def test_compact_panel(self):
+        panel = self.panel.assign(LocationID=self.panel.index.get_level_values("PULocationID"), DATE=self.panel["date_pickup"].astype(str))
+        compact = compact_panel(panel.copy())
+
+        self.assertNotIn("LocationID", compact.columns)
+        self.assertNotIn("DATE", compact.columns)
+        self.assertEqual(compact["temp_bins"].dtype, "category")
+        self.assertEqual(compact["log_total"].dtype, np.float32)
+        self.assertLess(compact.memory_usage(deep=True).sum(), panel.memory_usage(deep=True).sum() / 3)
+        # estimates are unchanged up to single precision
+        np.testing.assert_allclose(clustered_binned_regression(compact, "PU", "None")["Coefficient"],
+                                   clustered_binned_regression(self.panel, "PU", "None")["Coefficient"], atol=1e-6)
+
+    def test_preview_binned_regression(self):
+        full, full_sample = preview_binned_regression(self.panel, "PU", "None", preview=False)
+        pd.testing.assert_frame_equal(full, clustered_binned_regression(self.panel, "PU", "None"))
+        self.assertIs(full_sample, self.panel)
+
+        sample = preview_sample(self.panel, zone_fraction=0.5, day_fraction=0.2, seed=3)
+        pd.testing.assert_frame_equal(sample, preview_sample(self.panel, zone_fraction=0.5, day_fraction=0.2, seed=3))
+        self.assertEqual(set(sample["Borough"]), set(self.panel["Borough"]))
+        self.assertEqual(set(sample["temp_bins"]), set(self.panel["temp_bins"]))
+
+        preview, preview_data = preview_binned_regression(self.panel, "PU", "None", seed=3)
+        pd.testing.assert_frame_equal(preview_data, sample)
+        self.assertLess(preview.attrs["n_obs"], len(self.panel) / 5)
+        self.assertEqual(preview.attrs["preview"]["cluster_fractions"], [0.5])
+
+        # same coefficients as the subsample fit, standard errors rescaled by se_factor
+        subsample = clustered_binned_regression(sample, "PU", "None")
+        np.testing.assert_allclose(preview["Coefficient"], subsample["Coefficient"])
+        np.testing.assert_allclose(preview["Std. Error"], subsample["Std. Error"] * preview.attrs["preview"]["se_factor"])
+
+        # the record of the preview describes the subsample
+        record = result_record(preview, preview_data, 3)
+        self.assertEqual(record["n_obs"], len(sample))
+        pd.testing.assert_series_equal(record["bin_days"], temperature_bin_days(sample, 3))
+
+    def test_preview_standard_errors_rescaled(self):
+        panel = synthetic_panel(n_zones=40, n_days=1000, seed=1)
+        full = clustered_binned_regression(panel, "PU", "None")
+        preview, sample = preview_binned_regression(panel, "PU", "None", seed=3)
+        bins = [name for name in full.index if name.startswith("C(temp_bins")]
+
+        # unscaled subsample SEs are about three times too wide, rescaled ones are close to the full-sample SEs
+        unscaled = clustered_binned_regression(sample, "PU", "None").loc[bins, "Std. Error"] / full.loc[bins, "Std. Error"]
+        ratio = preview.loc[bins, "Std. Error"] / full.loc[bins, "Std. Error"]
+        self.assertGreater(unscaled.median(), 2.5)
+        self.assertTrue(0.5 < ratio.median() < 2)
+        self.assertTrue(ratio.between(0.4, 2.5).all())
+
+    def test_combine_codes(self):
+        codes = combine_codes(np.array([0, 0, 1, 1, -1]), np.array([3, 5, 3, 3, 0]))
+        self.assertEqual(list(codes), [0, 1, 2, 2, -1])
+
+    def test_pooled_interaction_regression(self):
+        zones = self.panel.index.get_level_values("PULocationID").unique()
+        single_group = pd.Series("all", index=zones)
+        effects, tests = pooled_interaction_regression(self.panel, "PU", "None", single_group)
+        expected = clustered_binned_regression(self.panel, "PU", "None")
+        np.testing.assert_allclose(effects["Coefficient"].to_numpy(), expected["Coefficient"].to_numpy()[:len(effects)])
+
+        two_groups = pd.Series(np.where(zones < 8, "lower", "upper"), index=zones)
+        effects, tests = pooled_interaction_regression(self.panel, "PU", "None", two_groups)
+        self.assertEqual(len(effects), 2 * len(tests.index[:-1]))
+        self.assertTrue(tests["p-value"].between(0, 1).all())
+        self.assertEqual(effects.attrs["dropped_cells"], [])
+
+    def test_pooled_interaction_matches_dense_fit(self):
+        # upper zones never see the [29.0, 32.0] bin: the empty cell is dropped instead of making X'X singular
+        zones = self.panel.index.get_level_values("PULocationID")
+        panel = self.panel[~((zones >= 8) & (self.panel["temp_bins"] == "[29.0, 32.0]"))]
+        groups = pd.Series(np.where(zones.unique() < 8, "lower", "upper"), index=zones.unique())
+        effects, tests = pooled_interaction_regression(panel, "PU", "None", groups)
+
+        self.assertEqual(effects.attrs["dropped_cells"], [("upper", "[29.0, 32.0]")])
+        self.assertTrue(np.isnan(effects.loc[("upper", "[29.0, 32.0]"), "Coefficient"]))
+        self.assertEqual(tests.loc["[29.0, 32.0]", "df"], 0)
+
+        # dense OLS of the same pooled specification: group x bin dummies, shared controls and fixed effects
+        data = panel.reset_index()
+        group = data["PULocationID"].map(groups)
+        cells = [cell for cell in effects.index if cell not in effects.attrs["dropped_cells"]]
+        dummies = pd.DataFrame({f"{g}_{b}": ((group == g) & (data["temp_bins"] == b)).astype(float) for g, b in cells})
+        fixed_effects = pd.get_dummies(data[["PULocationID", "Year_fact"]].astype(str), drop_first=True, dtype=float)
+        controls = data[["pr_obs", "Snowdepth", "AWND", "weekday", "holiday", "cheby_1", "cheby_2", "cheby_3", "cheby_4", "cheby_5"]]
+        X = sm.add_constant(pd.concat([dummies, controls, fixed_effects], axis=1))
+        dense = sm.OLS(data["log_total"], X).fit(cov_type="cluster", cov_kwds={"groups": data["PULocationID"], "use_correction": False, "df_correction": False})
+
+        fitted = effects.loc[cells]
+        np.testing.assert_allclose(fitted["Coefficient"].to_numpy(), dense.params[dummies.columns].to_numpy(), rtol=1e-6, atol=1e-10)
+        np.testing.assert_allclose(fitted["Std. Error"].to_numpy(), dense.bse[dummies.columns].to_numpy(), rtol=1e-6)
+
+    def test_temperature_bin_codes(self):
+        codes, labels, midpoints = temperature_bin_codes(np.array([-10.0, 18.5, 36.0, 41.0]), 3)
+        self.assertEqual([labels[c] for c in codes[:3]], ["[-10.001, -7.0]", "[17.0, 20.0]", "[32.0, 35.0]"])
+        self.assertEqual(codes[3], -1)
+
+    def test_bin_size_sweep(self):
+        sweep = bin_size_sweep(self.panel, "PU", "None", bin_sizes=(3, 5))
+        expected = clustered_binned_regression(self.panel, "PU", "None")
+
+        three_degrees = sweep[(sweep["bin_size"] == 3) & (sweep["temp_bins"] != "[17.0, 20.0]")].set_index("temp_bins")
+        for temp_bin, row in three_degrees.iterrows():
+            name = f"C(temp_bins, Treatment(reference='[17.0, 20.0]'))[T.{temp_bin}]"
+            self.assertAlmostEqual(row["Coefficient"], expected.loc[name, "Coefficient"], places=10)
+            self.assertAlmostEqual(row["Std. Error"], expected.loc[name, "Std. Error"], places=10)
+        self.assertIn("[15.0, 20.0]", sweep.loc[sweep["bin_size"] == 5, "temp_bins"].tolist())
+
+    def test_wild_cluster_bootstrap(self):
+        first = wild_cluster_bootstrap(self.panel, "PU", "None", n_boot=499, seed=1)
+        second = wild_cluster_bootstrap(self.panel, "PU", "None", n_boot=499, seed=1, weights="webb")
+
+        self.assertTrue(first["Bootstrap p-value"].between(0, 1).all())
+        self.assertTrue((first["Lower CI"] < first["Coefficient"]).all())
+        # strong positive effect in the hottest bin is detected
+        hot_bin = "C(temp_bins, Treatment(reference='[17.0, 20.0]'))[T.[32.0, 35.0]]"
+        self.assertLess(first.loc[hot_bin, "Bootstrap p-value"], 0.05)
+        self.assertLess(second.loc[hot_bin, "Bootstrap p-value"], 0.05)
+        # reproducible with a seed
+        pd.testing.assert_frame_equal(first, wild_cluster_bootstrap(self.panel, "PU", "None", n_boot=499, seed=1))
+
+    def test_wild_cluster_bootstrap_matches_refits(self):
+        # few clusters: every replication refitted with the same Rademacher weights
+        panel = synthetic_panel(n_zones=6, n_days=150, seed=3)
+        design = binned_design(panel, "PU", "None")
+        fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+        codes, n_clusters = cluster_codes(panel_cluster_codes(panel, "entity")[design["mask"], 0])
+        v = np.random.default_rng(7).choice(np.array([-1.0, 1.0]), size=(19, n_clusters))
+
+        for impose_null in [True, False]:
+            result = wild_cluster_bootstrap(panel, "PU", "None", n_boot=19, seed=7, impose_null=impose_null)
+
+            for j, name in enumerate(design["bin_names"]):
+                se = np.sqrt(cluster_covariance(fit["X"], fit["resid"], fit["xtx_inv"], codes)[j, j])
+                self.assertAlmostEqual(result.loc[name, "T-stat"], fit["params"][j] / se, places=8)
+
+                if impose_null:
+                    restricted = fit_absorbed_ols(design["y"], np.delete(design["X"], j, axis=1), design["fe_codes"])
+                    fitted, resid, null = design["y"] - restricted["resid"], restricted["resid"], 0.0
+                else:
+                    fitted, resid, null = design["y"] - fit["resid"], fit["resid"], fit["params"][j]
+
+                t_boot = []
+                for draw in v:
+                    refit = fit_absorbed_ols(fitted + draw[codes] * resid, design["X"], design["fe_codes"])
+                    cov = cluster_covariance(refit["X"], refit["resid"], refit["xtx_inv"], codes)
+                    t_boot.append((refit["params"][j] - null) / np.sqrt(cov[j, j]))
+
+                np.testing.assert_allclose(result.attrs["t_boot"][:, j], t_boot, rtol=1e-7, atol=1e-9)
+                self.assertEqual(result.loc[name, "Bootstrap p-value"], np.mean(np.abs(t_boot) >= np.abs(fit["params"][j] / se) * (1 - 1e-9)))
+
+    def test_permutation_inference(self):
+        result = permutation_inference(self.panel, "PU", "None", n_draws=199, seed=2)
+        expected = clustered_binned_regression(self.panel, "PU", "None")
+        np.testing.assert_allclose(result["Coefficient"], expected.loc[result.index, "Coefficient"], rtol=1e-9)
+
+        # hot-bin effect is far outside the placebo distribution, which is centred at zero
+        hot_bin = "C(temp_bins, Treatment(reference='[17.0, 20.0]'))[T.[32.0, 35.0]]"
+        self.assertEqual(result.loc[hot_bin, "Permutation p-value"], 1 / 200)
+        self.assertLess(np.abs(result["Placebo Mean"]).max(), 0.01)
+        self.assertEqual(result.attrs["draws"].shape, (199, len(result)))
+
+    def test_jackknife_zones(self):
+        summary, influence = jackknife_zones(self.panel, "PU", "None")
+        expected = clustered_binned_regression(self.panel, "PU", "None")
+        np.testing.assert_allclose(summary["Coefficient"], expected.loc[summary.index, "Coefficient"], rtol=1e-9)
+
+        # downdated coefficients equal a re-fit without the zone
+        refit = clustered_binned_regression(self.panel.drop(index=5, level="PULocationID"), "PU", "None")
+        np.testing.assert_allclose(influence.loc[5, summary.index] + summary["Coefficient"], refit.loc[summary.index, "Coefficient"], atol=1e-12)
+        self.assertEqual(influence["n_obs"].sum(), len(self.panel))
+
+    def test_distributed_lag_regression(self):
+        result, cumulative = distributed_lag_regression(self.panel, "PU", "None", n_lags=1, heat_threshold=30)
+
+        # same model from lagged bins merged on the previous calendar day
+        panel = self.panel.reset_index()
+        day_bins = panel.drop_duplicates("date_pickup").set_index("date_pickup")["temp_bins"]
+        panel["lag_bins"] = (panel["date_pickup"] - pd.Timedelta(days=1)).map(day_bins)
+        hot = (day_bins.index.to_series().map(panel.drop_duplicates("date_pickup").set_index("date_pickup")["tmax_obs"]) >= 30).astype(int)
+        spell = hot.groupby((hot == 0).cumsum()).cumsum()
+        panel["heat_wave_days"] = panel["date_pickup"].map(spell).astype(float)
+        panel = panel.dropna(subset=["lag_bins"]).set_index(["PULocationID", "Year_fact"])
+
+        design = binned_design(panel, "PU", "None")
+        lag_design = binned_design(panel.assign(temp_bins=panel["lag_bins"]), "PU", "None")
+        n_bins = len(design["bin_names"])
+        X = np.column_stack([design["X"][:, :n_bins], lag_design["X"][:, :n_bins], panel[["heat_wave_days"]].to_numpy(), design["X"][:, n_bins:]])
+        fit = fit_absorbed_ols(design["y"], X, design["fe_codes"])
+
+        np.testing.assert_allclose(result["Coefficient"].to_numpy(), fit["params"], atol=1e-10)
+        np.testing.assert_allclose(cumulative["Cumulative Coefficient"].to_numpy(), fit["params"][:n_bins] + fit["params"][n_bins:2 * n_bins], atol=1e-10)
+
+    def test_distributed_lag_split_and_missing_zone_days(self):
+        # weekday split: Mondays keep the Sunday bins as lags
+        weekdays, _ = distributed_lag_regression(self.panel, "PU", "weekday", n_lags=1)
+        panel = self.panel.reset_index()
+        day_bins = panel.drop_duplicates("date_pickup").set_index("date_pickup")["temp_bins"]
+        panel["lag_bins"] = (panel["date_pickup"] - pd.Timedelta(days=1)).map(day_bins)
+        panel = panel[(panel["weekday"] == 1)].dropna(subset=["lag_bins"]).set_index(["PULocationID", "Year_fact"])
+        self.assertEqual(weekdays.attrs["n_obs"], len(panel))
+        self.assertNotIn("weekday", weekdays.index)
+
+        with self.assertRaises(ValueError):
+            distributed_lag_regression(self.panel[self.panel["weekday"] == 1], "PU", "weekday", n_lags=1)
+
+        # an unobserved zone-day is not filled from other zones: only that zone's next day loses its lag
+        zones = self.panel.index.get_level_values("PULocationID")
+        gap = self.panel[~((zones == 5) & (self.panel["date_pickup"] == pd.Timestamp("2016-03-01")))]
+        result, _ = distributed_lag_regression(gap, "PU", "None", n_lags=1)
+        full, _ = distributed_lag_regression(self.panel, "PU", "None", n_lags=1)
+        self.assertEqual(result.attrs["n_obs"], full.attrs["n_obs"] - 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+import unittest
+
+from binned_regression import binned_regression, result_record
+from result_store import save_results
+from figure_renderer import render_coefficient_figures, figure_jobs_from_store
+from synthetic_panel import synthetic_panel
+
+
+class TestFigureRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render_from_store(self):
+        panel = synthetic_panel()
+        panel["borough_month_year"] = pd.factorize(panel["borough_month_year"])[0]
+        store = os.path.join(self.directory, "results.sqlite")
+        for workday_split in ["None", "weekday"]:
+            record = result_record(binned_regression(panel, "PU", workday_split), panel, 3)
+            save_results(workday_split, record, store)
+
+        jobs = figure_jobs_from_store({"None": "all_days", "weekday": "weekdays"}, os.path.join(self.directory, "figures"), store)
+        jobs[1]["path"] = jobs[1]["path"].replace(".png", ".pdf")
+        paths = render_coefficient_figures(jobs, max_workers=2)
+
+        self.assertEqual([os.path.basename(p) for p in paths], ["all_days.png", "weekdays.pdf"])
+        for path in paths:
+            self.assertGreater(os.path.getsize(path), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
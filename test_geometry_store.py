@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+
+from geometry_store import read_geometries, read_geometry_table, store_path
+
+
+class TestGeometryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "zones.csv")
+        self.frame = pd.DataFrame({
+            'location_i': [1, 2, 3],
+            'zone': ['A', 'B', None],
+            'geometry': [box(0, 0, 1, 2).wkt, shapely.MultiPolygon([box(2, 2, 3, 3), box(4, 4, 5, 6)]).wkt, None],
+        })
+        self.frame.to_csv(self.source, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        parsed = read_geometries(self.source, directory=self.directory)
+        stored = read_geometries(self.source, directory=self.directory)
+
+        self.assertEqual(list(stored.columns), ['location_i', 'zone', 'geometry'])
+        self.assertEqual(stored.crs, "EPSG:4326")
+        self.assertTrue(stored.geometry.iloc[2] is None)
+        np.testing.assert_array_equal(shapely.equals_exact(np.asarray(parsed.geometry.array[:2]), np.asarray(stored.geometry.array[:2]), 0), True)
+
+        table = read_geometry_table(self.source, directory=self.directory)
+        np.testing.assert_allclose(table.loc[1, ['minx', 'miny', 'maxx', 'maxy']].to_numpy(dtype=float), [2, 2, 5, 6])
+        np.testing.assert_allclose(table.loc[0, ['centroid_x', 'centroid_y']].to_numpy(dtype=float), [0.5, 1.0])
+        self.assertTrue(np.isnan(table.loc[2, 'centroid_x']))
+
+    def test_rebuilt_when_source_changes(self):
+        read_geometries(self.source, directory=self.directory)
+        self.frame.loc[0, 'geometry'] = box(0, 0, 3, 3).wkt
+        self.frame.to_csv(self.source, index=False)
+        os.utime(self.source, (0, 0))
+
+        self.assertAlmostEqual(read_geometries(self.source, directory=self.directory).geometry.iloc[0].area, 9.0)
+        self.assertTrue(os.path.isdir(store_path(self.source, directory=self.directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import box, Polygon
+
+from gridded_temperature import zone_area_weights, zone_day_exposure, ingest_gridded_temperature, zone_temperature_lookup
+from binned_regression import binned_regression_data, temperature_bin_days, preview_sample
+
+
+class TestGriddedTemperature(unittest.TestCase):
+
+    def setUp(self):
+        # 5 x 6 grid of 0.5 x 0.5 cells, north-up with the upper left corner at (0, 3)
+        self.transform = (0.5, 0.0, 0.0, 0.0, -0.5, 3.0)
+        self.shape = (6, 6)
+        self.zones = gpd.GeoDataFrame({'location_i': [4, 7, 9]}, geometry=[
+            box(0.2, 0.3, 1.1, 1.4),
+            Polygon([(1.5, 1.5), (2.9, 1.6), (2.0, 2.8)]),
+            box(10, 10, 11, 11),
+        ])
+        self.dates = pd.date_range("2019-07-01", periods=10)
+        self.grid = 25 + np.random.default_rng(0).normal(size=(10,) + self.shape)
+        self.grid[2, 4, 1] = np.nan
+
+    def _cells(self):
+        rows, cols = [g.ravel() for g in np.mgrid[0:self.shape[0], 0:self.shape[1]]]
+        return shapely.box(cols * 0.5, 3 - (rows + 1) * 0.5, (cols + 1) * 0.5, 3 - rows * 0.5)
+
+    def test_area_weights(self):
+        weights = zone_area_weights(self.zones, self.transform, self.shape).toarray()
+        for i, geom in enumerate(self.zones.geometry[:2]):
+            areas = shapely.area(shapely.intersection(geom, self._cells()))
+            np.testing.assert_allclose(weights[i], areas / areas.sum(), atol=1e-12)
+        self.assertEqual(weights[2].sum(), 0)
+
+        # same cells on a south-up grid (rows reversed)
+        south_up = zone_area_weights(self.zones, (0.5, 0.0, 0.0, 0.0, 0.5, 0.0), self.shape).toarray()
+        np.testing.assert_allclose(south_up.reshape(3, 6, 6)[:, ::-1], weights.reshape(3, 6, 6), atol=1e-12)
+
+    def test_exposure(self):
+        weights = zone_area_weights(self.zones, self.transform, self.shape)
+        chunks = ((self.dates[s:s + 4], self.grid[s:s + 4]) for s in range(0, 10, 4))
+        exposure = zone_day_exposure(chunks, weights)
+
+        dense = weights.toarray()
+        values = self.grid.reshape(10, -1)
+        for i in range(2):
+            cells = dense[i] > 0
+            valid = np.isfinite(values[:, cells])
+            expected_mean = np.nansum(values[:, cells] * dense[i, cells], axis=1) / (valid * dense[i, cells]).sum(axis=1)
+            np.testing.assert_allclose(exposure["mean"][:, i], expected_mean, rtol=1e-6)
+            np.testing.assert_allclose(exposure["max"][:, i], np.nanmax(values[:, cells], axis=1), rtol=1e-6)
+        self.assertTrue(np.isnan(exposure["mean"][:, 2]).all() and np.isnan(exposure["max"][:, 2]).all())
+
+    def test_ingest_and_lookup(self):
+        output = os.path.join(tempfile.mkdtemp(), "zone_day.npz")
+        chunks = iter([(self.transform, self.shape)] + [(self.dates[s:s + 3], self.grid[s:s + 3] + 273.15) for s in range(0, 10, 3)])
+        ingest_gridded_temperature(chunks, self.zones, output, offset=-273.15)
+
+        with np.load(output) as stored:
+            maximum = stored["max"]
+        lookup = zone_temperature_lookup(["2019-07-03", "2019-07-05", "2019-08-01", "2019-07-05"], [7, 4, 4, 99], output)
+
+        np.testing.assert_allclose(lookup[:2], [maximum[2, 1], maximum[4, 0]])
+        self.assertTrue(np.isnan(lookup[2:]).all())
+
+
+    @unittest.skipUnless(importlib.util.find_spec("openpyxl"), "binned_regression_data reads the hotel occupancy from Excel")
+    def test_binned_regression_data_with_zone_temperature(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for folder in ["Pooled_data/PU/final", "Shapefiles", "NYC_weather", "ACS_data"]:
+            os.makedirs(os.path.join(directory, "Data", folder))
+
+        # 3 zones x 100 days with a constant city-wide reading and zone-specific maxima
+        rng = np.random.default_rng(1)
+        dates, zones = pd.date_range("2019-05-01", periods=100), np.array([4, 7, 9])
+        maximum = rng.uniform(5, 34, (len(dates), len(zones))).astype(np.float32)
+        maximum[3, 2] = np.nan
+        # rare bins: 6 zone-days on 2 days (kept as zone-days, <1% as days) and 2 zone-days (dropped)
+        maximum[10:12] = -5.0
+        maximum[20, 0] = maximum[21, 1] = -2.0
+        np.savez(os.path.join(directory, "zone_day.npz"), dates=dates.to_numpy(dtype="datetime64[D]"), zones=zones, max=maximum, mean=maximum)
+
+        taxi = pd.DataFrame({"date_pickup": np.repeat(dates.strftime("%Y-%m-%d"), 3), "PULocationID": np.tile(zones, len(dates)),
+                             "Year_fact": 2, "tmax_obs": 25.0, "trip_number": 10.0, "log_total": np.log(11.0), "zero_trips": 0,
+                             "Weekday_index": np.repeat(dates.dayofweek, 3)})
+        taxi.to_csv(os.path.join(directory, "Data/Pooled_data/PU/final/final_data_YG_PU.csv"), index=False)
+        pd.DataFrame({"LocationID": zones, "Borough": ["Queens", "Bronx", "Queens"], "community_district": [1, 2, 3]}).to_csv(
+            os.path.join(directory, "Data/Shapefiles/taxi+_zone_lookup.csv"), index=False)
+        pd.DataFrame({"DATE": dates.strftime("%Y-%m-%d"), "daylight_time": 900, "DailyAverageRelativeHumidity": 60,
+                      "DailyAverageWetBulbTemperature": 60}).to_csv(os.path.join(directory, "Data/NYC_weather/climate_NYC_with_humidity.csv"), index=False)
+        pd.DataFrame({"Year_Month": ["2019-05", "2019-06", "2019-07", "2019-08"], "occupancy": 0.8}).to_excel(
+            os.path.join(directory, "Data/NYC_weather/NYC_monthly_hotel.xlsx"), index=False)
+        pd.DataFrame({"LocationID": zones, "medincome": [1, 2, 3], "temperature_deviation_summer": [0.1, 0.2, 0.3]}).to_csv(
+            os.path.join(directory, "Data/ACS_data/taxi_zones_ACS_parks_beaches_deviation.csv"), index=False)
+
+        cwd = os.getcwd()
+        os.chdir(directory)
+        self.addCleanup(os.chdir, cwd)
+        panel = binned_regression_data("PU", 3, subset="YG", zone_temperature="zone_day.npz")
+        excluded = binned_regression_data("PU", 3, subset="YG", zone_temperature="zone_day.npz", exclude_minimum_bin=True)
+
+        # zone-day maxima replace the city-wide reading, uncovered zone-days are dropped
+        self.assertEqual(len(panel), 3 * len(dates) - 1)
+        self.assertTrue((panel["tmax_obs_city"] == 25).all())
+        expected = maximum[(panel["date_pickup"] - dates[0]).dt.days.to_numpy(), pd.Index(zones).get_indexer(panel.index.get_level_values(0))]
+        np.testing.assert_allclose(panel["tmax_obs"], expected)
+
+        # bins are counted over zone-days
+        zone_day_bins = pd.cut(pd.Series(maximum.ravel()).dropna(), np.arange(-10, 41, 3), include_lowest=True).value_counts(sort=False)
+        counts = temperature_bin_days(panel, 3)
+        self.assertEqual(counts.sum(), zone_day_bins[zone_day_bins > 1].sum())
+        self.assertEqual(counts["(-7.0, -4.0]"], 6)
+        self.assertEqual(set(panel["temp_bins"]) - set(excluded["temp_bins"]), {"[-4.0, -1.0]"})
+
+        with self.assertRaises(ValueError):
+            preview_sample(panel)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import numpy as np
+import unittest
+import statsmodels.api as sm
+
+from mobility_response_by_neighborhood import batched_zone_regression
+from synthetic_panel import synthetic_panel
+
+
+class TestBatchedZoneRegression(unittest.TestCase):
+
+    def test_matches_zone_by_zone_ols(self):
+        data = synthetic_panel(n_zones=6, n_days=800).reset_index()
+        data["Weekday_index"] = data["date_pickup"].dt.dayofweek + 1
+        # zone 3 is not observed in the first year
+        data = data[~((data["PULocationID"] == 3) & (data["Year_fact"] == 1))]
+
+        results = batched_zone_regression(data, "PU", "None")
+
+        formula = 'log_total ~ 1 + tmax_obs + pr_obs + Snowdepth + workday + holiday + cheby_1 + cheby_2 + cheby_3 + cheby_4 + cheby_5 + C(Year_fact)'
+        for zone in [2, 3]:
+            zone_data = data[data["PULocationID"] == zone].copy()
+            zone_data["workday"] = np.where((zone_data["Weekday_index"] == 6) | (zone_data["Weekday_index"] == 7), 0, 1)
+            expected = sm.formula.ols(formula, data=zone_data).fit(cov_type="HC3")
+
+            self.assertAlmostEqual(results.loc[zone, "Coefficient_tmax_obs"], expected.params["tmax_obs"], places=10)
+            self.assertAlmostEqual(results.loc[zone, "CI_lower"], expected.conf_int().loc["tmax_obs", 0], places=10)
+            self.assertEqual(results.loc[zone, "num_observations"], expected.nobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
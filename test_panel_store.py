@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import unittest
+
+from fe_estimation import clustered_binned_regression
+from panel_store import write_panel_store, attach_panel, remove_panel_store, split_mask, panel_view, parallel_binned_regressions
+from synthetic_panel import synthetic_panel
+
+
+class TestPanelStore(unittest.TestCase):
+
+    def setUp(self):
+        # unbalanced panel: views and splits must follow the stored rows, not a zone x day grid
+        self.panel = synthetic_panel(missing_share=0.1)
+        self.path = write_panel_store(self.panel)
+
+    def tearDown(self):
+        remove_panel_store(self.path)
+
+    def test_attach_is_zero_copy(self):
+        store = attach_panel(self.path)
+        self.assertIsInstance(store["columns"]["log_total"], np.memmap)
+        self.assertFalse(store["columns"]["log_total"].flags.writeable)
+
+        view = panel_view(store, ["temp_bins", "log_total", "date_pickup"])
+        pd.testing.assert_series_equal(view["log_total"], self.panel["log_total"])
+        self.assertEqual(list(view["temp_bins"].astype(str)), list(self.panel["temp_bins"]))
+        self.assertEqual(list(view.index.names), list(self.panel.index.names))
+
+    def test_contiguous_mask_view(self):
+        store = attach_panel(self.path)
+        mask = np.zeros(len(self.panel), dtype=bool)
+        mask[100:400] = True
+
+        view = panel_view(store, ["log_total", "temp_bins"], mask)
+        pd.testing.assert_series_equal(view["log_total"], self.panel["log_total"].iloc[100:400])
+        self.assertEqual(len(panel_view(store, ["log_total"], np.zeros(len(self.panel), dtype=bool))), 0)
+
+    def test_split_mask(self):
+        store = attach_panel(self.path)
+        mask = split_mask(store, "weekday", {"Borough": ["Queens"]})
+        expected = ((self.panel["weekday"] == 1) & (self.panel["Borough"] == "Queens")).to_numpy()
+        np.testing.assert_array_equal(mask, expected)
+
+    def test_parallel_binned_regressions(self):
+        specs = [{"level": "PU", "workday_split": "None"},
+                 {"level": "PU", "workday_split": "weekday", "filters": {"Borough": ["Queens"]}}]
+        results = parallel_binned_regressions(self.path, specs, max_workers=2)
+
+        subset = self.panel[(self.panel["weekday"] == 1) & (self.panel["Borough"] == "Queens")]
+        expected = [clustered_binned_regression(self.panel, "PU", "None"), clustered_binned_regression(subset, "PU", "weekday")]
+        for result, reference in zip(results, expected):
+            pd.testing.assert_frame_equal(result, reference, check_exact=False, rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
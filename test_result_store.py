@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import unittest
+from unittest import mock
+
+from binned_regression import binned_regression, binned_regression_inputs, result_record, coefficient_table
+from result_store import cached_binned_regression, load_results, save_results, list_results, spec_key, panel_fingerprint, file_fingerprint
+from synthetic_panel import synthetic_panel
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        # unbalanced panel with integer cluster codes as in binned_regression_data
+        self.panel = synthetic_panel(seed=5, missing_share=0.05)
+        self.panel["borough_month_year"] = pd.factorize(self.panel["borough_month_year"])[0]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "results.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        results = binned_regression(self.panel, "PU", "None")
+        record = result_record(results, self.panel, 3, spec={"level": "PU"})
+        save_results("key", record, self.path)
+        loaded = load_results("key", self.path)
+
+        pd.testing.assert_series_equal(loaded["params"], record["params"])
+        pd.testing.assert_frame_equal(loaded["cov"], record["cov"])
+        pd.testing.assert_series_equal(loaded["bin_days"], record["bin_days"], check_names=False)
+        self.assertEqual(loaded["n_clusters"], {"entity": 12})
+        self.assertIsNone(load_results("missing", self.path))
+
+        # table intervals are the ones of linearmodels
+        table = coefficient_table(loaded, percent=False).set_index("temp_bins")
+        name = "C(temp_bins, Treatment(reference='[17.0, 20.0]'))[T.[29.0, 32.0]]"
+        np.testing.assert_allclose(table.loc["[29.0, 32.0]", ["Lower CI", "Upper CI"]].to_numpy(float), results.conf_int().loc[name].to_numpy())
+        self.assertEqual(table.loc["[17.0, 20.0]", "Coefficient"], 0)
+
+    def test_cached_estimation(self):
+        first = cached_binned_regression("PU", "None", 3, panel_data=self.panel, path=self.path)
+        second = cached_binned_regression("PU", "None", 3, panel_data=self.panel, path=self.path)
+        self.assertEqual(len(list_results(self.path)), 1)
+        pd.testing.assert_series_equal(first["params"], second["params"])
+
+        # new inputs give a new key
+        changed = self.panel.assign(log_total=self.panel["log_total"] + 1)
+        self.assertNotEqual(spec_key({}, panel_fingerprint(changed)), spec_key({}, panel_fingerprint(self.panel)))
+        cached_binned_regression("PU", "weekday", 3, panel_data=self.panel, path=self.path)
+        self.assertEqual(len(list_results(self.path)), 2)
+
+    def test_cache_hit_skips_panel_build(self):
+        # input files of binned_regression_data in a temporary Data tree
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        inputs = binned_regression_inputs("PU", "FHV")
+        for input_path in inputs:
+            os.makedirs(os.path.dirname(input_path), exist_ok=True)
+            with open(input_path, "w") as f:
+                f.write("x")
+
+        data_spec = {"subset": "FHV", "daytime": "day"}
+        with mock.patch("result_store.binned_regression_data", return_value=self.panel) as build:
+            first = cached_binned_regression("PU", "None", 3, data_spec, path=self.path)
+            second = cached_binned_regression("PU", "None", 3, data_spec, path=self.path)
+            self.assertEqual(build.call_count, 1)
+            build.assert_called_once_with("PU", 3, workday_split="None", exclude_zeros=False, subset="FHV", daytime="day")
+            pd.testing.assert_series_equal(first["params"], second["params"])
+
+            # a changed input file gives a new key and a rebuild
+            fingerprint = file_fingerprint(inputs)
+            with open(inputs[0], "a") as f:
+                f.write("y")
+            self.assertNotEqual(file_fingerprint(inputs), fingerprint)
+            cached_binned_regression("PU", "None", 3, data_spec, path=self.path)
+            self.assertEqual(build.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import unittest
+
+from fe_estimation import binned_design, fit_absorbed_ols, cluster_covariance, combine_codes, cluster_codes
+from spatial_hac import spatial_kernel, conley_covariance, conley_binned_regression
+from geo_utils import EARTH_RADIUS_KM
+from synthetic_panel import synthetic_panel
+
+
+class TestSpatialHAC(unittest.TestCase):
+
+    def setUp(self):
+        # zones missing on some days: kernel sums run over the observed zone-days only
+        self.panel = synthetic_panel(n_zones=16, seed=4, missing_share=0.05)
+        rng = np.random.default_rng(4)
+        zones = np.unique(self.panel.index.get_level_values("PULocationID"))
+        self.centroids = pd.DataFrame({"lon": -73.95 + rng.uniform(-0.1, 0.1, len(zones)),
+                                       "lat": 40.75 + rng.uniform(-0.1, 0.1, len(zones))}, index=zones)
+
+    def test_kernel_pairs(self):
+        kernel = spatial_kernel(self.centroids, self.centroids.index, 6.0).toarray()
+
+        lon, lat = np.radians(self.centroids["lon"].to_numpy()), np.radians(self.centroids["lat"].to_numpy())
+        a = np.sin((lat[:, None] - lat) / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat) * np.sin((lon[:, None] - lon) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        np.testing.assert_allclose(kernel, np.where(distance < 6.0, 1 - distance / 6.0, 0), atol=1e-9)
+        self.assertIs(spatial_kernel(self.centroids, self.centroids.index, 6.0), spatial_kernel(self.centroids, self.centroids.index, 6.0))
+
+    def test_limits_match_clustering(self):
+        design = binned_design(self.panel, "PU", "None")
+        fit = fit_absorbed_ols(design["y"], design["X"], design["fe_codes"])
+        zone_codes = design["fe_codes"][0]
+        day_codes = cluster_codes(self.panel["date_pickup"])[0]
+
+        # no neighbours: clustering by zone-day; all zones neighbours (uniform): clustering by day
+        alone = spatial_kernel(self.centroids, self.centroids.index, 1e-6)
+        everyone = spatial_kernel(self.centroids, self.centroids.index, 1000.0, kernel="uniform")
+        for kernel, clusters in [(alone, combine_codes(zone_codes, day_codes)), (everyone, day_codes)]:
+            np.testing.assert_allclose(conley_covariance(fit["X"], fit["resid"], fit["xtx_inv"], zone_codes, day_codes, kernel),
+                                       cluster_covariance(fit["X"], fit["resid"], fit["xtx_inv"], clusters), rtol=1e-8, atol=1e-14)
+
+        result = conley_binned_regression(self.panel, "PU", "None", cutoff_km=5.0, centroids=self.centroids)
+        self.assertTrue((result["Std. Error"] > 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from datetime import timedelta, datetime
+
+from weather_ingestion import lcd_daily_summary, lcd_numeric, hhmm_to_minutes, LCD_DAILY_COLUMNS, heat_index, hourly_heat_stress, ingest_hourly_heat_stress, hourly_heat_lookup, \
+    station_daily_table, interpolation_weights, interpolate_daily_weather, merge_zone_weather
+from geo_utils import EARTH_RADIUS_KM
+
+
+class TestWeatherIngestion(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        days = pd.date_range("2019-06-01", periods=20)
+        rows = []
+        for day in days:
+            for hour in range(0, 24, 6):
+                rows.append({"STATION": "USW00094728", "DATE": f"{day:%Y-%m-%d}T{hour:02d}:51:00", "REPORT_TYPE": "FM-15",
+                             "HourlyDryBulbTemperature": str(rng.integers(60, 95)), "HourlyRelativeHumidity": str(rng.integers(20, 95)),
+                             "HourlyWetBulbTemperature": "" if hour == 6 else str(rng.integers(50, 80))})
+            rows.append({"STATION": "USW00094728", "DATE": f"{day:%Y-%m-%d}T23:59:00", "REPORT_TYPE": "SOD  ",
+                         "DailyAverageRelativeHumidity": str(rng.integers(30, 90)),
+                         "DailyMaximumDryBulbTemperature": str(rng.integers(70, 100)) + ("s" if day.day == 3 else ""),
+                         "DailyPrecipitation": "T" if day.day % 4 == 0 else f"{rng.uniform(0, 1):.2f}",
+                         "DailySnowDepth": "0", "DailySnowfall": "T" if day.day == 5 else "0.0",
+                         "Sunrise": str(425 + day.day), "Sunset": str(1920 + day.day)})
+        self.path = os.path.join(tempfile.mkdtemp(), "lcd.csv")
+        pd.DataFrame(rows).reindex(columns=["STATION", "HourlyDryBulbTemperature", "HourlyWetBulbTemperature", "HourlyRelativeHumidity", "HourlyDewPointTemperature"] + LCD_DAILY_COLUMNS).to_csv(self.path, index=False)
+
+    def test_matches_row_wise_reference(self):
+        daily = lcd_daily_summary(self.path, chunksize=17)
+
+        # reference: filtering after reading and row-wise daylight time
+        climate = pd.read_csv(self.path)
+        reference = climate[climate["REPORT_TYPE"] == "SOD  "]
+        trace = reference[["DailySnowfall", "DailyPrecipitation", "DailySnowDepth"]].replace("T", 0.00).astype(float)
+        to_time = lambda t: (datetime.min + timedelta(hours=t // 100, minutes=t % 100)).time()
+        daylight = [int((pd.to_datetime(str(to_time(s2)), format="%H:%M:%S") - pd.to_datetime(str(to_time(s1)), format="%H:%M:%S")).total_seconds() / 60)
+                    for s1, s2 in zip(reference["Sunrise"], reference["Sunset"])]
+
+        self.assertEqual(len(daily), 20)
+        np.testing.assert_array_equal(daily["DATE"], pd.to_datetime(reference["DATE"].str.split("T").str[0]))
+        np.testing.assert_allclose(daily[["DailySnowfall", "DailyPrecipitation", "DailySnowDepth"]].to_numpy(dtype=float), trace.to_numpy())
+        np.testing.assert_array_equal(daily["daylight_time"].to_numpy(dtype=int), daylight)
+        self.assertEqual(daily["Sunrise"].iloc[0], str(to_time(426)))
+        self.assertFalse(daily["DailyMaximumDryBulbTemperature"].isna().any())
+
+    def test_parsers(self):
+        np.testing.assert_allclose(lcd_numeric(["T", " 0.05s", "M", "", "71*"]), [0.0, 0.05, np.nan, np.nan, 71.0])
+        np.testing.assert_array_equal(hhmm_to_minutes([0, 459, 1952]), [0, 299, 1192])
+
+    def test_heat_index(self):
+        # NWS table values: 90°F at 60% -> 100°F, 80°F at 40% -> 80°F, 70°F (simple formula)
+        fahrenheit = lambda c: c * 9 / 5 + 32
+        np.testing.assert_allclose(fahrenheit(heat_index((np.array([90.0, 80.0]) - 32) * 5 / 9, [60, 40])), [100.0, 80.0], atol=0.5)
+        self.assertAlmostEqual(fahrenheit(heat_index((70 - 32) * 5 / 9, 50)[()]), 0.5 * (70 + 61 + 2 * 1.2 + 50 * 0.094))
+
+    def test_hourly_heat_stress(self):
+        hourly = hourly_heat_stress(self.path, chunksize=13)
+        self.assertEqual(hourly["values"].shape, (20, 24, 4))
+
+        climate = pd.read_csv(self.path)
+        observed = climate[climate["REPORT_TYPE"] == "FM-15"]
+        # HH:51 LST rounds to HH+1 LST, which is HH+2 in June (EDT)
+        np.testing.assert_allclose(hourly["values"][:, 2::6, 0].ravel(), (observed["HourlyDryBulbTemperature"].to_numpy() - 32) * 5 / 9, rtol=1e-6)
+        self.assertTrue(np.isnan(hourly["values"][:, 1, :]).all())
+        self.assertFalse(np.isnan(hourly["values"][:, 8, 1]).any())
+
+        # standard time (January): HH:51 LST is HH+1 local clock time
+        winter = os.path.join(tempfile.mkdtemp(), "lcd.csv")
+        pd.DataFrame({"DATE": ["2019-01-10T07:51:00", "2019-07-10T07:51:00"], "REPORT_TYPE": "FM-15", "HourlyDryBulbTemperature": ["50", "80"],
+                      "HourlyWetBulbTemperature": "", "HourlyRelativeHumidity": "50", "HourlyDewPointTemperature": ""}).to_csv(winter, index=False)
+        values = hourly_heat_stress(winter, timezone="America/Chicago")["values"][:, :, 0]
+        self.assertEqual([tuple(cell) for cell in np.argwhere(np.isfinite(values))], [(0, 8), (181, 9)])
+
+        output = ingest_hourly_heat_stress(self.path, os.path.join(tempfile.mkdtemp(), "hourly.npz"))
+        lookup = hourly_heat_lookup(["2019-06-02", "2019-06-02", "2018-01-01"], [14, 13, 14], output, "dry_bulb")
+        np.testing.assert_allclose(lookup[0], hourly["values"][1, 14, 0])
+        self.assertTrue(np.isnan(lookup[1:]).all())
+
+    def test_station_interpolation(self):
+        directory = tempfile.mkdtemp()
+        stations = pd.DataFrame({"lon": [-73.97, -73.87, -74.17, -73.78], "lat": [40.78, 40.78, 40.68, 40.64]},
+                                index=pd.Index(["CP", "LGA", "EWR", "JFK"], name="STATION"))
+        targets = pd.DataFrame({"lon": [-73.97, -73.95, -73.80], "lat": [40.78, 40.70, 40.70]}, index=pd.Index([43, 61, 130], name="LocationID"))
+
+        rng = np.random.default_rng(1)
+        paths = []
+        for station in stations.index:
+            daily = pd.DataFrame({"STATION": station, "DATE": pd.date_range("2019-07-01", periods=5).strftime("%Y-%m-%d"),
+                                  "TMAX": rng.integers(75, 95, 5), "PRCP": rng.uniform(0, 1, 5).round(2)})
+            if station == "JFK":
+                daily.loc[2, "TMAX"] = np.nan
+            if station == "CP":
+                daily.loc[3, "TMAX"] = np.nan
+            paths.append(os.path.join(directory, f"{station}.csv"))
+            daily.to_csv(paths[-1], index=False)
+
+        station_data = station_daily_table(paths, {"TMAX": "tmax_obs", "PRCP": "pr_obs"})
+        table = interpolate_daily_weather(station_data, stations, targets, k=4, power=2)
+
+        # brute-force inverse distance weights over the reporting stations
+        lon, lat = np.radians(stations["lon"].to_numpy()), np.radians(stations["lat"].to_numpy())
+        values = station_data.pivot(index="date_pickup", columns="STATION", values="tmax_obs")[stations.index].to_numpy()
+        for zone, (tlon, tlat) in targets.iterrows():
+            tlon, tlat = np.radians(tlon), np.radians(tlat)
+            hav = np.sin((lat - tlat) / 2) ** 2 + np.cos(lat) * np.cos(tlat) * np.sin((lon - tlon) / 2) ** 2
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(hav))
+            # zone 43 lies on CP: CP's value, the other stations on the day CP is missing
+            with np.errstate(divide="ignore"):
+                expected = np.array([v[0] if zone == 43 and np.isfinite(v[0]) else
+                                     np.nansum(v[distance > 0] / distance[distance > 0] ** 2) / np.sum(np.isfinite(v[distance > 0]) / distance[distance > 0] ** 2) for v in values])
+            np.testing.assert_allclose(table.loc[table["LocationID"] == zone, "tmax_obs"], expected, rtol=1e-8)
+
+        self.assertFalse(table["tmax_obs"].isna().any())
+        self.assertEqual(interpolation_weights(stations, targets, k=2).getnnz(axis=1).max(), 2)
+
+        data = pd.DataFrame({"date_pickup": ["2019-07-02", "2019-07-02"], "PULocationID": [61, 130], "tmax_obs": [30.0, 30.0], "trip_number": [5, 6]})
+        merged = merge_zone_weather(data, table, "PULocationID")
+        self.assertEqual(list(merged.columns), ["date_pickup", "PULocationID", "trip_number", "tmax_obs", "pr_obs"])
+        self.assertNotEqual(merged["tmax_obs"].iloc[0], merged["tmax_obs"].iloc[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
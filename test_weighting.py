@@ -1,8 +1,14 @@
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Polygon
+from shapely.geometry import Polygon, box
 import unittest
 
+from weight_socioeconomic_data import _compute_weighted_averages as compute_weighted_averages_sparse, zcta_crosswalk, calculate_park_area_in_taxizone, land_cover_area
+
 
 def _compute_weighted_averages(taxi_zones_gdf, demographics_gdf, socioeconomic_variables):
     """
@@ -101,5 +107,60 @@ class TestSocioeconomicCalculations(unittest.TestCase):
                 f"medincome for {row['LocationID']} is not within the expected range"
             )
 
+    def test_sparse_crosswalk_matches_loop(self):
+        rng = np.random.default_rng(0)
+        # ZCTAs: 6 x 6 grid of unit squares, taxi zones: random rectangles (some touching grid lines only)
+        zctas = [box(i, j, i + 1, j + 1) for i in range(6) for j in range(6)]
+        demographics_gdf = gpd.GeoDataFrame({
+            'zcta': [f'ZCTA{i}' for i in range(len(zctas))],
+            'total_pop1': rng.integers(50, 500, len(zctas)),
+            'medincome': rng.uniform(20000, 90000, len(zctas)),
+            'median_age': rng.uniform(25, 50, len(zctas)),
+        }, geometry=zctas, crs="EPSG:4326")
+
+        corners = rng.uniform(0, 5, (25, 2))
+        zones = [box(x, y, x + w, y + h) for (x, y), (w, h) in zip(corners, rng.uniform(0.2, 1.5, (25, 2)))] + [box(1, 1, 2, 2), box(7, 7, 8, 8)]
+        taxi_zones_gdf = gpd.GeoDataFrame({'location_i': list(range(1, len(zones) + 1)), 'zone': [f'Zone {i}' for i in range(len(zones))]},
+                                          geometry=zones, crs="EPSG:4326")
+
+        variables = ['medincome', 'median_age']
+        expected = _compute_weighted_averages(taxi_zones_gdf, demographics_gdf, variables)
+        result = compute_weighted_averages_sparse(taxi_zones_gdf, demographics_gdf, variables)
+
+        for row, expected_row in zip(result, expected):
+            self.assertEqual(row['ZCTA_IDs'], expected_row['ZCTA_IDs'])
+            self.assertEqual(set(row) - {'intersection_shares'}, set(expected_row) - {'intersection_shares'})
+            for var in variables:
+                if var in expected_row:
+                    self.assertAlmostEqual(row[var], expected_row[var], places=6)
+
+        # zone outside all ZCTAs has no covariates
+        self.assertNotIn('medincome', result[-1])
+
+        # cached crosswalk on all ZCTAs, applied to a vintage with missing ZCTAs
+        cache_dir = tempfile.mkdtemp()
+        try:
+            crosswalk = zcta_crosswalk(taxi_zones_gdf, demographics_gdf, cache_dir)
+            cached = zcta_crosswalk(taxi_zones_gdf, demographics_gdf, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            np.testing.assert_array_equal(cached['area_proportion'], crosswalk['area_proportion'])
+
+            vintage = demographics_gdf.drop(index=[3, 14, 20])
+            expected = compute_weighted_averages_sparse(taxi_zones_gdf, vintage, variables)
+            self.assertEqual(compute_weighted_averages_sparse(taxi_zones_gdf, vintage, variables, cached), expected)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_land_cover_area(self):
+        rng = np.random.default_rng(1)
+        parks = gpd.GeoDataFrame({'multipolygon': [box(x, y, x + w, y + h) for (x, y), (w, h) in zip(rng.uniform(0, 9, (300, 2)), rng.uniform(0.05, 0.8, (300, 2)))]},
+                                 geometry='multipolygon', crs="EPSG:4326")
+        zones = gpd.GeoDataFrame({'location_i': range(40)}, geometry=[box(x, y, x + 1, y + 1) for x, y in rng.uniform(0, 9, (40, 2))], crs="EPSG:4326")
+
+        expected = zones.apply(lambda x: calculate_park_area_in_taxizone(x, parks), axis=1).to_numpy()
+        np.testing.assert_allclose(land_cover_area(zones, parks, chunk_size=50, n_workers=2), expected, atol=1e-12)
+        np.testing.assert_allclose(land_cover_area(zones, parks, n_workers=1), expected, atol=1e-12)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,407 @@
+## Weather ingestion: NOAA Local Climatological Data (LCD) for NYC (Central Park), multi-station interpolation
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+from geo_utils import unit_sphere, chord_to_km
+
+
+# LCD exports of the weather stations (hourly records with daily summaries): NOAA order 3576162
+# for Central Park, the file read by Data/NYC_weather/add_humidity.py
+LCD_FILES = {
+    "NYC": "Data/NYC_weather/3576162.csv",
+}
+
+# daily summary columns kept from the LCD export
+LCD_DAILY_COLUMNS = ["DATE", "REPORT_TYPE", "DailyAverageDewPointTemperature", "DailyAverageDryBulbTemperature",
+                     "DailyAverageRelativeHumidity", "DailyAverageWetBulbTemperature", "DailyAverageWindSpeed",
+                     "DailyMaximumDryBulbTemperature", "DailyPrecipitation", "DailySnowDepth", "DailySnowfall",
+                     "Sunrise", "Sunset"]
+
+# hourly observation columns (°F and %)
+LCD_HOURLY_COLUMNS = ["DATE", "REPORT_TYPE", "HourlyDryBulbTemperature", "HourlyWetBulbTemperature",
+                      "HourlyRelativeHumidity", "HourlyDewPointTemperature"]
+
+# hourly heat-stress features of the (day, hour) array (°C and %)
+HEAT_FEATURES = ["dry_bulb", "wet_bulb", "heat_index", "relative_humidity"]
+
+HOURLY_HEAT_STRESS = "Data/NYC_weather/hourly_heat_stress.npz"
+
+# daily station variables (GHCN daily summaries) and their names in the regression data
+STATION_VARIABLES = {"TMAX": "tmax_obs", "PRCP": "pr_obs", "SNWD": "Snowdepth"}
+
+# temperature columns of the daily summaries (°F)
+LCD_TEMPERATURE_COLUMNS = ["DailyAverageDewPointTemperature", "DailyAverageDryBulbTemperature",
+                           "DailyAverageWetBulbTemperature", "DailyMaximumDryBulbTemperature"]
+
+
+def fahrenheit_to_celsius(f):
+    """
+    Converts °F to °C for scalars, arrays and columns alike (shared by the NYC and Chicago preprocessing).
+    """
+    return (f - 32) * 5 / 9
+
+
+def lcd_numeric(values):
+    """
+    Parses LCD value strings: 'T' (trace) is 0, quality suffixes ('s' suspect, 'V' variable, '*')
+    are dropped and blanks or missing markers become NaN.
+    """
+    values = pd.Series(values, dtype="string").str.strip()
+    values = values.mask(values == "T", "0").str.rstrip("sV*")
+
+    return pd.to_numeric(values, errors="coerce")
+
+
+def hhmm_to_minutes(values):
+    """
+    Minutes after midnight of HHMM integers (e.g. 1952 -> 19 * 60 + 52).
+    """
+    values = pd.to_numeric(pd.Series(values), errors="coerce")
+
+    return values // 100 * 60 + values % 100
+
+
+def stream_lcd(path, columns, report_types, chunksize = 100000):
+    """
+    Reads an LCD export in chunks with only the needed columns (as strings) and keeps the rows of the
+    given report types while streaming (REPORT_TYPE is padded with blanks in the export).
+
+    path (str): LCD csv file
+    columns (list): columns to read (incl. DATE and REPORT_TYPE)
+    report_types (list): report types to keep, e.g. ["SOD"] for daily summaries or ["FM-15"] for hourly METAR
+    chunksize (int): rows per chunk
+
+    Returns:
+    DataFrame: the kept rows
+    """
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=columns, dtype=str, chunksize=chunksize):
+        chunks.append(chunk[chunk["REPORT_TYPE"].str.strip().isin(report_types)])
+
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+def lcd_daily_summary(path, celsius = False, chunksize = 100000):
+    """
+    Daily summaries (report type SOD) of an LCD export with parsed values and daylight time.
+
+    path (str): LCD csv file (e.g. Central Park)
+    celsius (bool): convert the daily temperature columns from °F to °C
+    chunksize (int): rows per chunk
+
+    Returns:
+    DataFrame: one row per day with DATE, the daily summary columns, Sunrise, Sunset (HH:MM:SS)
+               and daylight_time in minutes
+    """
+    daily = stream_lcd(path, LCD_DAILY_COLUMNS, ["SOD"], chunksize)
+
+    # 1. Dates parsed once with a fixed format
+    daily["DATE"] = pd.to_datetime(daily["DATE"].str[:10], format="%Y-%m-%d")
+
+    # 2. Values ('T' trace -> 0) and optional unit conversion
+    for column in LCD_DAILY_COLUMNS[2:-2]:
+        daily[column] = lcd_numeric(daily[column]).to_numpy(dtype=float)
+    if celsius:
+        daily[LCD_TEMPERATURE_COLUMNS] = fahrenheit_to_celsius(daily[LCD_TEMPERATURE_COLUMNS])
+
+    # 3. Sunrise and sunset from HHMM integers, daylight time in minutes
+    sunrise, sunset = hhmm_to_minutes(daily["Sunrise"]), hhmm_to_minutes(daily["Sunset"])
+    daily["Sunrise"], daily["Sunset"] = _clock_time(sunrise), _clock_time(sunset)
+    daily["daylight_time"] = (sunset - sunrise).astype("Int64")
+
+    return daily.drop(columns=["REPORT_TYPE"])
+
+
+def _clock_time(minutes):
+    """
+    Helper function formatting minutes after midnight as HH:MM:SS.
+    """
+    hours, minutes = minutes // 60, minutes % 60
+    clock = hours.astype("Int64").astype(str).str.zfill(2) + ":" + minutes.astype("Int64").astype(str).str.zfill(2) + ":00"
+
+    return clock.where(hours.notna())
+
+
+def add_lcd_daily(daily_csv, lcd_csv, output, celsius = False):
+    """
+    Adds the LCD daily summaries (humidity, wet bulb, daylight time, ...) to a daily station file.
+
+    daily_csv (str): daily weather file (GHCN daily summaries with DATE)
+    lcd_csv (str): LCD export of the same station
+    output (str): csv file of the merged data
+    celsius (bool): convert the LCD temperature columns to °C
+
+    Returns:
+    DataFrame: daily weather with the LCD summaries
+    """
+    climate = pd.read_csv(daily_csv)
+    climate["DATE"] = pd.to_datetime(climate["DATE"])
+
+    climate_merged = climate.merge(lcd_daily_summary(lcd_csv, celsius), on="DATE", how="left")
+    climate_merged.to_csv(output, index=False)
+
+    return climate_merged
+
+
+def heat_index(temperature, relative_humidity):
+    """
+    NWS heat index (Rothfusz regression with the low and high humidity adjustments; Steadman's
+    simple formula below 80°F).
+
+    temperature (array): air temperature in °C
+    relative_humidity (array): relative humidity in %
+
+    Returns:
+    ndarray: heat index in °C
+    """
+    t = np.asarray(temperature, dtype=float) * 9 / 5 + 32
+    rh = np.asarray(relative_humidity, dtype=float)
+
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    rothfusz = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 0.00683783 * t ** 2
+                - 0.05481717 * rh ** 2 + 0.00122874 * t ** 2 * rh + 0.00085282 * t * rh ** 2 - 0.00000199 * t ** 2 * rh ** 2)
+
+    with np.errstate(invalid="ignore"):
+        rothfusz -= np.where((rh < 13) & (t >= 80) & (t <= 112), (13 - rh) / 4 * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17), 0.0)
+        rothfusz += np.where((rh > 85) & (t >= 80) & (t <= 87), (rh - 85) / 10 * (87 - t) / 5, 0.0)
+        index = np.where((simple + t) / 2 >= 80, rothfusz, simple)
+
+    return fahrenheit_to_celsius(index)
+
+
+def stull_wet_bulb(temperature, relative_humidity):
+    """
+    Wet-bulb temperature from air temperature (°C) and relative humidity (%) after Stull (2011),
+    used where the station reports no wet-bulb reading.
+    """
+    t = np.asarray(temperature, dtype=float)
+    rh = np.asarray(relative_humidity, dtype=float)
+
+    return (t * np.arctan(0.151977 * np.sqrt(rh + 8.313659)) + np.arctan(t + rh) - np.arctan(rh - 1.676331)
+            + 0.00391838 * rh ** 1.5 * np.arctan(0.023101 * rh) - 4.686035)
+
+
+def hourly_heat_stress(path, report_types = ("FM-15",), chunksize = 100000, timezone = "America/New_York"):
+    """
+    Hourly dry-bulb, wet-bulb, heat-index and humidity features of an LCD export as a dense (day, hour) array.
+
+    LCD timestamps are Local Standard Time all year. Observations are rounded to the nearest
+    hour (the routine METAR at HH:51 is the report for hour HH+1) and converted to the clock
+    time of the timezone, daylight saving time included, so that days and hours line up with
+    the trip timestamps. Observations are averaged within the hour; hours without a (valid)
+    observation are NaN.
+
+    path (str): LCD csv file
+    report_types (tuple): hourly report types to keep (FM-15: routine METAR)
+    chunksize (int): rows per chunk
+    timezone (str): timezone of the station, e.g. "America/Chicago" for O'Hare
+
+    Returns:
+    dict: dates (datetime64[D]), features (names) and values (days x 24 x features, float32) in local clock time
+    """
+    hourly = stream_lcd(path, LCD_HOURLY_COLUMNS, list(report_types), chunksize)
+    standard_time = pd.to_datetime(hourly["DATE"], format="%Y-%m-%dT%H:%M:%S").dt.round("h")
+
+    # 0. Local Standard Time (January offset of the timezone) -> local clock time
+    standard_offset = pd.Timestamp("2000-01-15", tz=timezone).utcoffset()
+    timestamps = (standard_time - standard_offset).dt.tz_localize("UTC").dt.tz_convert(timezone).dt.tz_localize(None)
+
+    # 1. Values in °C and derived features
+    dry_bulb = fahrenheit_to_celsius(lcd_numeric(hourly["HourlyDryBulbTemperature"]).to_numpy(dtype=float))
+    wet_bulb = fahrenheit_to_celsius(lcd_numeric(hourly["HourlyWetBulbTemperature"]).to_numpy(dtype=float))
+    humidity = lcd_numeric(hourly["HourlyRelativeHumidity"]).to_numpy(dtype=float)
+    wet_bulb = np.where(np.isnan(wet_bulb), stull_wet_bulb(dry_bulb, humidity), wet_bulb)
+    features = np.column_stack([dry_bulb, wet_bulb, heat_index(dry_bulb, humidity), humidity])
+
+    # 2. Mean per (day, hour) cell of a dense calendar
+    days = timestamps.to_numpy(dtype="datetime64[D]")
+    dates = np.arange(days.min(), days.max() + 1)
+    cell = (days - dates[0]).astype(np.int64) * 24 + timestamps.dt.hour.to_numpy()
+
+    values = np.full((len(dates) * 24, len(HEAT_FEATURES)), np.nan)
+    for j in range(len(HEAT_FEATURES)):
+        valid = np.isfinite(features[:, j])
+        sums = np.bincount(cell[valid], weights=features[valid, j], minlength=len(dates) * 24)
+        counts = np.bincount(cell[valid], minlength=len(dates) * 24)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[:, j] = np.where(counts > 0, sums / counts, np.nan)
+
+    return {"dates": dates, "features": np.array(HEAT_FEATURES), "values": values.reshape(len(dates), 24, -1).astype(np.float32)}
+
+
+def ingest_hourly_heat_stress(lcd_csv, output = HOURLY_HEAT_STRESS, timezone = "America/New_York"):
+    """
+    Writes the hourly heat-stress (day, hour) array of an LCD export.
+
+    Returns:
+    str: path of the written .npz file
+    """
+    np.savez_compressed(output, **hourly_heat_stress(lcd_csv, timezone=timezone))
+
+    return output
+
+
+def hourly_heat_lookup(date_pickup, hour, path = HOURLY_HEAT_STRESS, feature = "heat_index"):
+    """
+    Heat-stress feature for rows of an hourly trip table (day and hour of pickup).
+
+    date_pickup (array): dates of the rows
+    hour (array): local clock hour of the day (0-23)
+    path (str): .npz file written by ingest_hourly_heat_stress
+    feature (str): one of HEAT_FEATURES
+
+    Returns:
+    numpy.ndarray: feature value per row (NaN for days not covered)
+    """
+    with np.load(path) as stored:
+        dates, features, values = stored["dates"], list(stored["features"]), stored["values"]
+
+    day = pd.Index(dates).get_indexer(pd.to_datetime(np.asarray(date_pickup)).normalize())
+    hour = np.asarray(hour, dtype=np.int64)
+
+    covered = (day >= 0) & (hour >= 0) & (hour < 24)
+    result = np.full(len(day), np.nan)
+    result[covered] = values[day[covered], hour[covered], features.index(feature)]
+
+    return result
+
+
+def station_daily_table(paths, variables = STATION_VARIABLES):
+    """
+    Daily summaries of several weather stations (GHCN daily csv files) in one long table.
+
+    paths (list): station csv files with STATION, DATE and the variables
+    variables (dict): station variable -> name in the regression data (TMAX is converted to °C)
+
+    Returns:
+    DataFrame: STATION, date_pickup (YYYY-MM-DD) and the renamed variables
+    """
+    frames = []
+    for path in paths:
+        station = pd.read_csv(path, usecols=lambda column: column in ["STATION", "DATE"] + list(variables), dtype={"STATION": str})
+        frames.append(station.reindex(columns=["STATION", "DATE"] + list(variables)))
+
+    stations = pd.concat(frames, ignore_index=True)
+    if "TMAX" in variables:
+        stations["TMAX"] = fahrenheit_to_celsius(stations["TMAX"])
+    stations["DATE"] = pd.to_datetime(stations["DATE"].str[:10], format="%Y-%m-%d").dt.strftime("%Y-%m-%d")
+
+    return stations.rename(columns={"DATE": "date_pickup", **variables})
+
+
+def interpolation_weights(stations, targets, k = 4, method = "idw", power = 2.0, range_km = 25.0):
+    """
+    Sparse target x station interpolation weights from the k nearest stations of each target
+    (KD-tree on unit-sphere coordinates, great-circle distances).
+
+    With inverse-distance weights a target on a station gets an infinite weight (1 / 0) on it and
+    keeps the weights of its other neighbours: interpolate_daily_weather takes the station value
+    on days the station reports and falls back to the other neighbours on days it does not.
+
+    stations (DataFrame): lon and lat of the stations, indexed by station id
+    targets (DataFrame): lon and lat of the targets (e.g. zone centroids), indexed by zone id
+    k (int): number of nearest stations
+    method (str): "idw" (1 / d^power) or "gaussian" (kriging-lite: exp(-(d / range_km)^2))
+    power (float): power of the inverse distance
+    range_km (float): range of the gaussian kernel in km
+
+    Returns:
+    scipy.sparse.csr_matrix: targets x stations weights (not normalized, see interpolate_daily_weather)
+    """
+    k = min(k, len(stations))
+    tree = cKDTree(unit_sphere(stations["lon"].to_numpy(), stations["lat"].to_numpy()))
+    chords, neighbours = tree.query(unit_sphere(targets["lon"].to_numpy(), targets["lat"].to_numpy()), k=k)
+    chords, neighbours = chords.reshape(len(targets), k), neighbours.reshape(len(targets), k)
+    distance = chord_to_km(chords)
+
+    if method == "idw":
+        with np.errstate(divide="ignore"):
+            weights = np.where(distance < 1e-9, np.inf, 1 / distance ** power)
+    elif method == "gaussian":
+        weights = np.exp(-(distance / range_km) ** 2)
+    else:
+        raise ValueError("method must be 'idw' or 'gaussian'")
+
+    rows = np.repeat(np.arange(len(targets)), k)
+    return sparse.csr_matrix((weights.ravel(), (rows, neighbours.ravel())), shape=(len(targets), len(stations)))
+
+
+def interpolate_daily_weather(station_data, stations, targets, k = 4, method = "idw", power = 2.0, range_km = 25.0):
+    """
+    Interpolates daily station variables to targets (taxi zone or community area centroids).
+
+    The weights are computed once; each variable is one matrix product over all days, with the weights
+    renormalized over the stations reporting on a day. Targets on a station take its value on the days
+    it reports.
+
+    station_data (DataFrame): station_daily_table output
+    stations (DataFrame): lon and lat indexed by station id
+    targets (DataFrame): lon and lat indexed by LocationID (e.g. spatial_hac.zone_centroids())
+    k, method, power, range_km: see interpolation_weights
+
+    Returns:
+    DataFrame: zone-day table with date_pickup, LocationID and the interpolated variables
+    """
+    weights = interpolation_weights(stations, targets, k, method, power, range_km)
+
+    # stations at the target (infinite weight) and the finite weights of the other neighbours
+    exact = weights.copy()
+    exact.data = np.isinf(exact.data).astype(float)
+    weights.data[np.isinf(weights.data)] = 0.0
+    variables = [column for column in station_data.columns if column not in ["STATION", "date_pickup"]]
+    dates = np.sort(station_data["date_pickup"].unique())
+
+    zone_days = {}
+    for variable in variables:
+        # 1. days x stations matrix of the variable (NaN where a station does not report)
+        values = station_data.pivot_table(index="date_pickup", columns="STATION", values=variable, aggfunc="mean")
+        values = values.reindex(index=dates, columns=stations.index).to_numpy(dtype=float)
+        valid = np.isfinite(values)
+
+        # 2. targets x days weighted means over the reporting stations (station at the target if it reports)
+        reported, observed = np.where(valid, values, 0.0).T, valid.T.astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            at_station = exact @ observed
+            zone_days[variable] = np.where(at_station > 0, (exact @ reported) / at_station, (weights @ reported) / (weights @ observed))
+
+    table = pd.DataFrame({
+        "date_pickup": np.tile(dates, len(targets)),
+        "LocationID": np.repeat(targets.index.to_numpy(), len(dates)),
+    })
+    for variable in variables:
+        table[variable] = zone_days[variable].ravel()
+
+    return table
+
+
+def merge_zone_weather(data, zone_weather, location_column):
+    """
+    Replaces city-wide weather columns by the zone-day values of an interpolated weather table.
+
+    data (DataFrame): regression data with date_pickup and the location column
+    zone_weather (str or DataFrame): interpolate_daily_weather output (or its csv)
+    location_column (str): location column of data (e.g. PULocationID)
+
+    Returns:
+    DataFrame: data with zone-day weather columns
+    """
+    if isinstance(zone_weather, str):
+        zone_weather = pd.read_csv(zone_weather)
+    zone_weather = zone_weather.rename(columns={"LocationID": location_column})
+    variables = [column for column in zone_weather.columns if column not in ["date_pickup", location_column]]
+
+    data = data.drop(columns=[column for column in variables if column in data.columns])
+    zone_weather = zone_weather.astype({location_column: data[location_column].dtype})
+
+    return pd.merge(data, zone_weather, on=["date_pickup", location_column], how="left")
+
+
+#### RUN
+
+if __name__ == "__main__":
+    # Central Park: humidity and daylight time for the NYC regressions
+    add_lcd_daily("Data/NYC_weather/climate_data_NYC_2014_2019.csv", LCD_FILES["NYC"], "Data/NYC_weather/climate_NYC_with_humidity.csv")
+    # Central Park: hourly heat-stress features for hour-level exposure models
+    ingest_hourly_heat_stress(LCD_FILES["NYC"])
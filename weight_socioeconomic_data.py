@@ -1,13 +1,21 @@
+import os
+import hashlib
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from shapely.wkt import loads
+import shapely
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+from geometry_store import read_geometries, read_geometry_table
+
+# cached taxi zone x ZCTA crosswalks (zcta_crosswalk)
+CROSSWALK_DIR = "Data/ACS_data/crosswalk"
 
 #### FUNCTIONS
 
 
 
-def calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv):
+def calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv, cache_dir = CROSSWALK_DIR):
     """
     Process demographic and taxi zone data to create a weighted socioeconomic dataset.
 
@@ -18,33 +26,23 @@ def calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv):
     Parameters:
     demographics_csv (str): File path to the CSV containing demographic data by ZCTA.
     taxi_zones_csv (str): File path to the CSV containing taxi zone geometries.
+    cache_dir (str): directory of the cached taxi zone x ZCTA crosswalks (zcta_crosswalk).
 
     Returns:
     pandas.DataFrame: A DataFrame containing the weighted socioeconomic data by taxi zone.
     """
 
-    demographics_df = pd.read_csv(demographics_csv)
-
-    # from demographics dataframe drop all rows where "medincome" is NA
-    demographics_df = demographics_df.dropna(subset=['medincome'])
+    # geometries from the binary geometry store (WKT is only parsed when the CSV changes)
+    demographics_gdf = read_geometries(demographics_csv)
     # with new demographics: downloaded in R : rename GEOID into zcta
-    demographics_df = demographics_df.rename(columns={"GEOID": "zcta"})
+    demographics_gdf = demographics_gdf.rename(columns={"GEOID": "zcta"})
+    # geometries of all ZCTAs of the pull (the crosswalk does not depend on missing covariates)
+    zcta_gdf = demographics_gdf[['zcta', 'geometry']]
 
-    taxi_zones_df = pd.read_csv(taxi_zones_csv)
-
-    # convert the 'geometry' columns  from strings to Shapely geometries
-    demographics_gdf = gpd.GeoDataFrame(
-        demographics_df, 
-        geometry=gpd.GeoSeries.from_wkt(demographics_df['geometry'])
-    )
-    taxi_zones_gdf = gpd.GeoDataFrame(
-        taxi_zones_df, 
-        geometry=gpd.GeoSeries.from_wkt(taxi_zones_df['geometry'])
-    )
+    # from demographics dataframe drop all rows where "medincome" is NA
+    demographics_gdf = demographics_gdf.dropna(subset=['medincome'])
 
-    # Set coordinate reference system - somehow necessary
-    demographics_gdf.set_crs(epsg=4326, inplace=True)
-    taxi_zones_gdf.set_crs(epsg=4326, inplace=True)
+    taxi_zones_gdf = read_geometries(taxi_zones_csv)
 
 
 
@@ -66,11 +64,15 @@ def calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv):
         if pd.api.types.is_numeric_dtype(demographics_gdf[var])
     ]
 
+    # Crosswalk on all ZCTA geometries of the pull, reused while the geometries are unchanged
+    crosswalk = zcta_crosswalk(taxi_zones_gdf, zcta_gdf[zcta_gdf.geometry.notna()], cache_dir)
+
     # Compute weighted averages for each taxi zone
     taxi_zone_data = _compute_weighted_averages(
         taxi_zones_gdf, 
         demographics_gdf, 
-        socioeconomic_variables
+        socioeconomic_variables,
+        crosswalk
     )
 
     taxi_zones_socioeconomics = pd.DataFrame(taxi_zone_data)
@@ -122,54 +124,205 @@ def calculate_park_area_in_taxizone(taxizone, parks):
 
 
 
-def _compute_weighted_averages(taxi_zones_gdf, demographics_gdf, socioeconomic_variables):
+def _intersection_areas(geoms_a, geoms_b):
+    """
+    Helper function returning the areas of the pairwise intersections of two aligned geometry arrays.
+    """
+    return shapely.area(shapely.intersection(geoms_a, geoms_b))
+
+
+def land_cover_area(taxi_zones_gdf, layer_gdf, chunk_size = 500, n_workers = None):
+    """
+    Area of a land-cover layer (parks, beaches, ...) inside each taxi zone.
+
+    Each zone is paired only with the features it touches (STRtree query); the intersections
+    of these pairs are computed in chunks across a process pool.
+
+    Parameters:
+    taxi_zones_gdf (geopandas.GeoDataFrame): GeoDataFrame containing taxi zone geometries.
+    layer_gdf (geopandas.GeoDataFrame): GeoDataFrame of the land-cover features (active geometry column).
+    chunk_size (int): number of zone-feature pairs per task.
+    n_workers (int): number of worker processes, 1 to compute in the current process.
+
+    Returns:
+    numpy.ndarray: sum of the intersection areas per taxi zone
+    """
+    zone_geoms = np.asarray(taxi_zones_gdf.geometry.array)
+    layer_geoms = np.asarray(layer_gdf.geometry.array)
+
+    zone_idx, feature_idx = shapely.STRtree(layer_geoms).query(zone_geoms, predicate='intersects')
+    chunks = [slice(start, start + chunk_size) for start in range(0, len(zone_idx), chunk_size)]
+    zone_chunks = [zone_geoms[zone_idx[chunk]] for chunk in chunks]
+    feature_chunks = [layer_geoms[feature_idx[chunk]] for chunk in chunks]
+
+    if n_workers == 1 or len(chunks) <= 1:
+        areas = list(map(_intersection_areas, zone_chunks, feature_chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            areas = list(executor.map(_intersection_areas, zone_chunks, feature_chunks))
+
+    areas = np.concatenate(areas) if areas else np.empty(0)
+
+    return np.bincount(zone_idx, weights=areas, minlength=len(zone_geoms))
+
+
+def add_land_cover(gdf_taxizones, layers, n_workers = None):
+    """
+    Adds area and coverage (in % of shape_area) of several land-cover layers to the taxi zones.
+
+    Parameters:
+    gdf_taxizones (geopandas.GeoDataFrame): taxi zones with geometry and shape_area.
+    layers (dict): layer name -> GeoDataFrame, e.g. {'park': gdf_parks, 'beach': gdf_beaches}
+    n_workers (int): number of worker processes
+
+    Returns:
+    geopandas.GeoDataFrame: taxi zones with {name}_area and {name}_coverage columns
+    """
+    for name, layer in layers.items():
+        gdf_taxizones[f'{name}_area'] = land_cover_area(gdf_taxizones, layer, n_workers = n_workers)
+        gdf_taxizones[f'{name}_coverage'] = gdf_taxizones[f'{name}_area'] / gdf_taxizones['shape_area'] * 100
+
+    return gdf_taxizones
+
+
+def _crosswalk_pairs(taxi_zones_gdf, demographics_gdf, batch_size = 10000):
+    """
+    Helper function to find all intersecting taxi zone / ZCTA pairs and the share of the
+    taxi zone area covered by each ZCTA.
+
+    Candidate pairs come from an STRtree query on the ZCTA geometries; intersection areas
+    are computed with vectorized shapely operations in batches.
+
+    Parameters:
+    taxi_zones_gdf (geopandas.GeoDataFrame): GeoDataFrame containing taxi zone geometries.
+    demographics_gdf (geopandas.GeoDataFrame): GeoDataFrame containing demographic data by ZCTA.
+    batch_size (int): number of pairs per vectorized intersection batch.
+
+    Returns:
+    tuple: taxi zone positions, ZCTA positions and area proportions of all intersecting pairs,
+           ordered by taxi zone and ZCTA
+    """
+    zone_geoms = np.asarray(taxi_zones_gdf.geometry.array)
+    zcta_geoms = np.asarray(demographics_gdf.geometry.array)
+
+    tree = shapely.STRtree(zcta_geoms)
+    zone_idx, zcta_idx = tree.query(zone_geoms, predicate='intersects')
+    order = np.lexsort((zcta_idx, zone_idx))
+    zone_idx, zcta_idx = zone_idx[order], zcta_idx[order]
+
+    intersection_area = np.empty(len(zone_idx))
+    for start in range(0, len(zone_idx), batch_size):
+        batch = slice(start, start + batch_size)
+        intersection_area[batch] = _intersection_areas(zone_geoms[zone_idx[batch]], zcta_geoms[zcta_idx[batch]])
+
+    area_proportion = intersection_area / shapely.area(zone_geoms)[zone_idx]
+
+    return zone_idx, zcta_idx, area_proportion
+
+
+def geometry_fingerprint(ids, geometries):
+    """
+    Fingerprint of a geometry table from its ids and the WKB of its geometries.
+    """
+    digest = hashlib.sha256('|'.join(map(str, ids)).encode())
+    for wkb in shapely.to_wkb(np.asarray(geometries)):
+        digest.update(wkb)
+
+    return digest.hexdigest()
+
+
+def zcta_crosswalk(taxi_zones_gdf, zcta_gdf, cache_dir = CROSSWALK_DIR):
+    """
+    Area crosswalk between taxi zones and ZCTAs, saved to cache_dir as sparse pairs (npz)
+    keyed by the fingerprints of both geometry tables. New ACS vintages or variables on the
+    same geometries load the crosswalk instead of recomputing the intersections.
+
+    Parameters:
+    taxi_zones_gdf (geopandas.GeoDataFrame): GeoDataFrame containing taxi zone geometries.
+    zcta_gdf (geopandas.GeoDataFrame): GeoDataFrame with 'zcta' ids and ZCTA geometries (all ZCTAs of the pull).
+    cache_dir (str): directory of the cached crosswalks, None to disable caching.
+
+    Returns:
+    dict: taxi zone positions (zone_idx), ZCTA ids (zcta) and area proportions of all intersecting pairs
+    """
+    zcta_gdf = zcta_gdf.drop_duplicates(subset=['zcta'])
+    key = (geometry_fingerprint(taxi_zones_gdf['location_i'], taxi_zones_gdf.geometry.array)[:16] + '_'
+           + geometry_fingerprint(zcta_gdf['zcta'], zcta_gdf.geometry.array)[:16])
+    path = None if cache_dir is None else os.path.join(cache_dir, f'crosswalk_{key}.npz')
+
+    if path is not None and os.path.exists(path):
+        with np.load(path) as cached:
+            return {name: cached[name] for name in ['zone_idx', 'zcta', 'area_proportion']}
+
+    zone_idx, zcta_idx, area_proportion = _crosswalk_pairs(taxi_zones_gdf, zcta_gdf)
+    crosswalk = {'zone_idx': zone_idx, 'zcta': zcta_gdf['zcta'].astype(str).to_numpy()[zcta_idx].astype(str), 'area_proportion': area_proportion}
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(path, **crosswalk)
+
+    return crosswalk
+
+
+def _crosswalk_to_demographics(crosswalk, demographics_gdf):
+    """
+    Helper function to restrict a crosswalk to the ZCTAs (rows) of a demographics table.
+
+    Returns:
+    tuple: taxi zone positions, demographics row positions and area proportions, ordered by taxi zone and row
+    """
+    zcta_idx = pd.Index(demographics_gdf['zcta'].astype(str)).get_indexer(crosswalk['zcta'])
+    keep = zcta_idx >= 0
+    zone_idx, zcta_idx, area_proportion = crosswalk['zone_idx'][keep], zcta_idx[keep], crosswalk['area_proportion'][keep]
+    order = np.lexsort((zcta_idx, zone_idx))
+
+    return zone_idx[order], zcta_idx[order], area_proportion[order]
+
+
+def _compute_weighted_averages(taxi_zones_gdf, demographics_gdf, socioeconomic_variables, crosswalk = None):
     """
     Helper function to compute weighted averages for socioeconomic variables.
 
+    The intersecting pairs form a sparse taxi zone x ZCTA matrix of population-weighted area
+    proportions, so all variables are averaged with one sparse matrix product.
+
     Parameters:
     taxi_zones_gdf (geopandas.GeoDataFrame): GeoDataFrame containing taxi zone geometries.
     demographics_gdf (geopandas.GeoDataFrame): GeoDataFrame containing demographic data by ZCTA.
     socioeconomic_variables (list): List of socioeconomic variable names to compute weighted averages for.
+    crosswalk (dict): precomputed crosswalk (zcta_crosswalk) - no geometry operations are done if given.
 
     Returns:
     taxi_zone_data: List of dictionaries containing weighted socioeconomic data for each taxi zone and zone
     """
-    
-    
+    if crosswalk is None:
+        zone_idx, zcta_idx, area_proportion = _crosswalk_pairs(taxi_zones_gdf, demographics_gdf)
+    else:
+        zone_idx, zcta_idx, area_proportion = _crosswalk_to_demographics(crosswalk, demographics_gdf)
+
+    # population-weighted area proportions
+    population_weight = demographics_gdf['total_pop1'].to_numpy(dtype=float)
+    weights = sparse.csr_matrix((area_proportion * population_weight[zcta_idx], (zone_idx, zcta_idx)),
+                                shape=(len(taxi_zones_gdf), len(demographics_gdf)))
+
+    # Calculate real weighted averages
+    weighted_sum = weights @ demographics_gdf[socioeconomic_variables].to_numpy(dtype=float)
+    total_weight = np.asarray(weights.sum(axis=1)).ravel()
+    weighted_averages = np.divide(weighted_sum, total_weight[:, None], out=np.zeros_like(weighted_sum), where=total_weight[:, None] != 0)
+
+    n_pairs = np.bincount(zone_idx, minlength=len(taxi_zones_gdf))
+    zcta_ids = np.split(demographics_gdf['zcta'].to_numpy()[zcta_idx], np.cumsum(n_pairs)[:-1])
+    intersection_shares = np.split(area_proportion, np.cumsum(n_pairs)[:-1])
+
     taxi_zone_data = []
-    # Loop through each taxi zone
-    for taxi_zone in taxi_zones_gdf.itertuples():
-        taxi_zone_geom = taxi_zone.geometry
-        taxi_zone_area = taxi_zone_geom.area
+    for i, taxi_zone in enumerate(taxi_zones_gdf[['location_i', 'zone']].itertuples(index=False)):
         taxi_zone_socioeconomic_data = {'LocationID': taxi_zone.location_i, 'Zone': taxi_zone.zone}
-        intersecting_zctas = []
-        zcta_ids = []
-        intersection_shares = []
-
-        # Loop through each ZCTA
-        for zcta in demographics_gdf.itertuples():
-            zcta_geom = zcta.geometry
-
-            if taxi_zone_geom.intersects(zcta_geom):
-                intersection_area = taxi_zone_geom.intersection(zcta_geom).area
-                area_proportion = intersection_area / taxi_zone_area
-                population_weight = zcta.total_pop1
-                weighted_proportion = area_proportion * population_weight
-                intersecting_zctas.append((zcta, weighted_proportion))
-                zcta_ids.append(zcta.zcta)
-                # intersection_shares.append((zcta.zcta, area_proportion)) 
-                intersection_shares.append((area_proportion)) 
-        # Calculate real weighted averages
-        for var in socioeconomic_variables:
-            
-            if len(intersecting_zctas) > 0:
-                weighted_sum = sum(getattr(zcta, var) * proportion for zcta, proportion in intersecting_zctas)
-                total_weight = sum(proportion for _, proportion in intersecting_zctas)
-                taxi_zone_socioeconomic_data[f'{var}'] = weighted_sum / total_weight if total_weight != 0 else 0
-
-        taxi_zone_socioeconomic_data['ZCTA_IDs'] = ', '.join(map(str, zcta_ids))
-        taxi_zone_socioeconomic_data['intersection_shares'] = ', '.join(map(str, intersection_shares))
-        
+        if n_pairs[i] > 0:
+            taxi_zone_socioeconomic_data.update(zip(socioeconomic_variables, weighted_averages[i].tolist()))
+
+        taxi_zone_socioeconomic_data['ZCTA_IDs'] = ', '.join(map(str, zcta_ids[i].tolist()))
+        taxi_zone_socioeconomic_data['intersection_shares'] = ', '.join(map(str, intersection_shares[i].tolist()))
+
         taxi_zone_data.append(taxi_zone_socioeconomic_data)
 
     return taxi_zone_data
@@ -194,23 +347,11 @@ def add_parks_and_beaches(parks_csv, beaches_csv ,taxi_zones_geometry , taxi_zon
     pandas.DataFrame: A DataFrame containing the weighted socioeconomic data by taxi zone.
     """
     taxi_zones_ACS = pd.read_csv(taxi_zones_ACS)
-    df_taxizones = pd.read_csv(taxi_zones_geometry)
-    df_parks = pd.read_csv(parks_csv)
-    df_beaches = pd.read_csv(beaches_csv)
-
-    # convert string columns to vector geometries
-    df_beaches['multipolygon'] = df_beaches['multipolygon'].apply(loads)
-    df_parks['multipolygon'] = df_parks['multipolygon'].apply(loads)
-    df_taxizones['geometry'] = df_taxizones['geometry'].apply(loads)
 
-    gdf_parks = gpd.GeoDataFrame(df_parks, geometry='multipolygon')
-    gdf_taxizones = gpd.GeoDataFrame(df_taxizones, geometry='geometry')
-    gdf_beaches = gpd.GeoDataFrame(df_beaches, geometry='multipolygon')
-
-    # set coordinate reference system for both such that they coincide
-    gdf_parks.set_crs(epsg=4326, inplace=True)
-    gdf_taxizones.set_crs(epsg=4326, inplace=True)
-    gdf_beaches.set_crs(epsg=4326, inplace=True)
+    # vector geometries from the binary geometry store (EPSG:4326)
+    gdf_parks = read_geometries(parks_csv, geometry_column='multipolygon')
+    gdf_taxizones = read_geometries(taxi_zones_geometry)
+    gdf_beaches = read_geometries(beaches_csv, geometry_column='multipolygon')
 
     #remove rows where gdf_parks["Category"] is not in ["Community Park" , "Flagship Park" , "Nature Area" , "Neighborhood Park"] or SUBCATEGORY is  not in ["Large Park"]
     gdf_parks = gdf_parks[
@@ -219,12 +360,8 @@ def add_parks_and_beaches(parks_csv, beaches_csv ,taxi_zones_geometry , taxi_zon
     ]
 
     
-    # Apply helper function to each row in taxi zones df
-    gdf_taxizones['park_area'] = gdf_taxizones.apply(lambda x: calculate_park_area_in_taxizone(x, gdf_parks), axis=1)
-    gdf_taxizones['park_coverage'] = gdf_taxizones['park_area'] / gdf_taxizones['shape_area'] * 100
-
-    gdf_taxizones['beach_area'] = gdf_taxizones.apply(lambda x: calculate_park_area_in_taxizone(x, gdf_beaches), axis=1)
-    gdf_taxizones['beach_coverage'] = gdf_taxizones['beach_area'] / gdf_taxizones['shape_area'] * 100
+    # Park and beach areas per taxi zone (spatial index + chunked intersections in a process pool)
+    gdf_taxizones = add_land_cover(gdf_taxizones, {'park': gdf_parks, 'beach': gdf_beaches})
 
     park_coverage = pd.DataFrame(gdf_taxizones[['park_coverage','beach_coverage', 'park_area', 'beach_area','location_i']])
 
@@ -250,12 +387,11 @@ def add_community_districts(taxi_zones_csv_raw, community_shp):
     Returns:
     pandas.DataFrame: A DataFrame containing the weighted socioeconomic data by taxi zone.
     """
-    gdf_community = gpd.read_file(community_shp)
-    df_taxizones = pd.read_csv(taxi_zones_csv_raw)
-    df_taxizones['geometry'] = df_taxizones['geometry'].apply(loads)
-    taxi_zones = gpd.GeoDataFrame(df_taxizones, geometry='geometry')
-    taxi_zones.set_crs(epsg=4326, inplace=True)
-    taxi_zones['centroid'] = taxi_zones.geometry.centroid
+    gdf_community = read_geometries(community_shp)
+    taxi_zones = read_geometries(taxi_zones_csv_raw)
+    # precomputed centroids of the geometry store
+    zone_table = read_geometry_table(taxi_zones_csv_raw)
+    taxi_zones['centroid'] = gpd.points_from_xy(zone_table['centroid_x'], zone_table['centroid_y'], crs=taxi_zones.crs)
 
     centroids_gdf = gpd.GeoDataFrame(taxi_zones, geometry='centroid')
 
@@ -294,6 +430,7 @@ beaches_csv = "Data/ACS_data/Beaches_20240105.csv"
 
 #### RUN
 
-add_community_districts(taxi_zones_csv_raw, community_shp)
-calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv)
-add_parks_and_beaches(parks_csv, beaches_csv ,taxi_zones_geometry , taxi_zones_ACS)
\ No newline at end of file
+if __name__ == "__main__":
+    add_community_districts(taxi_zones_csv_raw, community_shp)
+    calculate_weighted_socioeconomic_data(demographics_csv, taxi_zones_csv)
+    add_parks_and_beaches(parks_csv, beaches_csv ,taxi_zones_geometry , taxi_zones_ACS)
\ No newline at end of file